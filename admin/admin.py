@@ -1,18 +1,23 @@
 from flask import Blueprint, request, jsonify, render_template, redirect, url_for
 from flask_login import current_user, login_required
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
 
 from models import EtlLog, User, db
-from tasks import stage_reload_task, dwh_incremental_task
+from tasks import stage_reload_task, stage_reconcile_task, dwh_incremental_task
 from celery import chain, current_app
 from celery.result import AsyncResult
 from auth.base_auth import check_auth, authenticate
-from celeryconfig import PROD_DB_URI, STAGE_DB_URI, DWH_DB_URI, REDIS_DB_URI
+from celeryconfig import REDIS_DB_URI
+from engines import get_engine, pool_stats
+from migrations import advise_indexes
 import redis
 from .forms import UserProfileForm
 
 admin_blueprint = Blueprint('admin', __name__)
 
+redis_client = redis.StrictRedis.from_url(REDIS_DB_URI, socket_timeout=1, socket_connect_timeout=1)
+
 def is_any_task_running():
     inspector = current_app.control.inspect()
     workers = inspector.ping()
@@ -266,15 +271,19 @@ def run_etl_chain():
         stage_reload = request.args.get('stage_reload')
         dwh_incremental = request.args.get('dwh_incremental')
 
+        stage_reconcile = request.args.get('stage_reconcile', 'false')
+
         if stage_reload is None or dwh_incremental is None:
             return jsonify({"error": "Neplatné parametre"}), 200
 
+        stage_task = stage_reconcile_task if stage_reconcile == 'true' else stage_reload_task
+
         if stage_reload == 'true' and dwh_incremental == 'true':
-            result = chain(stage_reload_task.s(), dwh_incremental_task.s()).apply_async()
+            result = chain(stage_task.s(), dwh_incremental_task.s()).apply_async()
             return jsonify({"taskId": result.id, "message": "Spustila sa úplná migrácia údajov"}), 200
         elif stage_reload == 'true':
             # result = stage_reload_task.apply_async()
-            result = stage_reload_task.delay()
+            result = stage_task.delay()
             return jsonify({"task_id": result.id, "message": "Spustila sa migrácia da´t do dočasného úložiska"}), 200
         elif dwh_incremental == 'true':
             # result = dwh_incremental_task.apply_async()
@@ -310,12 +319,12 @@ def task_status():
 @login_required
 def prod_db_status():
     if current_user.is_admin():
-        prod_engine = create_engine(PROD_DB_URI)
-        with prod_engine.connect() as connection:
-            result = connection.execute(text("SELECT 1"))
-            connection.close()
-            if result:
-                return jsonify({"status": "OK"}), 200
+        try:
+            with get_engine("prod", "admin").connect() as connection:
+                if connection.execute(text("SELECT 1")).scalar() == 1:
+                    return jsonify({"status": "OK"}), 200
+        except SQLAlchemyError as e:
+            print(f"Chyba pripojenia k operačnej databáze: {e}")
         return jsonify({"error": "Chyba pripojenia k operačnej databáze"}), 200
     else:
         return jsonify({"error": "Neoprávnený Prístup"}), 403
@@ -324,12 +333,12 @@ def prod_db_status():
 @login_required
 def stage_db_status():
     if current_user.is_admin():
-        stage_engine = create_engine(STAGE_DB_URI)
-        with stage_engine.connect() as connection:
-            result = connection.execute(text("SELECT 1"))
-            connection.close()
-            if result:
-                return jsonify({"status": "OK"}), 200
+        try:
+            with get_engine("stage", "admin").connect() as connection:
+                if connection.execute(text("SELECT 1")).scalar() == 1:
+                    return jsonify({"status": "OK"}), 200
+        except SQLAlchemyError as e:
+            print(f"Chyba pripojenia k dočasnej databáze: {e}")
         return jsonify({"error": "Chyba pripojenia k dočasnej databáze"}), 200
     else:
         return jsonify({"error": "Neoprávnený Prístup"}), 403
@@ -338,12 +347,12 @@ def stage_db_status():
 @login_required
 def dwh_status():
     if current_user.is_admin():
-        dwh_engine = create_engine(DWH_DB_URI)
-        with dwh_engine.connect() as connection:
-            result = connection.execute(text("SELECT 1"))
-            connection.close()
-            if result:
-                return jsonify({"status": "OK"}), 200
+        try:
+            with get_engine("dwh", "admin").connect() as connection:
+                if connection.execute(text("SELECT 1")).scalar() == 1:
+                    return jsonify({"status": "OK"}), 200
+        except SQLAlchemyError as e:
+            print(f"Chyba pripojenia k dátovému skladu: {e}")
         return jsonify({"error": "Chyba pripojenia k dátovému skladu"}), 200
     else:
         return jsonify({"error": "Neoprávnený Prístup"}), 403
@@ -353,11 +362,10 @@ def dwh_status():
 def redis_db_status():
     if current_user.is_admin():
         try:
-            redis_client = redis.StrictRedis.from_url(REDIS_DB_URI)
             if redis_client.ping():
                 return jsonify({"status": "OK"}), 200
             return jsonify({"error": "Chyba pripojenia k Redis"}), 200
-        except redis.ConnectionError:
+        except redis.RedisError:
             return jsonify({"error": "Chyba pripojenia k Redis"}), 200
     else:
         return jsonify({"error": "Neoprávnený Prístup"}), 403
@@ -372,4 +380,26 @@ def celery_worker_status():
         else:
             return jsonify({"error": "Celery worker nie je spustený"}), 200
     else:
-        return jsonify({"error": "Neoprávnený Prístup"}), 403
\ No newline at end of file
+        return jsonify({"error": "Neoprávnený Prístup"}), 403
+
+@admin_blueprint.route('/pool_status', methods=['GET'])
+@login_required
+def pool_status():
+    if current_user.is_admin():
+        return jsonify({"pools": pool_stats()}), 200
+    else:
+        return jsonify({"error": "Neoprávnený Prístup"}), 403
+
+@admin_blueprint.route('/index_advice', methods=['GET'])
+@login_required
+def index_advice():
+    if current_user.is_admin():
+        advice = []
+        for database in ("stage", "dwh"):
+            try:
+                advice.extend(advise_indexes(database, get_engine(database, "admin")))
+            except SQLAlchemyError as e:
+                advice.append({"database": database, "error": str(e)})
+        return jsonify({"advice": advice}), 200
+    else:
+        return jsonify({"error": "Neoprávnený Prístup"}), 403
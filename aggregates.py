@@ -0,0 +1,241 @@
+import datetime
+from sqlalchemy import text
+
+AGGREGATE_TABLES_VERSION = 4
+
+AGGREGATE_WATERMARKS = {
+    "fact_order_history": "orderhistory_key",
+    "fact_order_line": "orderline_key",
+}
+
+ORDER_TIME_OF_DAY = """
+    CASE
+        WHEN dt.hour BETWEEN 6 AND 11 THEN 'Morning'
+        WHEN dt.hour BETWEEN 12 AND 17 THEN 'Afternoon'
+        WHEN dt.hour BETWEEN 18 AND 23 THEN 'Evening'
+        ELSE 'Night'
+    END
+"""
+
+AGGREGATE_TABLES_CONFIG = {
+    "agg_daily_orders": {
+        "create": """
+        CREATE TABLE IF NOT EXISTS public.agg_daily_orders (
+            date_sk INTEGER PRIMARY KEY,
+            orders_count BIGINT NOT NULL,
+            orders_paid_count BIGINT NOT NULL,
+            orders_paid_revenue NUMERIC
+        );
+        """,
+        "refresh": """
+        INSERT INTO public.agg_daily_orders (date_sk, orders_count, orders_paid_count, orders_paid_revenue)
+        SELECT
+            fos.order_date_sk,
+            COUNT(fos.orderid_bk),
+            COUNT(fos.orderid_bk) FILTER (WHERE fos.is_paid),
+            SUM(fos.paid_tax_incl) FILTER (WHERE fos.is_paid)
+        FROM fact_order_snapshot fos
+        WHERE fos.order_date_sk IN (SELECT date_sk FROM agg_touched_dates)
+        GROUP BY fos.order_date_sk;
+        """,
+    },
+    "agg_daily_paid_carrier": {
+        "create": """
+        CREATE TABLE IF NOT EXISTS public.agg_daily_paid_carrier (
+            date_sk INTEGER NOT NULL,
+            carrier TEXT,
+            order_revenue NUMERIC,
+            order_count BIGINT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS agg_daily_paid_carrier_date_sk_idx ON public.agg_daily_paid_carrier (date_sk);
+        """,
+        "refresh": """
+        INSERT INTO public.agg_daily_paid_carrier (date_sk, carrier, order_revenue, order_count)
+        SELECT
+            fos.paid_date_sk,
+            fos.carrier,
+            SUM(fos.paid_tax_incl),
+            COUNT(fos.orderid_bk)
+        FROM fact_order_snapshot fos
+        WHERE fos.is_paid AND fos.paid_date_sk IN (SELECT date_sk FROM agg_touched_dates)
+        GROUP BY fos.paid_date_sk, fos.carrier;
+        """,
+    },
+    "agg_daily_paid_product": {
+        "create": """
+        CREATE TABLE IF NOT EXISTS public.agg_daily_paid_product (
+            date_sk INTEGER NOT NULL,
+            product_sk INTEGER NOT NULL,
+            line_revenue NUMERIC,
+            line_count BIGINT NOT NULL,
+            PRIMARY KEY (date_sk, product_sk)
+        );
+        """,
+        "refresh": """
+        INSERT INTO public.agg_daily_paid_product (date_sk, product_sk, line_revenue, line_count)
+        SELECT
+            fos.paid_date_sk,
+            fol.product_sk,
+            SUM(fol.amount_tax_incl),
+            COUNT(fol.orderline_key)
+        FROM fact_order_snapshot fos
+        JOIN fact_order_line fol ON fol.orderid_bk = fos.orderid_bk
+        WHERE fos.is_paid AND fos.paid_date_sk IN (SELECT date_sk FROM agg_touched_dates)
+        GROUP BY fos.paid_date_sk, fol.product_sk;
+        """,
+    },
+    "agg_daily_product_orders": {
+        "create": """
+        CREATE TABLE IF NOT EXISTS public.agg_daily_product_orders (
+            date_sk INTEGER NOT NULL,
+            product_sk INTEGER NOT NULL,
+            order_revenue NUMERIC,
+            PRIMARY KEY (date_sk, product_sk)
+        );
+        """,
+        "refresh": """
+        INSERT INTO public.agg_daily_product_orders (date_sk, product_sk, order_revenue)
+        SELECT
+            fol.date_sk,
+            fol.product_sk,
+            SUM(fos.paid_tax_incl)
+        FROM fact_order_line fol
+        JOIN fact_order_snapshot fos ON fos.orderid_bk = fol.orderid_bk AND fos.is_paid
+        WHERE fol.date_sk IN (SELECT date_sk FROM agg_touched_dates)
+        GROUP BY fol.date_sk, fol.product_sk;
+        """,
+    },
+    "agg_daily_customer": {
+        "create": """
+        CREATE TABLE IF NOT EXISTS public.agg_daily_customer (
+            date_sk INTEGER NOT NULL,
+            customer_sk INTEGER NOT NULL,
+            customerid_bk INTEGER NOT NULL,
+            age_band INTEGER,
+            order_count BIGINT NOT NULL,
+            order_value NUMERIC,
+            paid_order_count BIGINT NOT NULL,
+            paid_spend NUMERIC,
+            first_orderid_bk INTEGER NOT NULL,
+            last_orderid_bk INTEGER NOT NULL,
+            PRIMARY KEY (date_sk, customer_sk)
+        );
+        CREATE INDEX IF NOT EXISTS agg_daily_customer_customerid_bk_idx ON public.agg_daily_customer (customerid_bk);
+        """,
+        "refresh": """
+        INSERT INTO public.agg_daily_customer (date_sk, customer_sk, customerid_bk, age_band, order_count, order_value, paid_order_count, paid_spend, first_orderid_bk, last_orderid_bk)
+        SELECT
+            fos.order_date_sk,
+            fos.customer_sk,
+            dc.customerid_bk,
+            FLOOR(EXTRACT(YEAR FROM AGE(dd.date, dc.birthdate)) / 10) * 10,
+            COUNT(fos.orderid_bk),
+            SUM(fos.paid_tax_incl),
+            COUNT(fos.orderid_bk) FILTER (WHERE fos.is_paid),
+            SUM(fos.paid_tax_incl) FILTER (WHERE fos.is_paid),
+            MIN(fos.orderid_bk),
+            MAX(fos.orderid_bk)
+        FROM fact_order_snapshot fos
+        JOIN dim_customer dc ON fos.customer_sk = dc.customer_key
+        JOIN dim_date dd ON fos.order_date_sk = dd.date_key
+        WHERE fos.order_date_sk IN (SELECT date_sk FROM agg_touched_dates)
+        GROUP BY fos.order_date_sk, fos.customer_sk, dc.customerid_bk, dd.date, dc.birthdate;
+        """,
+    },
+    "agg_daily_order_time": {
+        "create": """
+        CREATE TABLE IF NOT EXISTS public.agg_daily_order_time (
+            date_sk INTEGER NOT NULL,
+            time_of_day TEXT NOT NULL,
+            order_count INTEGER NOT NULL,
+            PRIMARY KEY (date_sk, time_of_day)
+        );
+        """,
+        "refresh": f"""
+        INSERT INTO public.agg_daily_order_time (date_sk, time_of_day, order_count)
+        SELECT fo.date_sk, {ORDER_TIME_OF_DAY} AS time_of_day, COUNT(*)
+        FROM fact_order fo
+        JOIN dim_time dt ON fo.time_sk = dt.time_key
+        WHERE fo.date_sk IN (SELECT date_sk FROM agg_touched_dates)
+        GROUP BY fo.date_sk, time_of_day;
+        """,
+    },
+}
+
+
+def create_aggregate_tables(conn):
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS public.aggregate_state (
+            source_table TEXT PRIMARY KEY,
+            last_key BIGINT NOT NULL,
+            updated_at TIMESTAMP NOT NULL
+        );
+    """))
+    for config in AGGREGATE_TABLES_CONFIG.values():
+        conn.execute(text(config["create"]))
+
+def load_aggregate_watermarks(conn):
+    rows = conn.execute(text("SELECT source_table, last_key FROM public.aggregate_state")).fetchall()
+    watermarks = {row.source_table: row.last_key for row in rows}
+
+    if watermarks.get("version") != AGGREGATE_TABLES_VERSION:
+        print("Definície agregačných tabuliek sa zmenili, tabuľky sa prepočítajú celé.")
+        for table_name in AGGREGATE_TABLES_CONFIG:
+            conn.execute(text(f"TRUNCATE public.{table_name}"))
+        watermarks = {}
+
+    return {table_name: watermarks.get(table_name, 0) for table_name in AGGREGATE_WATERMARKS}
+
+def build_aggregate_tables(self, dwh_engine):
+    if self is not None and self.is_aborted():
+        print("Úloha zrušená")
+        return
+
+    print("Aktualizácia agregačných tabuliek...")
+
+    with dwh_engine.begin() as conn:
+        create_aggregate_tables(conn)
+        conn.execute(text("LOCK TABLE public.aggregate_state IN EXCLUSIVE MODE"))
+
+        last_keys = load_aggregate_watermarks(conn)
+        max_keys = {
+            table_name: conn.execute(text(f"SELECT COALESCE(MAX({key_column}), 0) FROM public.{table_name}")).scalar()
+            for table_name, key_column in AGGREGATE_WATERMARKS.items()
+        }
+
+        conn.execute(text("""
+            CREATE TEMP TABLE agg_touched_dates ON COMMIT DROP AS
+            WITH touched_orders AS (
+                SELECT orderid_bk FROM fact_order_history
+                WHERE orderhistory_key > :last_history_key AND orderhistory_key <= :max_history_key
+                UNION
+                SELECT orderid_bk FROM fact_order_line
+                WHERE orderline_key > :last_line_key AND orderline_key <= :max_line_key
+            )
+            SELECT foh.date_sk FROM fact_order_history foh JOIN touched_orders t ON t.orderid_bk = foh.orderid_bk
+            UNION
+            SELECT fol.date_sk FROM fact_order_line fol JOIN touched_orders t ON t.orderid_bk = fol.orderid_bk
+            UNION
+            SELECT fo.date_sk FROM fact_order fo JOIN touched_orders t ON t.orderid_bk = fo.orderid_bk;
+        """), {
+            "last_history_key": last_keys["fact_order_history"],
+            "max_history_key": max_keys["fact_order_history"],
+            "last_line_key": last_keys["fact_order_line"],
+            "max_line_key": max_keys["fact_order_line"],
+        })
+        touched_dates = conn.execute(text("SELECT COUNT(*) FROM agg_touched_dates")).scalar()
+
+        for table_name, config in AGGREGATE_TABLES_CONFIG.items():
+            conn.execute(text(f"DELETE FROM public.{table_name} WHERE date_sk IN (SELECT date_sk FROM agg_touched_dates)"))
+            conn.execute(text(config["refresh"]))
+
+        for table_name, last_key in dict(max_keys, version=AGGREGATE_TABLES_VERSION).items():
+            conn.execute(text("""
+                INSERT INTO public.aggregate_state (source_table, last_key, updated_at)
+                VALUES (:source_table, :last_key, :updated_at)
+                ON CONFLICT (source_table) DO UPDATE
+                SET last_key = EXCLUDED.last_key,
+                    updated_at = EXCLUDED.updated_at;
+            """), {"source_table": table_name, "last_key": last_key, "updated_at": datetime.datetime.now()})
+
+    print(f"Agregačné tabuľky aktualizované, prepočítané dni: {touched_dates}.")
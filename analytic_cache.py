@@ -0,0 +1,202 @@
+import os
+import re
+import json
+import shutil
+import datetime
+
+import pandas as pd
+from sqlalchemy import text
+
+from key_filter import table_fingerprint
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+ANALYTIC_CACHE_ENABLED = True
+ANALYTIC_CACHE_DIR = 'analytic'
+ANALYTIC_CACHE_STATE_PATH = os.path.join(ANALYTIC_CACHE_DIR, 'state.json')
+# None lets DuckDB use all cores
+ANALYTIC_CACHE_THREADS = None
+
+# append-only facts are exported by surrogate key, the rest is replaced on every export
+ANALYTIC_TABLES_CONFIG = {
+    "dim_date": {},
+    "dim_customer": {},
+    "dim_product": {},
+    "fact_cart_line": {"key": "cartline_key"},
+    "fact_order_line": {"key": "orderline_key"},
+    "fact_order": {"key": "order_key"},
+    "fact_order_snapshot": {},
+    "agg_daily_orders": {},
+    "agg_daily_paid_carrier": {},
+    "agg_daily_paid_product": {},
+    "agg_daily_product_orders": {},
+    "agg_daily_customer": {},
+}
+
+# report SQL is written for PostgreSQL, DuckDB needs a constant strftime format per TO_CHAR format
+DATE_FORMATS = {
+    "YYYY-MM-DD": "%Y-%m-%d",
+    "YYYY-MM": "%Y-%m",
+    "YYYY": "%Y",
+    "MM": "%m",
+}
+
+ANALYTIC_MACROS = [
+    "CREATE MACRO to_char(value, format) AS CASE format {cases} END".format(
+        cases=" ".join(f"WHEN '{pg_format}' THEN strftime(value::DATE, '{duckdb_format}')" for pg_format, duckdb_format in DATE_FORMATS.items())
+    ),
+]
+
+PARAMETER_PATTERN = re.compile(r"(?<![:\w]):(\w+)")
+PART_FILE_PATTERN = re.compile(r"part-(\d+)\.parquet$")
+
+
+def load_analytic_state():
+    try:
+        with open(ANALYTIC_CACHE_STATE_PATH, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"version": None, "last_keys": {}}
+
+def save_analytic_state(state):
+    tmp_path = f"{ANALYTIC_CACHE_STATE_PATH}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, ANALYTIC_CACHE_STATE_PATH)
+
+def write_parquet(conn, df, path):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    conn.register("export_chunk", df)
+    try:
+        conn.execute(f"COPY export_chunk TO '{tmp_path}' (FORMAT PARQUET)")
+    finally:
+        conn.unregister("export_chunk")
+    os.replace(tmp_path, path)
+
+def part_file_key(file_name):
+    match = PART_FILE_PATTERN.match(file_name)
+    return int(match.group(1)) if match else None
+
+def remove_parts_after(table_dir, last_key):
+    # parts of an interrupted export are above the stored watermark and would be read twice
+    for file_name in os.listdir(table_dir):
+        part_key = part_file_key(file_name)
+        if part_key is not None and part_key > last_key:
+            os.remove(os.path.join(table_dir, file_name))
+
+def swap_table_dir(table_dir, new_dir):
+    old_dir = f"{table_dir}.old"
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(table_dir):
+        os.replace(table_dir, old_dir)
+    os.replace(new_dir, table_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+def export_table(conn, dwh_engine, table_name, config, last_key, covered_rows=None, chunksize=100000):
+    table_dir = os.path.join(ANALYTIC_CACHE_DIR, table_name)
+    os.makedirs(table_dir, exist_ok=True)
+
+    key = config.get("key")
+    if key:
+        # a fact table rebuilt in the DWH no longer matches the exported parts
+        if last_key > 0:
+            with dwh_engine.connect() as db_conn:
+                if covered_rows is None or table_fingerprint(db_conn, table_name, key, last_key) != (covered_rows, last_key):
+                    print(f"Tabuľka `{table_name}` bola v dátovom sklade zmenená, exportuje sa celá.")
+                    shutil.rmtree(table_dir)
+                    os.makedirs(table_dir)
+                    last_key = 0
+        if last_key == 0:
+            covered_rows = 0
+        remove_parts_after(table_dir, last_key)
+        query = text(f"SELECT * FROM dma_dwh.public.{table_name} WHERE {key} > :last_key ORDER BY {key}")
+        params = {"last_key": last_key}
+        target_dir = table_dir
+    else:
+        query = text(f"SELECT * FROM dma_dwh.public.{table_name}")
+        params = {}
+        # full refreshes are written next to the current files and swapped in at the end
+        target_dir = f"{table_dir}.new"
+        shutil.rmtree(target_dir, ignore_errors=True)
+        os.makedirs(target_dir)
+
+    exported = 0
+    with dwh_engine.connect().execution_options(stream_results=True) as db_conn:
+        for chunk in pd.read_sql_query(query, con=db_conn, params=params, chunksize=chunksize):
+            part_key = int(chunk[key].iloc[-1]) if key else exported + chunk.shape[0]
+            write_parquet(conn, chunk, os.path.join(target_dir, f"part-{part_key:020d}.parquet"))
+            exported += chunk.shape[0]
+            if key:
+                last_key = part_key
+                covered_rows += chunk.shape[0]
+
+    if not key:
+        swap_table_dir(table_dir, target_dir)
+
+    return exported, last_key, covered_rows
+
+def export_analytic_cache(self, dwh_engine, version):
+    if not ANALYTIC_CACHE_ENABLED or duckdb is None:
+        return
+
+    if self is not None and self.is_aborted():
+        print("Úloha zrušená")
+        return
+
+    print("Export dátového skladu do analytickej cache...")
+
+    os.makedirs(ANALYTIC_CACHE_DIR, exist_ok=True)
+    state = load_analytic_state()
+    state["version"] = None
+    save_analytic_state(state)
+
+    conn = duckdb.connect()
+    try:
+        for table_name, config in ANALYTIC_TABLES_CONFIG.items():
+            if self is not None and self.is_aborted():
+                print("Úloha zrušená")
+                return
+
+            row_counts = state.setdefault("row_counts", {})
+            exported, state["last_keys"][table_name], row_counts[table_name] = export_table(conn, dwh_engine, table_name, config, state["last_keys"].get(table_name, 0), row_counts.get(table_name))
+            save_analytic_state(state)
+            print(f"Tabuľka `{table_name}` exportovaná, riadky: {exported}.")
+    finally:
+        conn.close()
+
+    state["version"] = str(version)
+    state["exported_at"] = datetime.datetime.now().isoformat()
+    save_analytic_state(state)
+
+    print("Export do analytickej cache dokončený.")
+
+def connect_analytic_cache():
+    conn = duckdb.connect(config={"threads": ANALYTIC_CACHE_THREADS} if ANALYTIC_CACHE_THREADS else {})
+    for table_name in ANALYTIC_TABLES_CONFIG:
+        path = os.path.join(ANALYTIC_CACHE_DIR, table_name, '*.parquet')
+        conn.execute(f"CREATE VIEW {table_name} AS SELECT * FROM read_parquet('{path}')")
+    for macro in ANALYTIC_MACROS:
+        conn.execute(macro)
+    return conn
+
+def read_analytic_report(query, params, version):
+    if not ANALYTIC_CACHE_ENABLED or duckdb is None:
+        return None
+
+    state = load_analytic_state()
+    if state.get("version") is None or state["version"] != str(version):
+        return None
+
+    used_params = PARAMETER_PATTERN.findall(query)
+    try:
+        conn = connect_analytic_cache()
+        try:
+            return conn.execute(PARAMETER_PATTERN.sub(r"$\1", query), {name: params[name] for name in used_params}).df()
+        finally:
+            conn.close()
+    except (duckdb.Error, KeyError) as e:
+        print(f"Analytická cache nie je dostupná, správa sa vytvorí v dátovom sklade: {e}")
+        return None
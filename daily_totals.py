@@ -0,0 +1,154 @@
+import os
+import json
+import datetime
+import threading
+
+import numpy as np
+from sqlalchemy import text
+
+from date_keys import DIM_DATE_START, DIM_DATE_END, date_to_key
+
+DAILY_TOTALS_DIR = 'indexes'
+DAILY_TOTALS_PATH = os.path.join(DAILY_TOTALS_DIR, 'daily_totals.npy')
+DAILY_TOTALS_META_PATH = os.path.join(DAILY_TOTALS_DIR, 'daily_totals.json')
+
+DAILY_TOTALS_QUERIES = {
+    "orders": """
+    SELECT
+        fos.order_date_sk AS date_sk,
+        COUNT(fos.orderid_bk) AS orders_count,
+        COUNT(fos.orderid_bk) FILTER (WHERE fos.is_paid) AS orders_paid_count,
+        COALESCE(SUM(fos.paid_tax_incl) FILTER (WHERE fos.is_paid), 0) AS orders_paid_revenue
+    FROM fact_order_snapshot fos
+    GROUP BY fos.order_date_sk;
+    """,
+    "paid": """
+    SELECT
+        fos.paid_date_sk AS date_sk,
+        COUNT(fos.orderid_bk) AS paid_count,
+        COALESCE(SUM(fos.paid_tax_incl), 0) AS paid_revenue
+    FROM fact_order_snapshot fos
+    WHERE fos.is_paid
+    GROUP BY fos.paid_date_sk;
+    """,
+    "cart_lines": """
+    SELECT
+        fcl.date_sk,
+        COUNT(*) AS cart_lines_count
+    FROM fact_cart_line fcl
+    GROUP BY fcl.date_sk;
+    """,
+}
+
+DAILY_TOTALS_MEASURES = ["orders_count", "orders_paid_count", "orders_paid_revenue", "paid_count", "paid_revenue", "cart_lines_count"]
+
+daily_totals_state = {"mtime": None, "totals": None}
+daily_totals_lock = threading.Lock()
+daily_totals_build_lock = threading.Lock()
+
+
+def fetch_daily_totals(dwh_engine):
+    days = date_to_key(DIM_DATE_END) + 1
+    daily = np.zeros((len(DAILY_TOTALS_MEASURES), days), dtype=np.float64)
+
+    with dwh_engine.connect() as conn:
+        for query in DAILY_TOTALS_QUERIES.values():
+            result = conn.execute(text(query))
+            columns = list(result.keys())
+            rows = result.fetchall()
+            if not rows:
+                continue
+
+            values = np.array([[float(value or 0) for value in row] for row in rows], dtype=np.float64)
+            date_keys = values[:, 0].astype(np.int64)
+            valid = (date_keys > 0) & (date_keys < days)
+            for i, column in enumerate(columns[1:], start=1):
+                np.add.at(daily[DAILY_TOTALS_MEASURES.index(column)], date_keys[valid], values[valid, i])
+
+    return daily
+
+def build_daily_totals(self, dwh_engine, version):
+    if self is not None and self.is_aborted():
+        print("Úloha zrušená")
+        return
+
+    print("Vytváranie indexu denných súčtov...")
+
+    with daily_totals_build_lock:
+        totals = np.cumsum(fetch_daily_totals(dwh_engine), axis=1)
+
+        os.makedirs(DAILY_TOTALS_DIR, exist_ok=True)
+        suffix = f"{os.getpid()}.{threading.get_ident()}"
+        tmp_path = f"{DAILY_TOTALS_PATH}.{suffix}.tmp.npy"
+        np.save(tmp_path, totals)
+        os.replace(tmp_path, DAILY_TOTALS_PATH)
+
+        tmp_meta_path = f"{DAILY_TOTALS_META_PATH}.{suffix}.tmp"
+        with open(tmp_meta_path, 'w', encoding='utf-8') as f:
+            json.dump({"version": str(version), "measures": DAILY_TOTALS_MEASURES, "built_at": datetime.datetime.now().isoformat()}, f)
+        os.replace(tmp_meta_path, DAILY_TOTALS_META_PATH)
+
+    print("Index denných súčtov bol vytvorený.")
+
+def load_daily_totals():
+    try:
+        mtime = os.stat(DAILY_TOTALS_META_PATH).st_mtime_ns
+    except OSError:
+        return None, None
+
+    with daily_totals_lock:
+        if daily_totals_state["mtime"] != mtime:
+            try:
+                with open(DAILY_TOTALS_META_PATH, encoding='utf-8') as f:
+                    meta = json.load(f)
+                totals = np.load(DAILY_TOTALS_PATH, mmap_mode='r')
+            except (OSError, ValueError) as e:
+                print(f"Index denných súčtov nie je možné načítať: {e}")
+                return None, None
+            if meta.get("measures") != DAILY_TOTALS_MEASURES:
+                return None, None
+            daily_totals_state["totals"] = (meta["version"], totals)
+            daily_totals_state["mtime"] = mtime
+
+        return daily_totals_state["totals"]
+
+# the index is rebuilt by the DWH load before a new ETL version is published,
+# requests only read the last built index and fall back to SQL when there is none
+def get_daily_totals():
+    loaded_version, totals = load_daily_totals()
+    return totals
+
+def range_total(totals, measure, start_date, end_date):
+    row = totals[DAILY_TOTALS_MEASURES.index(measure)]
+    start_key = max(date_to_key(max(start_date, DIM_DATE_START)), 1)
+    end_key = min(date_to_key(min(end_date, DIM_DATE_END)), len(row) - 1)
+    if end_key < start_key:
+        return 0.0
+    return float(row[end_key] - row[start_key - 1])
+
+def daily_values(totals, measure, start_date, end_date):
+    row = totals[DAILY_TOTALS_MEASURES.index(measure)]
+    start_date = max(start_date, DIM_DATE_START)
+    end_date = min(end_date, DIM_DATE_END)
+    if end_date < start_date:
+        return np.array([], dtype='datetime64[D]'), np.array([], dtype=np.float64)
+
+    start_key = date_to_key(start_date)
+    end_key = date_to_key(end_date)
+    dates = np.arange(np.datetime64(start_date, 'D'), np.datetime64(end_date, 'D') + 1)
+    return dates, np.diff(row[start_key - 1:end_key + 1])
+
+def period_totals(totals, measure, count_measure, start_date, end_date, date_format):
+    dates, values = daily_values(totals, measure, start_date, end_date)
+    counts = daily_values(totals, count_measure, start_date, end_date)[1]
+
+    if date_format == "MM":
+        labels = np.char.zfill((dates.astype('datetime64[M]').astype(np.int64) % 12 + 1).astype(str), 2)
+    else:
+        labels = np.datetime_as_string(dates, unit='D')
+
+    periods, inverse = np.unique(labels, return_inverse=True)
+    period_values = np.bincount(inverse, weights=values, minlength=len(periods))
+    period_counts = np.bincount(inverse, weights=counts, minlength=len(periods))
+    present = period_counts > 0
+    return periods[present].astype(object), period_values[present]
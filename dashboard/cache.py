@@ -0,0 +1,286 @@
+import gzip
+import json
+import time
+import uuid
+import hashlib
+import datetime
+import threading
+from collections import OrderedDict
+
+import redis
+from flask import request, Response
+from sqlalchemy import text
+from celeryconfig import REDIS_DB_URI
+from engines import get_engine
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+CACHE_PREFIX = 'dma:dashboard'
+ETL_VERSION_KEY = f'{CACHE_PREFIX}:etl_version'
+ENTRY_TTL = 7 * 24 * 3600
+LOCK_TIMEOUT = 60
+LOCK_WAIT = 0.1
+LRU_SIZE = 1024
+ETL_VERSION_TTL = 30
+MIN_COMPRESS_SIZE = 512
+CACHED_COMPRESSION_LEVELS = {"br": 11, "gzip": 9}
+RESPONSE_COMPRESSION_LEVELS = {"br": 5, "gzip": 6}
+
+stage_engine = get_engine("stage")
+redis_client = redis.StrictRedis.from_url(REDIS_DB_URI, socket_timeout=1, socket_connect_timeout=1)
+
+lru_entries = OrderedDict()
+lru_lock = threading.Lock()
+local_locks = {}
+local_locks_lock = threading.Lock()
+etl_version_state = {"version": None, "checked_at": 0}
+etl_modified = {}
+
+
+def lru_get(key):
+    with lru_lock:
+        entry = lru_entries.get(key)
+        if entry is not None:
+            lru_entries.move_to_end(key)
+        return entry
+
+def lru_put(key, entry):
+    with lru_lock:
+        lru_entries[key] = entry
+        lru_entries.move_to_end(key)
+        while len(lru_entries) > LRU_SIZE:
+            lru_entries.popitem(last=False)
+
+def redis_get(key):
+    try:
+        value = redis_client.get(key)
+    except redis.RedisError:
+        return None
+    if value is None:
+        return None
+    entry = json.loads(value)
+    return entry["version"], entry["body"]
+
+def redis_put(key, entry):
+    try:
+        redis_client.set(key, json.dumps({"version": entry[0], "body": entry[1]}), ex=ENTRY_TTL)
+    except redis.RedisError:
+        pass
+
+def fetch_etl_version():
+    with stage_engine.connect() as conn:
+        version = conn.execute(text("""
+            SELECT MAX(id) FROM etl_log
+            WHERE job_name = 'dwh_incremental' AND status = 'SUCCESS'
+        """)).scalar()
+    return str(version or 0)
+
+def get_etl_version():
+    try:
+        version = redis_client.get(ETL_VERSION_KEY)
+        if version is not None:
+            return version.decode()
+    except redis.RedisError:
+        version = None
+
+    if etl_version_state["version"] is None or time.monotonic() - etl_version_state["checked_at"] > ETL_VERSION_TTL:
+        etl_version_state["version"] = fetch_etl_version()
+        etl_version_state["checked_at"] = time.monotonic()
+        try:
+            redis_client.set(ETL_VERSION_KEY, etl_version_state["version"], nx=True)
+        except redis.RedisError:
+            pass
+
+    return etl_version_state["version"]
+
+def publish_etl_version(version):
+    try:
+        redis_client.set(ETL_VERSION_KEY, str(version))
+    except redis.RedisError as e:
+        print(f"Verziu dát pre informačný panel nie je možné uložiť: {e}")
+
+def get_etl_modified(version):
+    if version not in etl_modified:
+        with stage_engine.connect() as conn:
+            ended_at = conn.execute(text("SELECT ended_at FROM etl_log WHERE id = :id"), {"id": int(version)}).scalar()
+        etl_modified[version] = ended_at.replace(microsecond=0).astimezone(datetime.timezone.utc) if ended_at else None
+    return etl_modified[version]
+
+def get_encodings():
+    return ["br", "gzip"] if brotli is not None else ["gzip"]
+
+def compress(body, encoding, levels=RESPONSE_COMPRESSION_LEVELS):
+    data = body.encode('utf-8')
+    if encoding == "br":
+        return brotli.compress(data, quality=levels["br"])
+    return gzip.compress(data, compresslevel=levels["gzip"])
+
+def store_compressed(key, version, body):
+    if len(body) < MIN_COMPRESS_SIZE:
+        return
+    for encoding in get_encodings():
+        data = compress(body, encoding, CACHED_COMPRESSION_LEVELS)
+        compressed_key = f"{key}:{version}:{encoding}"
+        lru_put(compressed_key, data)
+        try:
+            redis_client.set(compressed_key, data, ex=ENTRY_TTL)
+        except redis.RedisError:
+            pass
+
+def get_compressed(key, version, body, encoding):
+    compressed_key = f"{key}:{version}:{encoding}"
+    data = lru_get(compressed_key)
+    if data is not None:
+        return data
+
+    try:
+        data = redis_client.get(compressed_key)
+    except redis.RedisError:
+        data = None
+    if data is None:
+        data = compress(body, encoding, CACHED_COMPRESSION_LEVELS)
+        try:
+            redis_client.set(compressed_key, data, ex=ENTRY_TTL)
+        except redis.RedisError:
+            pass
+
+    lru_put(compressed_key, data)
+    return data
+
+def get_local_lock(key):
+    with local_locks_lock:
+        return local_locks.setdefault(key, threading.Lock())
+
+def acquire_redis_lock(key, token):
+    try:
+        return bool(redis_client.set(f"{key}:lock", token, nx=True, ex=LOCK_TIMEOUT))
+    except redis.RedisError:
+        return True
+
+def release_redis_lock(key, token):
+    try:
+        if redis_client.get(f"{key}:lock") == token.encode():
+            redis_client.delete(f"{key}:lock")
+    except redis.RedisError:
+        pass
+
+def refresh(key, version, build):
+    body = build()
+    if body is None:
+        return None
+    entry = (version, body)
+    redis_put(key, entry)
+    lru_put(key, entry)
+    store_compressed(key, version, body)
+    return body
+
+def refresh_locked(key, version, build, token):
+    try:
+        return refresh(key, version, build)
+    finally:
+        release_redis_lock(key, token)
+        get_local_lock(key).release()
+
+def get_cache_key(widget_id, filter_key):
+    return f"{CACHE_PREFIX}:{widget_id}:{hashlib.sha1(filter_key.encode()).hexdigest()}"
+
+def cached_json(widget_id, filter_key, build):
+    return cached_entry(widget_id, filter_key, build)[1]
+
+def cached_entry(widget_id, filter_key, build, version=None):
+    version = get_etl_version() if version is None else version
+    key = get_cache_key(widget_id, filter_key)
+
+    entry = lru_get(key)
+    if entry is not None and entry[0] == version:
+        return entry
+
+    shared_entry = redis_get(key)
+    if shared_entry is not None and shared_entry[0] == version:
+        lru_put(key, shared_entry)
+        return shared_entry
+
+    stale = shared_entry or entry
+    local_lock = get_local_lock(key)
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    while True:
+        if local_lock.acquire(blocking=False):
+            token = uuid.uuid4().hex
+            if acquire_redis_lock(key, token):
+                if stale is not None:
+                    threading.Thread(target=refresh_locked, args=(key, version, build, token), daemon=True).start()
+                    return stale
+                return version, refresh_locked(key, version, build, token)
+            local_lock.release()
+
+        if stale is not None:
+            return stale
+
+        time.sleep(LOCK_WAIT)
+        entry = lru_get(key) or redis_get(key)
+        if entry is not None and entry[0] == version:
+            lru_put(key, entry)
+            return entry
+        if time.monotonic() > deadline:
+            return version, build()
+
+def build_etag(*parts):
+    return hashlib.sha1("|".join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+def get_response_encoding(body):
+    if len(body) < MIN_COMPRESS_SIZE:
+        return None
+    for encoding in get_encodings():
+        if request.accept_encodings[encoding]:
+            return encoding
+    return None
+
+def set_validators(response, etag, last_modified):
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.vary.add("Accept-Encoding")
+    return response
+
+def not_modified_response(etag, last_modified=None):
+    if request.if_none_match:
+        modified = not request.if_none_match.contains(etag)
+    elif request.if_modified_since is not None and last_modified is not None:
+        modified = last_modified > request.if_modified_since
+    else:
+        modified = True
+
+    if modified:
+        return None
+    return set_validators(Response(status=304), etag, last_modified)
+
+def json_response(body, etag, last_modified=None, get_encoded=None):
+    encoding = get_response_encoding(body)
+    if encoding is None:
+        response = Response(body, content_type='application/json')
+    else:
+        data = get_encoded(encoding) if get_encoded is not None else compress(body, encoding)
+        response = Response(data, content_type='application/json')
+        response.headers["Content-Encoding"] = encoding
+    return set_validators(response, etag, last_modified)
+
+def cached_response(widget_id, filter_key, build):
+    version = get_etl_version()
+    last_modified = get_etl_modified(version)
+    etag = build_etag(widget_id, filter_key, version)
+    not_modified = not_modified_response(etag, last_modified)
+    if not_modified is not None:
+        return not_modified
+
+    version, body = cached_entry(widget_id, filter_key, build, version)
+    if body is None:
+        return Response('{}', content_type='application/json')
+
+    key = get_cache_key(widget_id, filter_key)
+    etag = build_etag(widget_id, filter_key, version)
+    return json_response(body, etag, get_etl_modified(version), lambda encoding: get_compressed(key, version, body, encoding))
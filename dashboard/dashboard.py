@@ -1,21 +1,29 @@
+import json
 import datetime
-import calendar
 
 import numpy as np
 from flask import Blueprint, request, jsonify, render_template, redirect, url_for, Response
 from flask_login import current_user, login_required
-from sqlalchemy import create_engine, text
-import pandas as pd
-import plotly.graph_objects as go
-import gc
-from celeryconfig import PROD_DB_URI, DWH_DB_URI
+from sqlalchemy import text
+from figures import trace, layout as figure_layout, figure_json, downsample_periods, period_axis_title
+from concurrent.futures import ThreadPoolExecutor
 
 from auth.base_auth import check_auth, authenticate
-from reportsconfig import dashboard_queries, filter_queries
+from dashboard.cache import cached_json, cached_response, get_etl_version, build_etag, not_modified_response, json_response
+from filter_catalogue import get_filter_menus
+from daily_totals import get_daily_totals, range_total, period_totals
+from query_templates import compiled_dashboard_queries, period_params
+from engines import get_engine
+from sketches import get_sketch_store
+from reportsconfig import SKETCH_EXACT_MODE
+from query_results import fetch_rows, fetch_columns, fetch_row, rows_json, columns_from_json, to_number, fill, replace, round_values, filter_columns, sort_columns, head_columns, pivot_median
 dashboard_blueprint = Blueprint('dashboard', __name__)
 
-prod_engine = create_engine(PROD_DB_URI)
-dwh_engine = create_engine(DWH_DB_URI)
+prod_engine = get_engine("prod")
+dwh_engine = get_engine("dwh")
+
+DASHBOARD_POOL_SIZE = 4
+dashboard_pool = ThreadPoolExecutor(max_workers=DASHBOARD_POOL_SIZE)
 
 def get_date_range_filter():
     filter_type = request.args.get("filter_type")
@@ -29,74 +37,55 @@ def get_date_range_filter():
         range_end = request.args.get("filter_value_end")
     return current_date, filter_type, filter_value, range_end, range_start
 
-def apply_period_filter(original_query, current_date, filter_type, filter_value, range_start, range_end):
-    current_year = current_date.year
-    current_month = current_date.month
-    current_quarter = (current_month - 1) // 3 + 1
-    if filter_type == "month" and filter_value:
-        try:
-            filter_value_parts = filter_value.split("-")
-            filter_value_year = int(filter_value_parts[0])
-            filter_value_month = int(filter_value_parts[1])
-        except ValueError:
-            filter_value_month = current_month
-            filter_value_year = current_year
-
-        end_day = calendar.monthrange(filter_value_year, filter_value_month)[1]
-
-        date_filter = f"month = {filter_value_month} AND year = {filter_value_year}"
-        valid_filter = "{alias}.valid_from <= '{filter_value_year}-{filter_value_month}-{end_day}' AND {alias}.valid_to >= '{filter_value_year}-{filter_value_month}-01'".format(alias="{alias}", filter_value_year=filter_value_year, filter_value_month=filter_value_month, end_day=end_day)
-        date_format = "YYYY-MM-DD"
-    elif filter_type == "quarter" and filter_value:
-        try:
-            filter_value_parts = filter_value.split("-")
-            filter_value_year = int(filter_value_parts[0])
-            filter_value_quarter = int(filter_value_parts[1])
-        except ValueError:
-            filter_value_quarter = current_quarter
-            filter_value_year = current_year
-
-        start_month = (filter_value_quarter-1)*3 + 1
-        end_month = filter_value_quarter*3
-        end_day = calendar.monthrange(filter_value_year, end_month)[1]
-
-        date_filter = f"quarter = {filter_value_quarter} AND year = {filter_value_year}"
-        valid_filter = "{alias}.valid_from <= '{filter_value_year}-{end_month}-{end_day}' AND {alias}.valid_to >= '{filter_value_year}-{start_month}-01'".format(alias="{alias}", filter_value_year=filter_value_year, start_month=start_month, end_month=end_month, end_day=end_day)
-        date_format = "MM"
-    elif filter_type == "year" and filter_value:
-        try:
-            filter_value = int(filter_value)
-        except ValueError:
-            filter_value = current_year
-
-        date_filter = f"year = {filter_value}"
-        valid_filter = "{alias}.valid_from <= '{filter_value}-12-31' AND {alias}.valid_to >= '{filter_value}-01-01'".format(alias="{alias}", filter_value=filter_value)
-        date_format = "MM"
-    elif filter_type == "range" and range_start or range_end:
-        try:
-            date_start = range_start
-            filter_value_start = datetime.datetime.strptime(date_start, "%Y-%m-%d").date()
-            date_end = range_end
-            filter_value_end = datetime.datetime.strptime(date_end, "%Y-%m-%d").date()
-        except ValueError:
-            filter_value_start = filter_value_end = datetime.datetime.strptime(current_date, "%Y-%m-%d").date()
-
-        date_filter = f"date BETWEEN '{filter_value_start}' AND '{filter_value_end}'"
-        valid_filter = "{alias}.valid_from <= '{range_end}' AND {alias}.valid_to >= '{range_start}'".format(alias="{alias}", range_start=range_start, range_end=range_end)
-        date_format = "YYYY-MM-DD"
-    else:
-        try:
-            filter_value = int(filter_value)
-        except ValueError:
-            filter_value = current_year
+def get_period_key(params):
+    return f"{params['period_start']}|{params['period_end']}|{params['date_format']}"
+
+PAID_ORDER_GROUPINGS = {
+    "period_revenue": {"columns": {"period": "period", "order_revenue": "total_revenue"}, "sort": "period", "ascending": True},
+    "carrier_revenue_orders_distribution": {"columns": {"carrier": "carrier", "order_revenue": "total_revenue", "order_count": "total_count"}, "sort": "total_revenue", "ascending": False},
+    "top_manufacturer_revenue_distribution": {"columns": {"manufacturer": "manufacturer", "line_revenue": "total_revenue"}, "sort": "total_revenue", "ascending": False, "lines": True, "limit": 10},
+    "market_group_revenue_distribution": {"columns": {"market_group": "market_group", "line_revenue": "total_revenue"}, "sort": "total_revenue", "ascending": False, "lines": True},
+}
+
+DASHBOARD_COMBINED_QUERIES = True
+DASHBOARD_DAILY_TOTALS = True
+
+def fetch_paid_order_groupings(current_date, filter_type, filter_value, range_start, range_end):
+    params = period_params(current_date, filter_type, filter_value, range_start, range_end)
+
+    with dwh_engine.connect() as conn:
+        columns, rows = fetch_rows(conn, compiled_dashboard_queries["paid_order_groupings"], params)
+
+    return rows_json(columns, rows)
 
-        date_filter = f"year = {filter_value}"
-        valid_filter = "{alias}.valid_from <= '{filter_value}-12-31' AND {alias}.valid_to >= '{filter_value}-01-01'".format(
-            alias="{alias}", filter_value=filter_value)
-        date_format = "MM"
+def get_paid_order_frame(widget_id, current_date, filter_type, filter_value, range_start, range_end):
+    params = period_params(current_date, filter_type, filter_value, range_start, range_end)
+    if not DASHBOARD_COMBINED_QUERIES:
+        with dwh_engine.connect() as conn:
+            return fetch_columns(conn, compiled_dashboard_queries[widget_id], params)
 
-    query = original_query.format(filter=date_filter, filter_raw=f"'{date_filter}'", valid_customer_filter=valid_filter.format(alias="dc"), valid_product_filter=valid_filter.format(alias="dp"), valid_order_state_filter=valid_filter.format(alias="dos"), group_filter="{group_filter}", date_format=date_format)
-    return query
+    body = cached_json("paid_order_groupings", get_period_key(params), lambda: fetch_paid_order_groupings(current_date, filter_type, filter_value, range_start, range_end))
+    groupings = columns_from_json(body)
+
+    grouping = PAID_ORDER_GROUPINGS[widget_id]
+    groupings = filter_columns(groupings, groupings['grouping_set'] == widget_id)
+    if grouping.get("lines"):
+        groupings = filter_columns(groupings, groupings['line_count'] > 0)
+    columns = {name: groupings[column] for column, name in grouping["columns"].items()}
+    columns = sort_columns(columns, grouping["sort"], ascending=grouping["ascending"])
+    if "limit" in grouping:
+        columns = head_columns(columns, grouping["limit"])
+
+    return columns
+
+def get_dashboard_daily_totals():
+    if not DASHBOARD_DAILY_TOTALS:
+        return None
+    try:
+        return get_daily_totals()
+    except Exception as e:
+        print(f"Index denných súčtov nie je dostupný: {e}")
+        return None
 
 @dashboard_blueprint.before_request
 def require_http_auth():
@@ -110,40 +99,36 @@ def dashboard_index():
     if not current_user.is_authenticated:
         return redirect(url_for('auth.auth_login_form'))
 
-    with dwh_engine.connect() as conn:
-        min_date_row = conn.execute(text(filter_queries["min_date"])).fetchone()
-        months = conn.execute(text(filter_queries["months"]), parameters={"min_date": min_date_row.min_date}).fetchall()
-        quarters = conn.execute(text(filter_queries["quarters"]), parameters = {"min_date": min_date_row.min_date}).fetchall()
-        years = conn.execute(text(filter_queries["years"]), parameters ={"min_date": min_date_row.min_date}).fetchall()
-
-    return render_template('dashboard/dashboard.html', title='DMA - Informačný panel', page='dashboard', months=months, quarters=quarters, years=years)
+    months, quarters, years = get_filter_menus(dwh_engine, get_etl_version())
 
-@dashboard_blueprint.route('/get-summary', methods=['GET'])
-@login_required
-def get_summary():
     current_date, filter_type, filter_value, range_end, range_start = get_date_range_filter()
+    dashboard_data = get_widgets_json(DASHBOARD_WIDGETS, current_date, filter_type, filter_value, range_start, range_end).replace("</", "<\\/")
+
+    return render_template('dashboard/dashboard.html', title='DMA - Informačný panel', page='dashboard', months=months, quarters=quarters, years=years, dashboard_data=dashboard_data)
+
+def build_summary(current_date, filter_type, filter_value, range_start, range_end):
+    params = period_params(current_date, filter_type, filter_value, range_start, range_end)
+
+    totals = get_dashboard_daily_totals()
 
-    query = apply_period_filter(dashboard_queries["carts_query"], current_date, filter_type, filter_value, range_start, range_end)
+    sketch_store = get_sketch_store() if not SKETCH_EXACT_MODE else None
 
     with dwh_engine.connect() as conn:
-        carts_df = pd.read_sql_query(text(query), conn)
-        carts_df['carts_count'] = carts_df['carts_count'].fillna(0)
-        carts_count = carts_df['carts_count'].iloc[0]
-        del carts_df
-
-        orders_query = apply_period_filter(dashboard_queries["orders_query"], current_date, filter_type, filter_value, range_start, range_end)
-        orders_df = pd.read_sql_query(text(orders_query), conn)
-        orders_df['orders_count'] = orders_df['orders_count'].fillna(0)
-        orders_count = int(orders_df['orders_count'].iloc[0])
-        del orders_df
-
-        orders_paid_query = apply_period_filter(dashboard_queries["orders_paid_query"], current_date, filter_type, filter_value, range_start, range_end)
-        orders_paid_df = pd.read_sql_query(text(orders_paid_query), conn)
-        orders_paid_df['orders_paid_count'] = orders_paid_df['orders_paid_count'].fillna(0)
-        orders_paid_count = int(orders_paid_df['orders_paid_count'].iloc[0])
-        orders_paid_df['total_revenue'] = pd.to_numeric(orders_paid_df['total_revenue'], errors='coerce').fillna(0)
-        total_revenue = float(orders_paid_df['total_revenue'].iloc[0])
-        del orders_paid_df
+        if sketch_store is not None:
+            carts_count = sketch_store.distinct_carts(params["date_sk_start"], params["date_sk_end"])
+        else:
+            carts_count = to_number(fetch_row(conn, compiled_dashboard_queries["carts_query"], params).get('carts_count'))
+
+        if totals is not None:
+            orders_count = int(range_total(totals, "orders_count", params["period_start"], params["period_end"]))
+            orders_paid_count = int(range_total(totals, "orders_paid_count", params["period_start"], params["period_end"]))
+            total_revenue = range_total(totals, "orders_paid_revenue", params["period_start"], params["period_end"])
+        else:
+            orders_count = int(to_number(fetch_row(conn, compiled_dashboard_queries["orders_query"], params).get('orders_count')))
+
+            orders_paid = fetch_row(conn, compiled_dashboard_queries["orders_paid_query"], params)
+            orders_paid_count = int(to_number(orders_paid.get('orders_paid_count')))
+            total_revenue = float(to_number(orders_paid.get('total_revenue')))
 
         summary = {
             'orders_count': orders_count,
@@ -156,30 +141,31 @@ def get_summary():
 
         summary['conversion_rate'] = round(float(summary['conversion_rate']), 2)
 
-    gc.collect()
-    return jsonify(summary if summary else {})
+    return json.dumps(summary)
 
-@dashboard_blueprint.route('/get-period-revenue', methods=['GET'])
-@login_required
-def get_period_revenue():
-    current_date, filter_type, filter_value, range_end, range_start = get_date_range_filter()
-
-    query = apply_period_filter(dashboard_queries["period_revenue"], current_date, filter_type, filter_value, range_start, range_end)
+def build_period_revenue(current_date, filter_type, filter_value, range_start, range_end):
+    params = period_params(current_date, filter_type, filter_value, range_start, range_end)
+    totals = get_dashboard_daily_totals()
+    if totals is not None:
+        periods, total_revenue = period_totals(totals, "paid_revenue", "paid_count", params["period_start"], params["period_end"], params["date_format"])
+        revenue = {'period': periods, 'total_revenue': total_revenue}
+    else:
+        revenue = get_paid_order_frame("period_revenue", current_date, filter_type, filter_value, range_start, range_end)
 
-    with dwh_engine.connect() as conn:
-        revenue_df = pd.read_sql_query(text(query), conn)
-        revenue_df['total_revenue'] = revenue_df['total_revenue'].round(0)
+    periods, total_revenue, granularity = downsample_periods(revenue['period'], revenue['total_revenue'], params["date_format"])
+    revenue = {'period': periods, 'total_revenue': round_values(total_revenue)}
 
     try:
-        bar_trace = go.Bar(
-            x=revenue_df['period'],
-            y=revenue_df['total_revenue'],
+        bar_trace = trace(
+            "bar",
+            x=revenue['period'],
+            y=revenue['total_revenue'],
             name='Príjmy',
             # marker=dict(color='rgb(55, 83, 109)')
         )
 
-        x = np.arange(len(revenue_df))
-        y = revenue_df['total_revenue'].values
+        x = np.arange(len(revenue['period']))
+        y = revenue['total_revenue']
 
         slope, intercept = 0, 0
 
@@ -188,11 +174,12 @@ def get_period_revenue():
         elif len(y) > 0:
             slope, intercept = np.polyfit(x, y, 1)
 
-        revenue_df['lin_reg'] = slope * x + intercept
+        revenue['lin_reg'] = slope * x + intercept
 
-        trend_trace_lr = go.Scatter(
-            x=revenue_df['period'],
-            y=revenue_df['lin_reg'],
+        trend_trace_lr = trace(
+            "scatter",
+            x=revenue['period'],
+            y=revenue['lin_reg'],
             mode='lines',
             name='Trend (lineárna reg.)',
             line=dict(color='green', dash='dot')
@@ -200,14 +187,14 @@ def get_period_revenue():
 
         data = [bar_trace, trend_trace_lr,]
 
-        layout = go.Layout(
+        layout = figure_layout(
             title='Príjmy',
             height=400,
             grid=dict(rows=1, columns=1, pattern='independent'),
             xaxis=dict(
                 tickmode="linear",
                 dtick=1,
-                title="Obdobie",
+                title=period_axis_title("Obdobie", granularity),
                 type="category",
                 domain=[0, 1]
             ),
@@ -215,42 +202,36 @@ def get_period_revenue():
                 title="Príjmy",
                 domain=[0, 1],
             ),
+            meta=dict(granularity=granularity),
             autosize=True,
         )
 
-        fig = go.Figure(data=data, layout=layout)
+        fig = figure_json(data, layout)
 
 
     except Exception as e:
-        return jsonify({})
+        return None
 
-    del revenue_df
-    gc.collect()
-    return Response(fig.to_json(), content_type='application/json')
+    return fig
 
-@dashboard_blueprint.route('/get-orders-heatmap', methods=['GET'])
-@login_required
-def get_orders_heatmap():
-    current_date, filter_type, filter_value, range_end, range_start = get_date_range_filter()
-
-    query = apply_period_filter(dashboard_queries["orders_heatmap"], current_date, filter_type, filter_value, range_start, range_end)
+def build_orders_heatmap(current_date, filter_type, filter_value, range_start, range_end):
+    params = period_params(current_date, filter_type, filter_value, range_start, range_end)
 
     with dwh_engine.connect() as conn:
-        heatmap_data = pd.read_sql_query(text(query), conn)
-
-    pivot_table = heatmap_data.pivot(index="time_of_day", columns="day_of_week", values="order_count").fillna(0)
+        heatmap_data = fetch_columns(conn, compiled_dashboard_queries["orders_heatmap"], params)
 
     day_order_labels = ["Pondelok", "Utorok", "Streda", "Štvrtok", "Piatok", "Sobota", "Nedeľa"]
     day_order = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
-    pivot_table = pivot_table.reindex(columns=day_order)
 
     time_order_labels = ["Ráno", "Popoludnie", "Večer", "Noc"]
     time_order = ["Morning", "Afternoon", "Evening", "Night"]
-    pivot_table = pivot_table.reindex(index=time_order)
+
+    pivot_table = pivot_median(heatmap_data, "time_of_day", "day_of_week", "order_count", time_order, day_order)
 
     try:
-        heatmap_trace = go.Heatmap(
-            z=pivot_table.values,
+        heatmap_trace = trace(
+            "heatmap",
+            z=pivot_table,
             x=day_order,
             y=time_order,
             colorscale="RdBu_r",
@@ -259,7 +240,7 @@ def get_orders_heatmap():
 
         data = [heatmap_trace]
 
-        layout = go.Layout(
+        layout = figure_layout(
             title="Vytvorenie objednávok počas týždňa",
             height=400,
             xaxis=dict(
@@ -281,39 +262,30 @@ def get_orders_heatmap():
             autosize=True
         )
 
-        fig = go.Figure(data=data, layout=layout)
+        fig = figure_json(data, layout)
     except Exception as e:
-        return jsonify({})
-
-    del heatmap_data, pivot_table
-    gc.collect()
+        return None
 
-    return Response(fig.to_json(), content_type='application/json')
-
-@dashboard_blueprint.route('/get-carrier-revenue-orders-distribution', methods=['GET'])
-@login_required
-def get_carrier_revenue_orders_distribution():
-    current_date, filter_type, filter_value, range_end, range_start = get_date_range_filter()
+    return fig
 
-    query = apply_period_filter(dashboard_queries["carrier_revenue_orders_distribution"],
-                                current_date, filter_type, filter_value, range_start, range_end)
-
-    with dwh_engine.connect() as conn:
-        carrier_df = pd.read_sql_query(text(query), conn)
-        carrier_df['carrier'] = carrier_df['carrier'].fillna('Neuvedené')
+def build_carrier_revenue_orders_distribution(current_date, filter_type, filter_value, range_start, range_end):
+    carrier = get_paid_order_frame("carrier_revenue_orders_distribution", current_date, filter_type, filter_value, range_start, range_end)
+    carrier['carrier'] = fill(carrier['carrier'], 'Neuvedené')
 
     try:
-        bar_revenue = go.Bar(
-            x=carrier_df['carrier'],
-            y=carrier_df['total_revenue'],
+        bar_revenue = trace(
+            "bar",
+            x=carrier['carrier'],
+            y=carrier['total_revenue'],
             name='Príjmy',
             marker=dict(color='rgba(0, 100, 200, 0.7)'),
             offsetgroup='1',
         )
 
-        bar_count = go.Bar(
-            x=carrier_df['carrier'],
-            y=carrier_df['total_count'],
+        bar_count = trace(
+            "bar",
+            x=carrier['carrier'],
+            y=carrier['total_count'],
             name='Objednávky',
             marker=dict(color='rgba(255, 150, 0, 0.6)'),
             yaxis='y2',
@@ -322,7 +294,7 @@ def get_carrier_revenue_orders_distribution():
 
         data = [bar_revenue, bar_count]
 
-        layout = go.Layout(
+        layout = figure_layout(
             title='Príjmy / objednávky podľa dopravcu',
             barmode='group',
             height=400,
@@ -343,31 +315,21 @@ def get_carrier_revenue_orders_distribution():
             ),
         )
 
-        fig = go.Figure(data=data, layout=layout)
+        fig = figure_json(data, layout)
 
     except Exception as e:
-        return jsonify({})
+        return None
 
-    del carrier_df
-    gc.collect()
+    return fig
 
-    return Response(fig.to_json(), content_type='application/json')
-
-@dashboard_blueprint.route('/get-top-manufacturer-revenue-distribution', methods=['GET'])
-@login_required
-def get_top_manufacturer_revenue_distribution():
-    current_date, filter_type, filter_value, range_end, range_start = get_date_range_filter()
-
-    query = apply_period_filter(dashboard_queries["top_manufacturer_revenue_distribution"], current_date, filter_type, filter_value,
-                                range_start, range_end)
-
-    with dwh_engine.connect() as conn:
-        tmr_df = pd.read_sql_query(text(query), conn)
+def build_top_manufacturer_revenue_distribution(current_date, filter_type, filter_value, range_start, range_end):
+    tmr = get_paid_order_frame("top_manufacturer_revenue_distribution", current_date, filter_type, filter_value, range_start, range_end)
 
     try:
-        h_bar_trace = go.Bar(
-            x=tmr_df['total_revenue'],
-            y=tmr_df['manufacturer'],
+        h_bar_trace = trace(
+            "bar",
+            x=tmr['total_revenue'],
+            y=tmr['manufacturer'],
             orientation='h',
             name='Príjmy',
             # marker=dict(color='rgb(55, 83, 109)')
@@ -375,7 +337,7 @@ def get_top_manufacturer_revenue_distribution():
 
         data = [h_bar_trace,]
 
-        layout = go.Layout(
+        layout = figure_layout(
             title='Top 10 značiek podľa objemu predaja',
             height=400,
             grid=dict(rows=1, columns=1, pattern='independent'),
@@ -391,70 +353,56 @@ def get_top_manufacturer_revenue_distribution():
             autosize=True,
         )
 
-        fig = go.Figure(data=data, layout=layout)
+        fig = figure_json(data, layout)
     except Exception as e:
-        return jsonify({})
+        return None
 
-    gc.collect()
+    return fig
 
-    return Response(fig.to_json(), content_type='application/json')
-
-@dashboard_blueprint.route('/get-top-market-group-revenue-distribution', methods=['GET'])
-@login_required
-def get_market_group_revenue_distribution():
-    current_date, filter_type, filter_value, range_end, range_start = get_date_range_filter()
-
-    query = apply_period_filter(dashboard_queries["market_group_revenue_distribution"], current_date, filter_type, filter_value,
-                                range_start, range_end)
-
-    with dwh_engine.connect() as conn:
-        tmgr_df = pd.read_sql_query(text(query), conn)
-        tmgr_df['total_revenue'] = tmgr_df['total_revenue'].round(0)
-        tmgr_df['parent'] = ''
+def build_market_group_revenue_distribution(current_date, filter_type, filter_value, range_start, range_end):
+    tmgr = get_paid_order_frame("market_group_revenue_distribution", current_date, filter_type, filter_value, range_start, range_end)
+    tmgr['total_revenue'] = round_values(tmgr['total_revenue'])
+    tmgr['parent'] = np.full(len(tmgr['market_group']), '', dtype=object)
 
 
     try:
-        treemap_trace = go.Treemap(
-            labels=tmgr_df['market_group'],
-            parents=tmgr_df['parent'],
-            values=tmgr_df['total_revenue'],
+        treemap_trace = trace(
+            "treemap",
+            labels=tmgr['market_group'],
+            parents=tmgr['parent'],
+            values=tmgr['total_revenue'],
             hovertemplate='<b>%{label}</b><br>Príjmy: %{value:,.0f} €<br>Podiel: %{percentParent:.1%}<extra></extra>',
-            texttemplate='<b>%{label}</b><br>%{value:,.0f} €<br>100,0%' if len(tmgr_df) < 2 else '<b>%{label}</b><br>%{value:,.0f} €<br>%{percentParent:.1%}',
+            texttemplate='<b>%{label}</b><br>%{value:,.0f} €<br>100,0%' if len(tmgr['market_group']) < 2 else '<b>%{label}</b><br>%{value:,.0f} €<br>%{percentParent:.1%}',
             marker=dict(line=dict(width=0),),
             branchvalues="total",
         )
 
         data = [treemap_trace,]
 
-        layout = go.Layout(
+        layout = figure_layout(
             title='Rozdelenie príjmov podľa marketingovej kategórie',
             height=400,
             autosize=True,
         )
 
-        fig = go.Figure(data=data, layout=layout)
+        fig = figure_json(data, layout)
     except Exception as e:
-        return jsonify({})
-
-    gc.collect()
+        return None
 
-    return Response(fig.to_json(), content_type='application/json')
+    return fig
 
-@dashboard_blueprint.route('/get-gender-distribution', methods=['GET'])
-@login_required
-def get_gender_distribution():
-    current_date, filter_type, filter_value, range_end, range_start = get_date_range_filter()
-
-    query = apply_period_filter(dashboard_queries["gender_distribution"], current_date, filter_type, filter_value, range_start, range_end)
+def build_gender_distribution(current_date, filter_type, filter_value, range_start, range_end):
+    params = period_params(current_date, filter_type, filter_value, range_start, range_end)
 
     with dwh_engine.connect() as conn:
-        gender_df = pd.read_sql_query(text(query), conn)
-        gender_df['gender'] = gender_df['gender'].replace({'Pán': 'Muž', 'Pani': 'Žena'}).fillna('Neuvedené')
+        gender = fetch_columns(conn, compiled_dashboard_queries["gender_distribution"], params)
+        gender['gender'] = fill(replace(gender['gender'], {'Pán': 'Muž', 'Pani': 'Žena'}), 'Neuvedené')
 
     try:
-        pie_trace = go.Pie(
-            labels=gender_df['gender'],
-            values=gender_df['customers_count'],
+        pie_trace = trace(
+            "pie",
+            labels=gender['gender'],
+            values=gender['customers_count'],
             name="Rozdelenie zákazníkov podľa pohlavia",
             textinfo="label+percent",
             hoverinfo="label+value+percent",
@@ -464,18 +412,94 @@ def get_gender_distribution():
 
         data = [pie_trace]
 
-        layout = go.Layout(
+        layout = figure_layout(
             title="Rozdelenie zákazníkov podľa pohlavia",
             height=400,
             grid=dict(rows=1, columns=1, pattern='independent'),
             autosize=True
         )
 
-        fig = go.Figure(data=data, layout=layout)
+        fig = figure_json(data, layout)
     except Exception as e:
-        return jsonify({})
+        return None
+
+    return fig
+
+DASHBOARD_WIDGETS = {
+    "summary": build_summary,
+    "period_revenue": build_period_revenue,
+    "orders_heatmap": build_orders_heatmap,
+    "carrier_revenue_orders_distribution": build_carrier_revenue_orders_distribution,
+    "top_manufacturer_revenue_distribution": build_top_manufacturer_revenue_distribution,
+    "market_group_revenue_distribution": build_market_group_revenue_distribution,
+    "gender_distribution": build_gender_distribution,
+}
+
+def get_widget_json(widget_id, current_date, filter_type, filter_value, range_start, range_end):
+    params = period_params(current_date, filter_type, filter_value, range_start, range_end)
+    body = cached_json(widget_id, get_period_key(params), lambda: DASHBOARD_WIDGETS[widget_id](current_date, filter_type, filter_value, range_start, range_end))
+    return body if body is not None else '{}'
+
+def get_widgets_json(widget_ids, current_date, filter_type, filter_value, range_start, range_end):
+    futures = [(widget_id, dashboard_pool.submit(get_widget_json, widget_id, current_date, filter_type, filter_value, range_start, range_end)) for widget_id in widget_ids if widget_id in DASHBOARD_WIDGETS]
+
+    parts = []
+    for widget_id, future in futures:
+        try:
+            body = future.result()
+        except Exception as e:
+            print(f"Chyba pri načítavaní údajov pre {widget_id}: {e}")
+            body = '{}'
+        parts.append(f"{json.dumps(widget_id)}: {body}")
 
-    del gender_df
-    gc.collect()
+    return "{" + ", ".join(parts) + "}"
 
-    return Response(fig.to_json(), content_type='application/json')
\ No newline at end of file
+def widget_response(widget_id):
+    current_date, filter_type, filter_value, range_end, range_start = get_date_range_filter()
+    params = period_params(current_date, filter_type, filter_value, range_start, range_end)
+    return cached_response(widget_id, get_period_key(params), lambda: DASHBOARD_WIDGETS[widget_id](current_date, filter_type, filter_value, range_start, range_end))
+
+@dashboard_blueprint.route('/get-summary', methods=['GET'])
+@login_required
+def get_summary():
+    return widget_response("summary")
+
+@dashboard_blueprint.route('/get-period-revenue', methods=['GET'])
+@login_required
+def get_period_revenue():
+    return widget_response("period_revenue")
+
+@dashboard_blueprint.route('/get-orders-heatmap', methods=['GET'])
+@login_required
+def get_orders_heatmap():
+    return widget_response("orders_heatmap")
+
+@dashboard_blueprint.route('/get-carrier-revenue-orders-distribution', methods=['GET'])
+@login_required
+def get_carrier_revenue_orders_distribution():
+    return widget_response("carrier_revenue_orders_distribution")
+
+@dashboard_blueprint.route('/get-top-manufacturer-revenue-distribution', methods=['GET'])
+@login_required
+def get_top_manufacturer_revenue_distribution():
+    return widget_response("top_manufacturer_revenue_distribution")
+
+@dashboard_blueprint.route('/get-top-market-group-revenue-distribution', methods=['GET'])
+@login_required
+def get_market_group_revenue_distribution():
+    return widget_response("market_group_revenue_distribution")
+
+@dashboard_blueprint.route('/get-gender-distribution', methods=['GET'])
+@login_required
+def get_gender_distribution():
+    return widget_response("gender_distribution")
+
+@dashboard_blueprint.route('/get-dashboard-data', methods=['GET'])
+@login_required
+def get_dashboard_data():
+    current_date, filter_type, filter_value, range_end, range_start = get_date_range_filter()
+    widgets = request.args.get("widgets")
+    widget_ids = widgets.split(",") if widgets else list(DASHBOARD_WIDGETS)
+    body = get_widgets_json(widget_ids, current_date, filter_type, filter_value, range_start, range_end)
+    etag = build_etag(body)
+    return not_modified_response(etag) or json_response(body, etag)
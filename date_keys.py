@@ -0,0 +1,9 @@
+from datetime import date
+
+# dim_date covers this range, date_key 1 is DIM_DATE_START
+DIM_DATE_START = date(2000, 1, 1)
+DIM_DATE_END = date(2030, 12, 31)
+
+
+def date_to_key(value):
+    return (value - DIM_DATE_START).days + 1
@@ -0,0 +1,93 @@
+import threading
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+from celeryconfig import PROD_DB_URI, STAGE_DB_URI, DWH_DB_URI
+
+DATABASE_URIS = {
+    "prod": PROD_DB_URI,
+    "stage": STAGE_DB_URI,
+    "dwh": DWH_DB_URI,
+}
+
+# statement_timeout in milliseconds, None leaves long ETL statements unlimited
+ENGINE_ROLES = {
+    "web": {"pool_size": 5, "max_overflow": 5, "pool_timeout": 10, "statement_timeout": 30000},
+    "worker": {"pool_size": 2, "max_overflow": 2, "pool_timeout": 60, "statement_timeout": None},
+    "admin": {"pool_size": 1, "max_overflow": 0, "pool_timeout": 5, "statement_timeout": 5000},
+}
+
+POOL_RECYCLE = 1800
+
+engines = {}
+engines_lock = threading.Lock()
+
+
+def driver_options(db_uri):
+    if db_uri.startswith("postgresql+psycopg:"):
+        return {"connect_args": {"prepare_threshold": 1}}
+    return {}
+
+def set_statement_timeout(engine, backend, timeout):
+    if backend == "postgresql":
+        statement = f"SET statement_timeout = {int(timeout)}"
+    elif backend == "mysql":
+        statement = f"SET SESSION max_execution_time = {int(timeout)}"
+    else:
+        return
+
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute(statement)
+        except Exception as e:
+            print(f"Časový limit dopytov nie je možné nastaviť: {e}")
+        finally:
+            cursor.close()
+        if backend == "postgresql" and not dbapi_connection.autocommit:
+            dbapi_connection.commit()
+
+def build_engine(database, role):
+    db_uri = DATABASE_URIS[database]
+    backend = make_url(db_uri).get_backend_name()
+    config = ENGINE_ROLES[role]
+
+    options = driver_options(db_uri) if database == "dwh" else {}
+    if backend != "sqlite":
+        options.update(
+            pool_size=config["pool_size"],
+            max_overflow=config["max_overflow"],
+            pool_timeout=config["pool_timeout"],
+            pool_recycle=POOL_RECYCLE,
+            pool_pre_ping=True,
+        )
+
+    engine = create_engine(db_uri, **options)
+    if config["statement_timeout"] is not None:
+        set_statement_timeout(engine, backend, config["statement_timeout"])
+    return engine
+
+def get_engine(database, role="web"):
+    key = (database, role)
+    with engines_lock:
+        if key not in engines:
+            engines[key] = build_engine(database, role)
+        return engines[key]
+
+def dispose_engines():
+    with engines_lock:
+        for engine in engines.values():
+            engine.dispose(close=False)
+
+def pool_stats():
+    stats = []
+    with engines_lock:
+        for (database, role), engine in sorted(engines.items()):
+            pool = engine.pool
+            stat = {"database": database, "role": role, "status": pool.status()}
+            if isinstance(pool, QueuePool):
+                stat.update(pool_size=pool.size(), checked_in=pool.checkedin(), checked_out=pool.checkedout(), overflow=pool.overflow())
+            stats.append(stat)
+    return stats
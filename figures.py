@@ -0,0 +1,171 @@
+import os
+import json
+import math
+import base64
+import datetime
+from decimal import Decimal
+
+import numpy as np
+
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+FIGURE_TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'plotly_template.json')
+
+TYPED_ARRAY_DTYPES = {
+    "int8": "i1",
+    "uint8": "u1",
+    "int16": "i2",
+    "uint16": "u2",
+    "int32": "i4",
+    "uint32": "u4",
+    "float32": "f4",
+    "float64": "f8",
+}
+
+NAMED_COLORSCALES = {
+    "RdBu_r": [[0.0, "rgb(5,48,97)"], [0.1, "rgb(33,102,172)"], [0.2, "rgb(67,147,195)"], [0.3, "rgb(146,197,222)"], [0.4, "rgb(209,229,240)"], [0.5, "rgb(247,247,247)"], [0.6, "rgb(253,219,199)"], [0.7, "rgb(244,165,130)"], [0.8, "rgb(214,96,77)"], [0.9, "rgb(178,24,43)"], [1.0, "rgb(103,0,31)"]],
+}
+
+ARRAY_TYPES = (np.ndarray,) if pd is None else (np.ndarray, pd.Series, pd.Index)
+
+# long daily series are summed into the first coarser calendar granularity that fits
+MAX_CHART_POINTS = 120
+
+DATE_FORMAT_GRANULARITY = {
+    "YYYY-MM-DD": "day",
+    "MM": "month",
+}
+
+GRANULARITY_TITLES = {
+    "day": "dni",
+    "week": "týždne",
+    "month": "mesiace",
+    "quarter": "štvrťroky",
+    "year": "roky",
+}
+
+figure_template = {"layout": None}
+
+
+def get_figure_template():
+    if figure_template["layout"] is None:
+        if os.path.exists(FIGURE_TEMPLATE_PATH):
+            with open(FIGURE_TEMPLATE_PATH, encoding='utf-8') as f:
+                figure_template["layout"] = json.load(f)
+        else:
+            import plotly.graph_objects as go
+            figure_template["layout"] = json.loads(go.Figure().to_json())["layout"]["template"]
+    return figure_template["layout"]
+
+def clean_value(value):
+    if isinstance(value, (np.generic,)):
+        value = value.item()
+    if isinstance(value, float):
+        return None if math.isnan(value) or math.isinf(value) else value
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime.date, datetime.datetime, datetime.time)):
+        return value.isoformat()
+    if pd is not None and (value is pd.NaT or value is pd.NA):
+        return None
+    return value
+
+def to_list(values):
+    return [clean_property(value) for value in np.asarray(values).tolist()]
+
+def to_array(values):
+    values = np.asarray(values)
+    if values.size == 0:
+        return []
+
+    if values.dtype == np.int64:
+        for dtype in (np.int8, np.int16, np.int32):
+            info = np.iinfo(dtype)
+            if values.min() >= info.min and values.max() <= info.max:
+                values = values.astype(dtype)
+                break
+    elif values.dtype == np.uint64:
+        for dtype in (np.uint8, np.uint16, np.uint32):
+            if values.max() <= np.iinfo(dtype).max:
+                values = values.astype(dtype)
+                break
+
+    dtype = TYPED_ARRAY_DTYPES.get(str(values.dtype))
+    if dtype is None:
+        return to_list(values)
+
+    typed_array = {"dtype": dtype, "bdata": base64.b64encode(np.ascontiguousarray(values)).decode("ascii")}
+    if values.ndim > 1:
+        typed_array["shape"] = str(values.shape)[1:-1]
+    return typed_array
+
+def clean_property(value, key=None):
+    if isinstance(value, ARRAY_TYPES):
+        return to_array(value)
+    if isinstance(value, dict):
+        return {k: clean_property(v, k) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_list(v) if isinstance(v, ARRAY_TYPES) else clean_property(v) for v in value]
+    if key == "title" and isinstance(value, str):
+        return {"text": value}
+    if key == "colorscale" and isinstance(value, str) and value in NAMED_COLORSCALES:
+        return NAMED_COLORSCALES[value]
+    return clean_value(value)
+
+def period_labels(dates, granularity):
+    if granularity == "week":
+        # 1970-01-01 was a Thursday, weeks are labelled by their Monday
+        return np.datetime_as_string(dates - (dates.astype(np.int64) + 3) % 7, unit='D')
+    if granularity == "month":
+        return np.datetime_as_string(dates.astype('datetime64[M]'), unit='M')
+    if granularity == "quarter":
+        months = dates.astype('datetime64[M]').astype(np.int64)
+        return np.char.add(np.char.add((months // 12 + 1970).astype(str), "-Q"), (months % 12 // 3 + 1).astype(str))
+    return np.datetime_as_string(dates.astype('datetime64[Y]'), unit='Y')
+
+def downsample_periods(periods, values, date_format, max_points=MAX_CHART_POINTS):
+    granularity = DATE_FORMAT_GRANULARITY.get(date_format)
+    periods = np.asarray(periods)
+    values = np.asarray(values, dtype=np.float64)
+    if granularity != "day" or len(periods) <= max_points:
+        return periods, values, granularity
+
+    dates = np.asarray(periods.astype(str), dtype='datetime64[D]')
+    for granularity in ("week", "month", "quarter", "year"):
+        labels, inverse = np.unique(period_labels(dates, granularity), return_inverse=True)
+        if len(labels) <= max_points:
+            break
+
+    return labels.astype(object), np.bincount(inverse, weights=np.nan_to_num(values), minlength=len(labels)), granularity
+
+def period_axis_title(title, granularity):
+    if granularity in GRANULARITY_TITLES:
+        return f"{title} ({GRANULARITY_TITLES[granularity]})"
+    return title
+
+def trace(trace_type, **properties):
+    result = clean_property(properties)
+    result["type"] = trace_type
+    return result
+
+def layout(**properties):
+    return clean_property(properties)
+
+def figure(data, figure_layout):
+    return {"data": data, "layout": dict(figure_layout, template=get_figure_template())}
+
+def dumps(value):
+    if orjson is not None:
+        return orjson.dumps(value).decode("utf-8")
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+def figure_json(data, figure_layout):
+    return dumps(figure(data, figure_layout))
@@ -0,0 +1,80 @@
+import json
+import datetime
+import threading
+from sqlalchemy import text
+
+from reportsconfig import filter_queries
+
+filter_menus_state = {"key": None, "menus": None}
+filter_menus_lock = threading.Lock()
+
+
+def fetch_filter_catalogue_source(conn):
+    min_date = conn.execute(text(filter_queries["min_date"])).scalar()
+    month_names = {int(row.month): row.month_name for row in conn.execute(text(filter_queries["month_names"])).fetchall()}
+    return min_date, month_names
+
+def build_filter_catalogue(self, dwh_engine):
+    if self is not None and self.is_aborted():
+        print("Úloha zrušená")
+        return
+
+    print("Vytváranie katalógu filtrov...")
+
+    with dwh_engine.begin() as conn:
+        min_date, month_names = fetch_filter_catalogue_source(conn)
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS public.filter_catalogue (
+                id INTEGER PRIMARY KEY,
+                min_date DATE,
+                month_names TEXT NOT NULL,
+                updated_at TIMESTAMP NOT NULL
+            );
+        """))
+        conn.execute(text("""
+            INSERT INTO public.filter_catalogue (id, min_date, month_names, updated_at)
+            VALUES (1, :min_date, :month_names, :updated_at)
+            ON CONFLICT (id) DO UPDATE
+            SET min_date = EXCLUDED.min_date,
+                month_names = EXCLUDED.month_names,
+                updated_at = EXCLUDED.updated_at;
+        """), {"min_date": min_date, "month_names": json.dumps(month_names), "updated_at": datetime.datetime.now()})
+
+    print("Katalóg filtrov bol vytvorený.")
+
+def load_filter_catalogue(dwh_engine):
+    with dwh_engine.connect() as conn:
+        if conn.execute(text("SELECT to_regclass('public.filter_catalogue')")).scalar() is not None:
+            row = conn.execute(text("SELECT min_date, month_names FROM public.filter_catalogue WHERE id = 1")).fetchone()
+            if row is not None:
+                return row.min_date, {int(month): name for month, name in json.loads(row.month_names).items()}
+
+        return fetch_filter_catalogue_source(conn)
+
+def build_filter_menus(min_date, month_names, current_date):
+    months, quarters, years = [], [], []
+    if min_date is None or min_date > current_date:
+        return months, quarters, years
+
+    for year in range(current_date.year, min_date.year - 1, -1):
+        first_month = min_date.month if year == min_date.year else 1
+        last_month = current_date.month if year == current_date.year else 12
+        years.append({"year": year})
+        for month in range(first_month, last_month + 1):
+            months.append({"month_name": month_names.get(month, str(month)), "year": year, "month": month})
+        for quarter in range((first_month - 1) // 3 + 1, (last_month - 1) // 3 + 2):
+            quarters.append({"quarter": quarter, "year": year})
+
+    return months, quarters, years
+
+def get_filter_menus(dwh_engine, version):
+    current_date = datetime.date.today()
+    key = (version, current_date)
+
+    with filter_menus_lock:
+        if filter_menus_state["key"] != key:
+            min_date, month_names = load_filter_catalogue(dwh_engine)
+            filter_menus_state["menus"] = build_filter_menus(min_date, month_names, current_date)
+            filter_menus_state["key"] = key
+
+        return filter_menus_state["menus"]
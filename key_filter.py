@@ -0,0 +1,149 @@
+import os
+import math
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+
+FACT_KEY_FILTER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'filters')
+
+FACT_KEY_FILTERS_CONFIG = {
+    "fact_cart_line": {
+        "surrogate_key": "cartline_key",
+        "keys": ["cartid_bk", "product_sk", "customer_sk"],
+    },
+    "fact_order_line": {
+        "surrogate_key": "orderline_key",
+        "keys": ["orderid_bk", "orderdetailid_bk", "product_sk"],
+    },
+    "fact_order_history": {
+        "surrogate_key": "orderhistory_key",
+        "keys": ["orderhistoryid_bk", "orderid_bk", "orderstateid_bk"],
+    },
+}
+
+def mix64(values):
+    values = (values ^ (values >> np.uint64(30))) * np.uint64(0xbf58476d1ce4e5b9)
+    values = (values ^ (values >> np.uint64(27))) * np.uint64(0x94d049bb133111eb)
+    return values ^ (values >> np.uint64(31))
+
+def hash_keys(columns):
+    hashed = np.full(len(columns[0]), 0x9e3779b97f4a7c15, dtype=np.uint64)
+    for column in columns:
+        hashed = mix64(hashed ^ np.asarray(column, dtype=np.int64).astype(np.uint64))
+    return hashed
+
+class KeyFilter:
+    def __init__(self, path, capacity, error_rate=0.01):
+        self.path = path
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(64, int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))))
+        self.hash_count = max(1, int(round(self.size / capacity * math.log(2))))
+        self.bits = np.zeros((self.size + 7) // 8, dtype=np.uint8)
+        self.count = 0
+        self.last_key = 0
+        # rows with surrogate key <= last_key when the filter was saved, a mismatch means the table was rebuilt
+        self.covered_rows = 0
+
+    def positions(self, columns):
+        first = hash_keys(columns)
+        second = mix64(first ^ np.uint64(0x632be59bd9b4e019)) | np.uint64(1)
+        for i in range(self.hash_count):
+            yield (first + np.uint64(i) * second) % np.uint64(self.size)
+
+    def add(self, columns):
+        if len(columns[0]) == 0:
+            return
+        for position in self.positions(columns):
+            np.bitwise_or.at(self.bits, (position >> np.uint64(3)).astype(np.int64), (np.uint8(1) << (position & np.uint64(7)).astype(np.uint8)))
+        self.count += len(columns[0])
+
+    def might_contain(self, columns):
+        result = np.ones(len(columns[0]), dtype=bool)
+        if len(columns[0]) == 0:
+            return result
+        for position in self.positions(columns):
+            result &= (self.bits[(position >> np.uint64(3)).astype(np.int64)] & (np.uint8(1) << (position & np.uint64(7)).astype(np.uint8))) != 0
+        return result
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, bits=self.bits, meta=np.array([self.capacity, self.count, self.last_key, self.covered_rows], dtype=np.int64), error_rate=np.array([self.error_rate]))
+        os.replace(tmp_path, self.path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            capacity, count, last_key, covered_rows = (int(value) for value in data['meta'])
+            key_filter = cls(path, capacity, float(data['error_rate'][0]))
+            if data['bits'].shape != key_filter.bits.shape:
+                raise ValueError(f"Neplatný filter kľúčov {path}")
+            key_filter.bits = data['bits'].copy()
+        key_filter.count = count
+        key_filter.last_key = last_key
+        key_filter.covered_rows = covered_rows
+        return key_filter
+
+def table_fingerprint(conn, table_name, surrogate_key, last_key):
+    row = conn.execute(text(f"""
+    SELECT COUNT(*) AS covered_rows, MAX({surrogate_key}) AS max_key
+    FROM dma_dwh.public.{table_name}
+    WHERE {surrogate_key} <= :last_key
+    """), {"last_key": last_key}).fetchone()
+    return int(row.covered_rows or 0), int(row.max_key or 0)
+
+def load_fact_key_filter(dwh_engine, table_name, capacity=10000000, error_rate=0.01, chunksize=100000):
+    config = FACT_KEY_FILTERS_CONFIG[table_name]
+    path = os.path.join(FACT_KEY_FILTER_DIR, f"{table_name}.npz")
+
+    key_filter = None
+    if os.path.exists(path):
+        try:
+            key_filter = KeyFilter.load(path)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Filter kľúčov {path} nie je možné načítať: {e}")
+
+    with dwh_engine.connect() as conn:
+        row_count = conn.execute(text(f"SELECT COUNT(*) FROM dma_dwh.public.{table_name}")).scalar() or 0
+        if key_filter is not None and key_filter.last_key > 0:
+            if table_fingerprint(conn, table_name, config["surrogate_key"], key_filter.last_key) != (key_filter.covered_rows, key_filter.last_key):
+                print(f"Tabuľka `{table_name}` sa zmenila mimo načítania, filter kľúčov sa vytvorí znova.")
+                key_filter = None
+
+    if key_filter is None or key_filter.capacity < row_count * 1.2:
+        key_filter = KeyFilter(path, max(capacity, int(row_count * 2)), error_rate)
+
+    query = text(f"""
+    SELECT {config["surrogate_key"]} AS surrogate_key, {", ".join(config["keys"])}
+    FROM dma_dwh.public.{table_name}
+    WHERE {config["surrogate_key"]} > :last_key
+    ORDER BY {config["surrogate_key"]};
+    """)
+
+    added = 0
+    with dwh_engine.connect().execution_options(stream_results=True) as conn:
+        for chunk in pd.read_sql_query(query, con=conn, params={"last_key": key_filter.last_key}, chunksize=chunksize):
+            if chunk.empty:
+                continue
+            key_filter.add([chunk[column].to_numpy() for column in config["keys"]])
+            key_filter.last_key = int(chunk['surrogate_key'].max())
+            key_filter.covered_rows += len(chunk)
+            added += len(chunk)
+
+    if added > 0 or not os.path.exists(path):
+        key_filter.save()
+
+    return key_filter
+
+def save_fact_key_filter(dwh_engine, table_name, key_filter):
+    config = FACT_KEY_FILTERS_CONFIG[table_name]
+
+    with dwh_engine.connect() as conn:
+        row = conn.execute(text(f"SELECT MAX({config['surrogate_key']}) AS last_key, COUNT(*) AS covered_rows FROM dma_dwh.public.{table_name}")).fetchone()
+
+    key_filter.last_key = int(row.last_key or 0)
+    key_filter.covered_rows = int(row.covered_rows or 0)
+    key_filter.save()
@@ -3,13 +3,36 @@ from sqlalchemy import text
 import hashlib
 from datetime import date, datetime
 import gc
+from key_filter import load_fact_key_filter, save_fact_key_filter
+from sketches import update_sketches
+from partitions import ensure_fact_partitions
+from date_keys import DIM_DATE_START, DIM_DATE_END
 
+bridge_changed_keys = {
+    "productattributeid_bk": None,
+    "attributeid_bk": None,
+}
+
+
+# low-cardinality text columns are dictionary-encoded as soon as a chunk is read,
+# null_values are dropped from the categories instead of replacing them in every row
+def to_category(chunk, columns, null_values=()):
+    for column in columns:
+        values = chunk[column].astype('category')
+        removed = [value for value in null_values if value in values.cat.categories]
+        chunk[column] = values.cat.remove_categories(removed) if removed else values
+    return chunk
+
+def none_if_na(value):
+    return None if pd.isna(value) else value
 
 def create_date_frame(start, end):
     dates_range = pd.date_range(start=start, end=end, freq='D')
 
     df = pd.DataFrame({'date': dates_range})
 
+    df['date_key'] = (df['date'] - pd.Timestamp(DIM_DATE_START)).dt.days + 1
+
     df['year'] = df['date'].dt.year
     df['quarter'] = df['date'].dt.quarter
     df['month'] = df['date'].dt.month
@@ -29,16 +52,25 @@ def load_dim_date(self, stage_engine, dwh_engine):
 
     print('Spracovanie `dim_date` sa začalo...')
 
-    start = '2000-01-01'
-    end = '2030-12-31'
-
-    df_date = create_date_frame(start, end)
+    df_date = create_date_frame(DIM_DATE_START, DIM_DATE_END)
 
     with dwh_engine.begin() as conn:
         conn.execute(text('SET session_replication_role = replica;'))
         conn.execute(text('TRUNCATE TABLE public.dim_date RESTART IDENTITY CASCADE;'))
         conn.execute(text('SET session_replication_role = DEFAULT;'))
         df_date.to_sql('dim_date', conn, if_exists='append', index=False, schema='public')
+        conn.execute(text("SELECT setval(pg_get_serial_sequence('public.dim_date', 'date_key'), (SELECT MAX(date_key) FROM public.dim_date));"))
+
+        row = conn.execute(text("""
+            SELECT
+                COUNT(*) AS row_count,
+                MIN(date_key) AS min_key,
+                MAX(date_key) AS max_key,
+                COUNT(*) FILTER (WHERE date_key <> date - CAST(:start AS DATE) + 1) AS misplaced
+            FROM public.dim_date;
+        """), {"start": DIM_DATE_START}).fetchone()
+        if row.min_key != 1 or row.max_key != row.row_count or row.misplaced > 0:
+            raise ValueError("Kľúče `dim_date` nie sú súvislé.")
 
     print('Spracovanie `dim_date` dokončené.')
 
@@ -74,7 +106,7 @@ def load_dim_time(self, stage_engine, dwh_engine):
     print('Spracovanie `dim_time` dokončené.')
 
 def calc_hash_dim_address(row):
-    data = f"{row['addressid_bk']}-{row['country']}-{row['state']}-{row['city']}-{row['zipcode']}"
+    data = f"{row['addressid_bk']}-{none_if_na(row['country'])}-{none_if_na(row['state'])}-{row['city']}-{row['zipcode']}"
     return hashlib.md5(data.encode('utf-8')).hexdigest()
 
 def load_dim_address(self, stage_engine, dwh_engine):
@@ -84,19 +116,17 @@ def load_dim_address(self, stage_engine, dwh_engine):
 
     stage_query = """
     SELECT
-        a.id_address AS addressid_bk,
-        a.id_customer AS customerid_bk,
-        c.name AS country,
-        s.name AS state,
-        a.city,
-        a.postcode AS zipcode,
-        a.date_add AS valid_from
+        addressid_bk,
+        customerid_bk,
+        country,
+        state,
+        city,
+        zipcode,
+        valid_from
     FROM
-        sg_address a
-        LEFT JOIN sg_country c ON c.id_country = a.id_country
-        LEFT JOIN sg_state s ON s.id_state = a.id_state
+        sg_address_enriched
     ORDER BY
-        a.id_address;
+        addressid_bk;
     """
 
     print('Spracovanie `dim_address` sa začalo...')
@@ -114,8 +144,7 @@ def load_dim_address(self, stage_engine, dwh_engine):
 
             print('Spracovanie bloku...')
 
-            chunk['country'] = chunk['country'].replace('', None)
-            chunk['state'] = chunk['state'].replace('', None)
+            chunk = to_category(chunk, ['country', 'state'], null_values=[''])
             chunk['city'] = chunk['city'].replace('', None)
 
             chunk['row_hash_stage'] = chunk.apply(calc_hash_dim_address, axis=1)
@@ -154,8 +183,8 @@ def load_dim_address(self, stage_engine, dwh_engine):
                     conn.execute(insert_sql, {
                         'addressid_bk': row['addressid_bk'],
                         'customerid_bk': row['customerid_bk_stage'],
-                        'country': row['country_stage'],
-                        'state': row['state_stage'],
+                        'country': None if pd.isna(row['country_stage']) else row['country_stage'],
+                        'state': None if pd.isna(row['state_stage']) else row['state_stage'],
                         'city': row['city_stage'],
                         'zipcode': row['zipcode_stage'],
                         'valid_from': valid_from,
@@ -189,8 +218,8 @@ def load_dim_address(self, stage_engine, dwh_engine):
                     conn.execute(insert_sql, {
                         'addressid_bk': row['addressid_bk'],
                         'customerid_bk': row['customerid_bk_stage'],
-                        'country': row['country_stage'],
-                        'state': row['state_stage'],
+                        'country': None if pd.isna(row['country_stage']) else row['country_stage'],
+                        'state': None if pd.isna(row['state_stage']) else row['state_stage'],
                         'city': row['city_stage'],
                         'zipcode': row['zipcode_stage'],
                         'valid_from': today,
@@ -211,7 +240,7 @@ def load_dim_address(self, stage_engine, dwh_engine):
     return
 
 def calc_hash_dim_customer(row):
-    data = f"{row['customerid_bk']}-{row['hashedemail']}-{row['defaultgroup']}-{row['birthday']}-{row['gender']}-{row['businessaccount']}-{row['active']}"
+    data = f"{row['customerid_bk']}-{row['hashedemail']}-{row['defaultgroup']}-{row['birthday']}-{none_if_na(row['gender'])}-{row['businessaccount']}-{row['active']}"
     return hashlib.md5(data.encode('utf-8')).hexdigest()
 
 def load_dim_customer(self, stage_engine, dwh_engine):
@@ -220,18 +249,18 @@ def load_dim_customer(self, stage_engine, dwh_engine):
         return
     stage_query = """
     SELECT
-        c.id_customer AS customerid_bk,
-        c.hashed_login AS hashedemail,
-        (SELECT gr.name FROM sg_customer_group cg JOIN sg_group gr ON gr.id_group = cg.id_group WHERE cg.id_group = c.id_default_group ORDER BY gr.id_group DESC LIMIT 1) AS defaultgroup,
-        c.birthday,
-        (SELECT gen.name FROM sg_gender AS gen WHERE gen.id_gender = c.id_gender ORDER BY gen.id_gender DESC LIMIT 1) AS gender,
-        ((SELECT cc.id_customer FROM sg_customer_company cc WHERE cc.id_customer = c.id_customer ORDER BY cc.id_customer DESC LIMIT 1) IS NOT NULL) AS businessaccount,
-        c.active AS active,
-        c.date_add AS valid_from
+        customerid_bk,
+        hashedemail,
+        defaultgroup,
+        birthday,
+        gender,
+        businessaccount,
+        active,
+        valid_from
     FROM
-        sg_customer AS c
+        sg_customer_enriched
     ORDER BY
-        c.id_customer;
+        customerid_bk;
     """
 
     print('Spracovanie `dim_customer` sa začalo...')
@@ -249,8 +278,7 @@ def load_dim_customer(self, stage_engine, dwh_engine):
 
             print('Spracovanie bloku...')
 
-            chunk['gender'] = chunk['gender'].replace('[neuvádzam]', None)
-
+            chunk = to_category(chunk, ['gender'], null_values=['[neuvádzam]'])
             chunk['row_hash_stage'] = chunk.apply(calc_hash_dim_customer, axis=1)
             business_keys = chunk['customerid_bk'].unique().tolist()
 
@@ -291,7 +319,7 @@ def load_dim_customer(self, stage_engine, dwh_engine):
                         'hashedemail': row['hashedemail_stage'],
                         'defaultgroup': row['defaultgroup_stage'],
                         'birthdate': row['birthday'],
-                        'gender': row['gender_stage'],
+                        'gender': None if pd.isna(row['gender_stage']) else row['gender_stage'],
                         'businessaccount': row['businessaccount_stage'],
                         'active': row['active_stage'],
                         'valid_from': valid_from,
@@ -327,7 +355,7 @@ def load_dim_customer(self, stage_engine, dwh_engine):
                         'hashedemail': row['hashedemail_stage'],
                         'defaultgroup': row['defaultgroup_stage'],
                         'birthdate': row['birthday'],
-                        'gender': row['gender_stage'],
+                        'gender': None if pd.isna(row['gender_stage']) else row['gender_stage'],
                         'businessaccount': row['businessaccount_stage'],
                         'active': row['active_stage'],
                         'valid_from': today,
@@ -372,6 +400,8 @@ def load_dim_attribute(self, stage_engine, dwh_engine):
     print('Spracovanie `dim_attribute` sa začalo...')
 
     chunksize = 10000
+    bridge_changed_keys["attributeid_bk"] = None
+    changed_keys = set()
 
     with stage_engine.connect().execution_options(stream_results=True) as conn:
         for chunk in pd.read_sql_query(text(stage_query), con=conn, chunksize=chunksize):
@@ -407,6 +437,7 @@ def load_dim_attribute(self, stage_engine, dwh_engine):
 
             new_records = merged[merged['attribute_key'].isnull()] if 'attribute_key' in merged.columns else merged
             changed_records = merged[(merged['attribute_key'].notnull()) & (merged['row_hash_stage'] != merged['row_hash_dim'])]
+            changed_keys.update(new_records['attributeid_bk'].tolist())
 
             for idx, row in new_records.iterrows():
                 insert_sql = text("""
@@ -448,6 +479,8 @@ def load_dim_attribute(self, stage_engine, dwh_engine):
             del chunk
             gc.collect()
 
+    bridge_changed_keys["attributeid_bk"] = changed_keys
+
     print("Spracovanie `dim_attribute` dokončené.")
     return
 
@@ -462,25 +495,21 @@ def load_dim_product(self, stage_engine, dwh_engine):
 
     stage_query = """
     SELECT
-        p.id_product AS productid_bk,
-        p.id_product_attribute AS productattributeid_bk,
-        p.name AS productname,
-        m.name AS manufacturer,
-        c.name AS defaultcategory,
-        p.group AS market_group,
-        p.subgroup AS market_subgroup,
-        p.gender AS market_gender,
-        p.price,
-        p.active,
-        p.date_add AS valid_from
+        productid_bk,
+        productattributeid_bk,
+        productname,
+        manufacturer,
+        defaultcategory,
+        market_group,
+        market_subgroup,
+        market_gender,
+        price,
+        active,
+        valid_from
     FROM
-        sg_product AS p
-    LEFT JOIN 
-        sg_manufacturer m ON p.id_manufacturer = m.id_manufacturer
-    LEFT JOIN
-        sg_category c ON p.id_category_default = c.id_category
+        sg_product_enriched
     ORDER BY
-        p.id_product;
+        productid_bk;
     """
 
     print('Spracovanie `dim_product` sa začalo...')
@@ -489,6 +518,8 @@ def load_dim_product(self, stage_engine, dwh_engine):
     valid_to = today - pd.DateOffset(days=1)
     min_date = datetime(2000, 1, 1)
     chunksize = 10000
+    bridge_changed_keys["productattributeid_bk"] = None
+    changed_keys = set()
 
     with stage_engine.connect().execution_options(stream_results=True) as conn:
         for chunk in pd.read_sql_query(text(stage_query), con=conn, chunksize=chunksize):
@@ -541,6 +572,8 @@ def load_dim_product(self, stage_engine, dwh_engine):
 
             new_records = merged[merged['product_key'].isnull()] if 'product_key' in merged.columns else merged
             changed_records = merged[(merged['product_key'].notnull()) & (merged['row_hash_stage'] != merged['row_hash_dim'])]
+            changed_keys.update(new_records['productattributeid_bk'].tolist())
+            changed_keys.update(changed_records['productattributeid_bk'].tolist())
 
             for idx, row in new_records.iterrows():
                 insert_sql = text("""
@@ -613,68 +646,157 @@ def load_dim_product(self, stage_engine, dwh_engine):
             del chunk
             gc.collect()
 
+    bridge_changed_keys["productattributeid_bk"] = changed_keys
+
     print("Spracovanie `dim_product` dokončené.")
     return
 
-def load_bridge_product_attribute(self, stage_engine, dwh_engine):
-    if self is not None and self.is_aborted():
-        print("Úloha zrušená")
-        return
-
-    query = """
-    SELECT
-        pac.id_product_attribute,
-        pac.id_attribute,
-        dp.product_key,
-        da.attribute_key,
-        bpa.product_sk,
-        bpa.attribute_sk
-    FROM
-        dma_stage.dma_db_stage.sg_product_attribute_combination pac
-    JOIN
-        dma_stage.public.dim_product_fdw dp ON pac.id_product_attribute = dp.productattributeid_bk
-    JOIN
-        dma_stage.public.dim_attribute_fdw da ON pac.id_attribute = da.attributeid_bk
-    LEFT JOIN
-        dma_stage.public.bridge_product_attribute_fdw bpa ON dp.product_key = bpa.product_sk AND da.attribute_key = bpa.attribute_sk
-    WHERE bpa.product_sk IS NULL
-    ORDER BY pac.id_product_attribute;
-    """
-
-    print('Spracovanie `bridge_product_attribute` sa začalo...')
-
-    chunksize = 10000
-
+def copy_bridge_pairs(self, stage_engine, dwh_conn, stage_query, params, target_table, chunksize=10000):
     with stage_engine.connect().execution_options(stream_results=True) as conn:
-        for chunk in pd.read_sql_query(text(query), con=conn, chunksize=chunksize):
+        for chunk in pd.read_sql_query(text(stage_query), con=conn, params=params, chunksize=chunksize):
             if self is not None and self.is_aborted():
                 print("Úloha zrušená")
-                return
-
-            print('Spracovanie bloku...')
+                return False
 
-            insert_sql = text("""
-            INSERT INTO dma_dwh.public.bridge_product_attribute (product_sk, attribute_sk, productattributeid_bk, attributeid_bk)
-            VALUES (:product_sk, :attribute_sk, :id_product_attribute, :id_attribute)
-            """)
+            if chunk.empty:
+                continue
 
-            with dwh_engine.begin() as conn:
-                for _, row in chunk.iterrows():
-                    conn.execute(insert_sql, {
-                        'product_sk': int(row['product_key']),
-                        'attribute_sk': int(row['attribute_key']),
-                        'id_product_attribute': int(row['id_product_attribute']),
-                        'id_attribute': int(row['id_attribute'])
-                    })
+            print('Spracovanie bloku...')
 
-                    if self is not None and self.is_aborted():
-                        print("Úloha zrušená")
-                        return
+            values_clause = ", ".join(f"({int(a)}, {int(b)})" for a, b in zip(chunk['id_product_attribute'], chunk['id_attribute']))
+            dwh_conn.execute(text(f"INSERT INTO {target_table} (productattributeid_bk, attributeid_bk) VALUES {values_clause};"))
 
             del chunk
             gc.collect()
 
-    print("Spracovanie `bridge_product_attribute` dokončené.")
+    return True
+
+def load_bridge_product_attribute(self, stage_engine, dwh_engine):
+    if self is not None and self.is_aborted():
+        print("Úloha zrušená")
+        return
+
+    # combinations already loaded into the bridge, diffed against the stage on the next run
+    with stage_engine.begin() as conn:
+        conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS sg_bridge_product_attribute_loaded (
+            id_product_attribute BIGINT NOT NULL,
+            id_attribute BIGINT NOT NULL,
+            PRIMARY KEY (id_product_attribute, id_attribute)
+        );
+        """))
+        has_loaded = conn.execute(text("SELECT EXISTS (SELECT 1 FROM sg_bridge_product_attribute_loaded)")).scalar()
+
+    product_keys = bridge_changed_keys["productattributeid_bk"]
+    attribute_keys = bridge_changed_keys["attributeid_bk"]
+    full_scan = product_keys is None or attribute_keys is None or not has_loaded
+
+    if full_scan:
+        stage_query = """
+        SELECT pac.id_product_attribute, pac.id_attribute
+        FROM sg_product_attribute_combination pac
+        ORDER BY pac.id_product_attribute;
+        """
+        params = {}
+    else:
+        # pairs of changed dimension rows plus combinations added since the last load
+        stage_query = """
+        SELECT pac.id_product_attribute, pac.id_attribute
+        FROM sg_product_attribute_combination pac
+        WHERE pac.id_product_attribute = ANY(:product_keys) OR pac.id_attribute = ANY(:attribute_keys)
+        UNION
+        (
+            SELECT pac.id_product_attribute, pac.id_attribute
+            FROM sg_product_attribute_combination pac
+            EXCEPT
+            SELECT bl.id_product_attribute, bl.id_attribute
+            FROM sg_bridge_product_attribute_loaded bl
+        )
+        ORDER BY 1;
+        """
+        params = {"product_keys": [int(key) for key in product_keys], "attribute_keys": [int(key) for key in attribute_keys]}
+
+    removed_query = """
+    SELECT bl.id_product_attribute, bl.id_attribute
+    FROM sg_bridge_product_attribute_loaded bl
+    EXCEPT
+    SELECT pac.id_product_attribute, pac.id_attribute
+    FROM sg_product_attribute_combination pac
+    ORDER BY 1;
+    """
+
+    print('Spracovanie `bridge_product_attribute` sa začalo...')
+
+    with dwh_engine.begin() as dwh_conn:
+        dwh_conn.execute(text("""
+        CREATE TEMPORARY TABLE tmp_bridge_source (
+            productattributeid_bk BIGINT NOT NULL,
+            attributeid_bk BIGINT NOT NULL
+        ) ON COMMIT DROP;
+        CREATE TEMPORARY TABLE tmp_bridge_removed (
+            productattributeid_bk BIGINT NOT NULL,
+            attributeid_bk BIGINT NOT NULL
+        ) ON COMMIT DROP;
+        """))
+
+        if not copy_bridge_pairs(self, stage_engine, dwh_conn, stage_query, params, "tmp_bridge_source"):
+            return
+        if not full_scan and not copy_bridge_pairs(self, stage_engine, dwh_conn, removed_query, {}, "tmp_bridge_removed"):
+            return
+
+        dwh_conn.execute(text("ANALYZE tmp_bridge_source;"))
+
+        insert_sql = text("""
+        INSERT INTO dma_dwh.public.bridge_product_attribute (product_sk, attribute_sk, productattributeid_bk, attributeid_bk)
+        SELECT DISTINCT dp.product_key, da.attribute_key, src.productattributeid_bk, src.attributeid_bk
+        FROM tmp_bridge_source src
+        JOIN dma_dwh.public.dim_product dp ON dp.productattributeid_bk = src.productattributeid_bk AND dp.valid_to = '9999-12-31'
+        JOIN dma_dwh.public.dim_attribute da ON da.attributeid_bk = src.attributeid_bk
+        WHERE NOT EXISTS (
+            SELECT 1 FROM dma_dwh.public.bridge_product_attribute bpa
+            WHERE bpa.product_sk = dp.product_key AND bpa.attribute_sk = da.attribute_key
+        );
+        """)
+        inserted = dwh_conn.execute(insert_sql).rowcount
+
+        if self is not None and self.is_aborted():
+            print("Úloha zrušená")
+            return
+
+        delete_sql = """
+        DELETE FROM dma_dwh.public.bridge_product_attribute bpa
+        USING dma_dwh.public.dim_product dp
+        WHERE bpa.product_sk = dp.product_key
+          AND dp.valid_to = '9999-12-31'
+          {scope}
+          AND NOT EXISTS (
+            SELECT 1 FROM tmp_bridge_source src
+            WHERE src.productattributeid_bk = bpa.productattributeid_bk AND src.attributeid_bk = bpa.attributeid_bk
+          );
+        """
+        if full_scan:
+            deleted = dwh_conn.execute(text(delete_sql.format(scope=""))).rowcount
+        else:
+            deleted = dwh_conn.execute(text(delete_sql.format(scope="AND (bpa.productattributeid_bk = ANY(:product_keys) OR bpa.attributeid_bk = ANY(:attribute_keys))")), params).rowcount
+            deleted += dwh_conn.execute(text("""
+            DELETE FROM dma_dwh.public.bridge_product_attribute bpa
+            USING tmp_bridge_removed removed
+            WHERE bpa.productattributeid_bk = removed.productattributeid_bk AND bpa.attributeid_bk = removed.attributeid_bk;
+            """)).rowcount
+
+    with stage_engine.begin() as conn:
+        conn.execute(text("TRUNCATE sg_bridge_product_attribute_loaded;"))
+        conn.execute(text("""
+        INSERT INTO sg_bridge_product_attribute_loaded (id_product_attribute, id_attribute)
+        SELECT DISTINCT pac.id_product_attribute, pac.id_attribute
+        FROM sg_product_attribute_combination pac
+        WHERE pac.id_product_attribute IS NOT NULL AND pac.id_attribute IS NOT NULL;
+        """))
+
+    bridge_changed_keys["productattributeid_bk"] = None
+    bridge_changed_keys["attributeid_bk"] = None
+
+    print(f"Spracovanie `bridge_product_attribute` dokončené, pridané: {inserted}, odstránené: {deleted}.")
     return
 
 def calc_hash_load_dim_order_state(row):
@@ -817,6 +939,7 @@ def load_fact_cart_line(self, stage_engine, dwh_engine):
     print('Spracovanie `fact_cart_line` sa začalo...')
 
     chunksize = 10000
+    key_filter = load_fact_key_filter(dwh_engine, 'fact_cart_line')
 
     with stage_engine.connect().execution_options(stream_results=True) as conn:
         for chunk in pd.read_sql_query(text(stage_query), con=conn, chunksize=chunksize):
@@ -831,27 +954,32 @@ def load_fact_cart_line(self, stage_engine, dwh_engine):
             chunk['dp_product_key'] = chunk['dp_product_key'].fillna(0).astype('int64')
             chunk['dc_customer_key'] = chunk['dc_customer_key'].fillna(0).astype('int64')
 
-            key_list = list(zip(chunk['sgcp_id_cart'], chunk['dp_product_key'], chunk['dc_customer_key']))
-            values_clause = ", ".join(f"({int(a)}, {int(b)}, {int(c)})" for a, b, c in key_list)
-            query_fact = f"""
-            SELECT st.cartid_bk, st.product_sk, st.customer_sk
-            FROM (
-                VALUES {values_clause}
-            ) AS st(cartid_bk, product_sk, customer_sk)
-            LEFT JOIN dma_dwh.public.fact_cart_line fc
-              ON st.cartid_bk = fc.cartid_bk
-              AND st.product_sk = fc.product_sk
-              AND st.customer_sk = fc.customer_sk
-            WHERE fc.cartid_bk IS NULL;
-            """
+            key_columns = [chunk['sgcp_id_cart'].to_numpy(), chunk['dp_product_key'].to_numpy(), chunk['dc_customer_key'].to_numpy()]
+            maybe_loaded = key_filter.might_contain(key_columns)
+            existing_keys = set(zip(*(column[~maybe_loaded] for column in key_columns)))
+            key_list = list(zip(*(column[maybe_loaded] for column in key_columns)))
+
+            if key_list:
+                values_clause = ", ".join(f"({int(a)}, {int(b)}, {int(c)})" for a, b, c in key_list)
+                query_fact = f"""
+                SELECT st.cartid_bk, st.product_sk, st.customer_sk
+                FROM (
+                    VALUES {values_clause}
+                ) AS st(cartid_bk, product_sk, customer_sk)
+                LEFT JOIN dma_dwh.public.fact_cart_line fc
+                  ON st.cartid_bk = fc.cartid_bk
+                  AND st.product_sk = fc.product_sk
+                  AND st.customer_sk = fc.customer_sk
+                WHERE fc.cartid_bk IS NULL;
+                """
+                df_fact = pd.read_sql_query(text(query_fact), dwh_engine)
+                existing_keys.update(df_fact[['cartid_bk', 'product_sk', 'customer_sk']].itertuples(index=False, name=None))
 
-            df_fact = pd.read_sql_query(text(query_fact), dwh_engine)
             if self is not None and self.is_aborted():
                 print("Úloha zrušená")
                 return
 
-            if not df_fact.empty:
-                existing_keys = set(df_fact[['cartid_bk', 'product_sk', 'customer_sk']].itertuples(index=False, name=None))
+            if existing_keys:
                 chunk = chunk[chunk.apply(lambda row: (row['sgcp_id_cart'], row['dp_product_key'], row['dc_customer_key']) in existing_keys, axis=1)]
 
                 chunk['sgc_date_add'] = pd.to_datetime(chunk['sgc_date_add'], utc=True)
@@ -884,6 +1012,8 @@ def load_fact_cart_line(self, stage_engine, dwh_engine):
                 merged = merged.fillna({'date_key': 0, 'time_key': 0})
                 merged = merged.astype({'date_key': 'int64', 'time_key': 'int64'})
 
+                ensure_fact_partitions(dwh_engine, 'fact_cart_line', merged['date_key'].unique())
+
                 for _, row in merged.iterrows():
                     insert_sql = text("""
                     INSERT INTO dma_dwh.public.fact_cart_line (cartid_bk, product_sk, customer_sk, date_sk, time_sk, quantity)
@@ -903,12 +1033,17 @@ def load_fact_cart_line(self, stage_engine, dwh_engine):
                         print("Úloha zrušená")
                         return
 
+                key_filter.add([merged['sgcp_id_cart'].to_numpy(), merged['dp_product_key'].to_numpy(), merged['dc_customer_key'].to_numpy()])
+
                 del df_date
                 del df_time
                 del merged
             del chunk
             gc.collect()
 
+    save_fact_key_filter(dwh_engine, 'fact_cart_line', key_filter)
+    update_sketches(dwh_engine, 'fact_cart_line')
+
     print("Spracovanie `fact_cart_line` dokončené.")
     return
 
@@ -955,6 +1090,7 @@ def load_fact_order_line(self, stage_engine, dwh_engine):
     print('Spracovanie `fact_order_line` sa začalo...')
 
     chunksize = 10000
+    key_filter = load_fact_key_filter(dwh_engine, 'fact_order_line')
 
     with stage_engine.connect().execution_options(stream_results=True) as conn:
         for chunk in pd.read_sql_query(text(stage_query), con=conn, chunksize=chunksize):
@@ -964,35 +1100,39 @@ def load_fact_order_line(self, stage_engine, dwh_engine):
 
             print('Spracovanie bloku...')
 
+            chunk = to_category(chunk, ['sgo_carrier'], null_values=[''])
+            chunk = to_category(chunk, ['sgo_payment'])
             chunk = chunk[chunk['dp_product_key'].notnull() & chunk['dc_customer_key'].notnull()]
             chunk['dp_product_key'] = chunk['dp_product_key'].fillna(0).astype('int64')
 
-            key_list = list(zip(chunk['sgod_id_order'], chunk['sgod_id_order_detail'], chunk['dp_product_key']))
-            values_clause = ", ".join(f"({int(a)}, {int(b)}, {int(c)})" for a, b, c in key_list)
-            query_fact = f"""
-            SELECT st.orderid_bk, st.orderdetailid_bk, st.product_sk
-            FROM (
-                VALUES {values_clause}
-            ) AS st(orderid_bk, orderdetailid_bk, product_sk)
-            LEFT JOIN dma_dwh.public.fact_order_line fol
-              ON st.orderid_bk = fol.orderid_bk
-              AND st.orderdetailid_bk = fol.orderdetailid_bk
-              AND st.product_sk = fol.product_sk
-            WHERE fol.orderid_bk IS NULL;
-            """
-
-            df_fact = pd.read_sql_query(text(query_fact), dwh_engine)
+            key_columns = [chunk['sgod_id_order'].to_numpy(), chunk['sgod_id_order_detail'].to_numpy(), chunk['dp_product_key'].to_numpy()]
+            maybe_loaded = key_filter.might_contain(key_columns)
+            existing_keys = set(zip(*(column[~maybe_loaded] for column in key_columns)))
+            key_list = list(zip(*(column[maybe_loaded] for column in key_columns)))
+
+            if key_list:
+                values_clause = ", ".join(f"({int(a)}, {int(b)}, {int(c)})" for a, b, c in key_list)
+                query_fact = f"""
+                SELECT st.orderid_bk, st.orderdetailid_bk, st.product_sk
+                FROM (
+                    VALUES {values_clause}
+                ) AS st(orderid_bk, orderdetailid_bk, product_sk)
+                LEFT JOIN dma_dwh.public.fact_order_line fol
+                  ON st.orderid_bk = fol.orderid_bk
+                  AND st.orderdetailid_bk = fol.orderdetailid_bk
+                  AND st.product_sk = fol.product_sk
+                WHERE fol.orderid_bk IS NULL;
+                """
+                df_fact = pd.read_sql_query(text(query_fact), dwh_engine)
+                existing_keys.update(df_fact[['orderid_bk', 'orderdetailid_bk', 'product_sk']].itertuples(index=False, name=None))
 
             if self is not None and self.is_aborted():
                 print("Úloha zrušená")
                 return
 
-            if not df_fact.empty:
-                existing_keys = set(df_fact[['orderid_bk', 'orderdetailid_bk', 'product_sk']].itertuples(index=False, name=None))
+            if existing_keys:
                 chunk = chunk[chunk.apply(lambda row: (row['sgod_id_order'], row['sgod_id_order_detail'], row['dp_product_key']) in existing_keys, axis=1)]
 
-                chunk['sgo_carrier'] = chunk['sgo_carrier'].replace('', None)
-
                 chunk['sgo_date_add'] = pd.to_datetime(chunk['sgo_date_add'], utc=True)
                 date_add_list = chunk['sgo_date_add'].dt.date.tolist()
 
@@ -1023,6 +1163,10 @@ def load_fact_order_line(self, stage_engine, dwh_engine):
                 merged = merged.fillna({'date_key': 0, 'time_key': 0})
                 merged = merged.astype({'date_key': 'int64', 'time_key': 'int64'})
 
+                # fact_order is derived from these lines by load_fact_order, its months are created here too
+                ensure_fact_partitions(dwh_engine, 'fact_order_line', merged['date_key'].unique())
+                ensure_fact_partitions(dwh_engine, 'fact_order', merged['date_key'].unique())
+
                 for _, row in merged.iterrows():
                     insert_sql = text("""
                     INSERT INTO dma_dwh.public.fact_order_line (orderid_bk, orderdetailid_bk, cartid_bk, product_sk, customer_sk, address_sk, date_sk, time_sk, quantity, price, price_tax_incl, amount, amount_tax_incl, paid, paid_tax_incl, taxrate, conversion_rate, carrier, paymenttype)
@@ -1047,20 +1191,24 @@ def load_fact_order_line(self, stage_engine, dwh_engine):
                             'paid_tax_incl': row['sgo_total_paid_tax_incl'],
                             'taxrate': row['sgod_tax_rate'],
                             'conversion_rate': row['sgo_conversion_rate'],
-                            'carrier': row['sgo_carrier'],
-                            'paymenttype': row['sgo_payment'],
+                            'carrier': None if pd.isna(row['sgo_carrier']) else row['sgo_carrier'],
+                            'paymenttype': None if pd.isna(row['sgo_payment']) else row['sgo_payment'],
                         })
 
                     if self is not None and self.is_aborted():
                         print("Úloha zrušená")
                         return
 
+                key_filter.add([merged['sgod_id_order'].to_numpy(), merged['sgod_id_order_detail'].to_numpy(), merged['dp_product_key'].to_numpy()])
+
                 del df_date
                 del df_time
                 del merged
             del chunk
             gc.collect()
 
+    save_fact_key_filter(dwh_engine, 'fact_order_line', key_filter)
+
     print("Spracovanie `fact_order_line` dokončené.")
     return
 
@@ -1085,6 +1233,7 @@ def load_fact_order_history(self, stage_engine, dwh_engine):
     print('Spracovanie `fact_order_history` sa začalo...')
 
     chunksize = 10000
+    key_filter = load_fact_key_filter(dwh_engine, 'fact_order_history')
 
     with stage_engine.connect().execution_options(stream_results=True) as conn:
         for chunk in pd.read_sql_query(text(stage_query), con=conn, chunksize=chunksize):
@@ -1094,27 +1243,32 @@ def load_fact_order_history(self, stage_engine, dwh_engine):
 
             print('Spracovanie bloku...')
 
-            key_list = list(zip(chunk['sgoh_id_order_history'], chunk['sgoh_id_order'], chunk['sgoh_id_order_state']))
-            values_clause = ", ".join(f"({int(a)}, {int(b)}, {int(c)})" for a, b, c in key_list)
-            query_fact = f"""
-            SELECT st.orderhistoryid_bk, st.orderid_bk, st.orderstateid_bk
-            FROM (
-                VALUES {values_clause}
-            ) AS st(orderhistoryid_bk, orderid_bk, orderstateid_bk)
-            LEFT JOIN dma_dwh.public.fact_order_history fo
-                ON st.orderhistoryid_bk = fo.orderhistoryid_bk
-                AND st.orderid_bk = fo.orderid_bk
-                AND st.orderstateid_bk = fo.orderstateid_bk
-                WHERE fo.orderhistoryid_bk IS NULL;
-            """
+            key_columns = [chunk['sgoh_id_order_history'].to_numpy(), chunk['sgoh_id_order'].to_numpy(), chunk['sgoh_id_order_state'].to_numpy()]
+            maybe_loaded = key_filter.might_contain(key_columns)
+            existing_keys = set(zip(*(column[~maybe_loaded] for column in key_columns)))
+            key_list = list(zip(*(column[maybe_loaded] for column in key_columns)))
+
+            if key_list:
+                values_clause = ", ".join(f"({int(a)}, {int(b)}, {int(c)})" for a, b, c in key_list)
+                query_fact = f"""
+                SELECT st.orderhistoryid_bk, st.orderid_bk, st.orderstateid_bk
+                FROM (
+                    VALUES {values_clause}
+                ) AS st(orderhistoryid_bk, orderid_bk, orderstateid_bk)
+                LEFT JOIN dma_dwh.public.fact_order_history fo
+                    ON st.orderhistoryid_bk = fo.orderhistoryid_bk
+                    AND st.orderid_bk = fo.orderid_bk
+                    AND st.orderstateid_bk = fo.orderstateid_bk
+                    WHERE fo.orderhistoryid_bk IS NULL;
+                """
+                df_fact = pd.read_sql_query(text(query_fact), dwh_engine)
+                existing_keys.update(df_fact[['orderhistoryid_bk', 'orderid_bk', 'orderstateid_bk']].itertuples(index=False, name=None))
 
-            df_fact = pd.read_sql_query(text(query_fact), dwh_engine)
             if self is not None and self.is_aborted():
                 print("Úloha zrušená")
                 return
 
-            if not df_fact.empty:
-                existing_keys = set(df_fact[['orderhistoryid_bk', 'orderid_bk', 'orderstateid_bk']].itertuples(index=False, name=None))
+            if existing_keys:
                 chunk = chunk[chunk.apply(lambda row: (row['sgoh_id_order_history'], row['sgoh_id_order'], row['sgoh_id_order_state']) in existing_keys, axis=1)]
 
                 chunk['sgoh_date_add'] = pd.to_datetime(chunk['sgoh_date_add'], utc=True)
@@ -1147,6 +1301,8 @@ def load_fact_order_history(self, stage_engine, dwh_engine):
                 merged = merged.fillna({'date_key': 0, 'time_key': 0})
                 merged = merged.astype({'date_key': 'int64', 'time_key': 'int64'})
 
+                ensure_fact_partitions(dwh_engine, 'fact_order_history', merged['date_key'].unique())
+
                 for _, row in merged.iterrows():
                     insert_sql = text("""
                     INSERT INTO dma_dwh.public.fact_order_history (orderhistoryid_bk, orderstate_sk, orderid_bk, orderstateid_bk, date_sk, time_sk)
@@ -1166,12 +1322,16 @@ def load_fact_order_history(self, stage_engine, dwh_engine):
                         print("Úloha zrušená")
                         return
 
+                key_filter.add([merged['sgoh_id_order_history'].to_numpy(), merged['sgoh_id_order'].to_numpy(), merged['sgoh_id_order_state'].to_numpy()])
+
                 del df_date
                 del df_time
                 del merged
             del chunk
             gc.collect()
 
+    save_fact_key_filter(dwh_engine, 'fact_order_history', key_filter)
+
     print("Spracovanie `fact_order_history` dokončené.")
     return
 
@@ -1206,8 +1366,165 @@ def load_fact_order(self, stage_engine, dwh_engine):
     with dwh_engine.begin() as conn:
         conn.execute(text(query))
 
+    update_sketches(dwh_engine, 'fact_order')
+
+    if self is not None and self.is_aborted():
+        print("Úloha zrušená")
+        return
+
+    print("Spracovanie `fact_order` dokončené.")
+
+ORDER_LIFECYCLE_STATES = {
+    "paid": 2,
+    "shipped": 4,
+    "delivered": 5,
+    "cancelled": 6,
+    "refunded": 7,
+}
+
+def load_fact_order_snapshot(self, stage_engine, dwh_engine):
     if self is not None and self.is_aborted():
         print("Úloha zrušená")
         return
 
-    print("Spracovanie `fact_order` dokončené.")
\ No newline at end of file
+    create_query = """
+    CREATE TABLE IF NOT EXISTS public.fact_order_snapshot (
+        orderid_bk INTEGER PRIMARY KEY,
+        customer_sk INTEGER,
+        address_sk INTEGER,
+        order_date_sk INTEGER,
+        order_time_sk INTEGER,
+        paid_date_sk INTEGER,
+        paid_time_sk INTEGER,
+        paid NUMERIC,
+        paid_tax_incl NUMERIC,
+        carrier TEXT,
+        paymenttype TEXT,
+        first_state_bk INTEGER,
+        last_state_bk INTEGER,
+        first_state_at TIMESTAMP,
+        paid_at TIMESTAMP,
+        shipped_at TIMESTAMP,
+        delivered_at TIMESTAMP,
+        cancelled_at TIMESTAMP,
+        refunded_at TIMESTAMP,
+        last_state_at TIMESTAMP,
+        is_paid BOOLEAN NOT NULL,
+        is_shipped BOOLEAN NOT NULL,
+        is_delivered BOOLEAN NOT NULL,
+        is_cancelled BOOLEAN NOT NULL,
+        is_refunded BOOLEAN NOT NULL,
+        state_changes INTEGER NOT NULL,
+        last_orderhistory_key BIGINT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS fact_order_snapshot_paid_date_sk_idx ON public.fact_order_snapshot (paid_date_sk) WHERE is_paid;
+    CREATE INDEX IF NOT EXISTS fact_order_snapshot_order_date_sk_idx ON public.fact_order_snapshot (order_date_sk);
+    """
+
+    query = f"""
+    WITH touched_orders AS (
+        SELECT foh.orderid_bk FROM fact_order_history foh
+        WHERE foh.orderhistory_key > (SELECT COALESCE(MAX(last_orderhistory_key), 0) FROM public.fact_order_snapshot)
+        UNION
+        SELECT fo.orderid_bk FROM fact_order fo
+        WHERE NOT EXISTS (SELECT 1 FROM public.fact_order_snapshot fos WHERE fos.orderid_bk = fo.orderid_bk)
+    ),
+    history AS (
+        SELECT foh.orderid_bk, foh.orderhistory_key, foh.orderstateid_bk, foh.date_sk, foh.time_sk, dd.date + dt.time AS state_at
+        FROM fact_order_history foh
+        JOIN touched_orders t ON t.orderid_bk = foh.orderid_bk
+        LEFT JOIN dim_date dd ON foh.date_sk = dd.date_key
+        LEFT JOIN dim_time dt ON foh.time_sk = dt.time_key
+    ),
+    states AS (
+        SELECT
+            orderid_bk,
+            MAX(orderhistory_key) AS last_orderhistory_key,
+            COUNT(*) AS state_changes,
+            (ARRAY_AGG(orderstateid_bk ORDER BY orderhistory_key))[1] AS first_state_bk,
+            (ARRAY_AGG(orderstateid_bk ORDER BY orderhistory_key DESC))[1] AS last_state_bk,
+            (ARRAY_AGG(state_at ORDER BY orderhistory_key))[1] AS first_state_at,
+            (ARRAY_AGG(state_at ORDER BY orderhistory_key DESC))[1] AS last_state_at,
+            (ARRAY_AGG(date_sk ORDER BY orderhistory_key) FILTER (WHERE orderstateid_bk = {ORDER_LIFECYCLE_STATES["paid"]}))[1] AS paid_date_sk,
+            (ARRAY_AGG(time_sk ORDER BY orderhistory_key) FILTER (WHERE orderstateid_bk = {ORDER_LIFECYCLE_STATES["paid"]}))[1] AS paid_time_sk,
+            (ARRAY_AGG(state_at ORDER BY orderhistory_key) FILTER (WHERE orderstateid_bk = {ORDER_LIFECYCLE_STATES["paid"]}))[1] AS paid_at,
+            MIN(state_at) FILTER (WHERE orderstateid_bk = {ORDER_LIFECYCLE_STATES["shipped"]}) AS shipped_at,
+            MIN(state_at) FILTER (WHERE orderstateid_bk = {ORDER_LIFECYCLE_STATES["delivered"]}) AS delivered_at,
+            MIN(state_at) FILTER (WHERE orderstateid_bk = {ORDER_LIFECYCLE_STATES["cancelled"]}) AS cancelled_at,
+            MIN(state_at) FILTER (WHERE orderstateid_bk = {ORDER_LIFECYCLE_STATES["refunded"]}) AS refunded_at,
+            BOOL_OR(orderstateid_bk = {ORDER_LIFECYCLE_STATES["paid"]}) AS is_paid,
+            BOOL_OR(orderstateid_bk = {ORDER_LIFECYCLE_STATES["shipped"]}) AS is_shipped,
+            BOOL_OR(orderstateid_bk = {ORDER_LIFECYCLE_STATES["delivered"]}) AS is_delivered,
+            BOOL_OR(orderstateid_bk = {ORDER_LIFECYCLE_STATES["cancelled"]}) AS is_cancelled,
+            BOOL_OR(orderstateid_bk = {ORDER_LIFECYCLE_STATES["refunded"]}) AS is_refunded
+        FROM history
+        GROUP BY orderid_bk
+    )
+    INSERT INTO public.fact_order_snapshot (orderid_bk, customer_sk, address_sk, order_date_sk, order_time_sk, paid_date_sk, paid_time_sk, paid, paid_tax_incl, carrier, paymenttype, first_state_bk, last_state_bk, first_state_at, paid_at, shipped_at, delivered_at, cancelled_at, refunded_at, last_state_at, is_paid, is_shipped, is_delivered, is_cancelled, is_refunded, state_changes, last_orderhistory_key)
+    SELECT
+        fo.orderid_bk,
+        fo.customer_sk,
+        fo.address_sk,
+        fo.date_sk,
+        fo.time_sk,
+        s.paid_date_sk,
+        s.paid_time_sk,
+        fo.paid,
+        fo.paid_tax_incl,
+        fo.carrier,
+        fo.paymenttype,
+        s.first_state_bk,
+        s.last_state_bk,
+        s.first_state_at,
+        s.paid_at,
+        s.shipped_at,
+        s.delivered_at,
+        s.cancelled_at,
+        s.refunded_at,
+        s.last_state_at,
+        COALESCE(s.is_paid, FALSE),
+        COALESCE(s.is_shipped, FALSE),
+        COALESCE(s.is_delivered, FALSE),
+        COALESCE(s.is_cancelled, FALSE),
+        COALESCE(s.is_refunded, FALSE),
+        COALESCE(s.state_changes, 0),
+        COALESCE(s.last_orderhistory_key, 0)
+    FROM fact_order fo
+    JOIN touched_orders t ON t.orderid_bk = fo.orderid_bk
+    LEFT JOIN states s ON s.orderid_bk = fo.orderid_bk
+    ON CONFLICT (orderid_bk) DO UPDATE
+    SET customer_sk = EXCLUDED.customer_sk,
+        address_sk = EXCLUDED.address_sk,
+        order_date_sk = EXCLUDED.order_date_sk,
+        order_time_sk = EXCLUDED.order_time_sk,
+        paid_date_sk = EXCLUDED.paid_date_sk,
+        paid_time_sk = EXCLUDED.paid_time_sk,
+        paid = EXCLUDED.paid,
+        paid_tax_incl = EXCLUDED.paid_tax_incl,
+        carrier = EXCLUDED.carrier,
+        paymenttype = EXCLUDED.paymenttype,
+        first_state_bk = EXCLUDED.first_state_bk,
+        last_state_bk = EXCLUDED.last_state_bk,
+        first_state_at = EXCLUDED.first_state_at,
+        paid_at = EXCLUDED.paid_at,
+        shipped_at = EXCLUDED.shipped_at,
+        delivered_at = EXCLUDED.delivered_at,
+        cancelled_at = EXCLUDED.cancelled_at,
+        refunded_at = EXCLUDED.refunded_at,
+        last_state_at = EXCLUDED.last_state_at,
+        is_paid = EXCLUDED.is_paid,
+        is_shipped = EXCLUDED.is_shipped,
+        is_delivered = EXCLUDED.is_delivered,
+        is_cancelled = EXCLUDED.is_cancelled,
+        is_refunded = EXCLUDED.is_refunded,
+        state_changes = EXCLUDED.state_changes,
+        last_orderhistory_key = EXCLUDED.last_orderhistory_key;
+    """
+
+    print('Spracovanie `fact_order_snapshot` sa začalo...')
+
+    with dwh_engine.begin() as conn:
+        conn.execute(text(create_query))
+        result = conn.execute(text(query))
+
+    print(f"Spracovanie `fact_order_snapshot` dokončené, aktualizované objednávky: {result.rowcount}.")
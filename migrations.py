@@ -0,0 +1,334 @@
+import datetime
+
+from sqlalchemy import text
+
+from partitions import create_fact_tables
+from aggregates import create_aggregate_tables
+
+DIMENSION_TABLES_DDL = """
+CREATE TABLE IF NOT EXISTS public.dim_date (
+    date_key SERIAL PRIMARY KEY,
+    date DATE NOT NULL,
+    year INTEGER,
+    quarter INTEGER,
+    month INTEGER,
+    month_name TEXT,
+    day INTEGER,
+    day_of_week INTEGER,
+    day_name TEXT,
+    week_of_year INTEGER,
+    is_weekend BOOLEAN
+);
+CREATE TABLE IF NOT EXISTS public.dim_time (
+    time_key SERIAL PRIMARY KEY,
+    time TIME NOT NULL,
+    hour INTEGER
+);
+CREATE TABLE IF NOT EXISTS public.dim_address (
+    address_key SERIAL PRIMARY KEY,
+    addressid_bk INTEGER,
+    customerid_bk INTEGER,
+    country TEXT,
+    state TEXT,
+    city TEXT,
+    zipcode TEXT,
+    valid_from TIMESTAMP,
+    valid_to TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS public.dim_customer (
+    customer_key SERIAL PRIMARY KEY,
+    customerid_bk INTEGER,
+    hashedemail TEXT,
+    defaultgroup TEXT,
+    birthdate DATE,
+    gender TEXT,
+    businessaccount BOOLEAN,
+    active BOOLEAN,
+    valid_from TIMESTAMP,
+    valid_to TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS public.dim_attribute (
+    attribute_key SERIAL PRIMARY KEY,
+    attributeid_bk INTEGER,
+    attribute_name TEXT,
+    attribute_group TEXT
+);
+CREATE TABLE IF NOT EXISTS public.dim_product (
+    product_key SERIAL PRIMARY KEY,
+    productid_bk INTEGER,
+    productattributeid_bk INTEGER,
+    productname TEXT,
+    manufacturer TEXT,
+    defaultcategory TEXT,
+    market_group TEXT,
+    market_subgroup TEXT,
+    market_gender TEXT,
+    price NUMERIC,
+    active BOOLEAN,
+    valid_from TIMESTAMP,
+    valid_to TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS public.bridge_product_attribute (
+    product_sk INTEGER,
+    attribute_sk INTEGER,
+    productattributeid_bk INTEGER,
+    attributeid_bk INTEGER
+);
+CREATE TABLE IF NOT EXISTS public.dim_order_state (
+    orderstate_key SERIAL PRIMARY KEY,
+    orderstateid_bk INTEGER,
+    current_state TEXT,
+    valid_from TIMESTAMP,
+    valid_to TIMESTAMP
+);
+"""
+
+# name: (table, definition), the FDW subqueries of the loaders look up current rows by business key and valid_to
+DIMENSION_INDEXES = {
+    "dim_date_date_idx": ("dim_date", "(date)"),
+    "dim_date_year_month_idx": ("dim_date", "(year, month)"),
+    "dim_time_time_idx": ("dim_time", "(time)"),
+    "dim_address_addressid_bk_valid_to_idx": ("dim_address", "(addressid_bk, valid_to)"),
+    "dim_customer_customerid_bk_valid_to_idx": ("dim_customer", "(customerid_bk, valid_to)"),
+    "dim_attribute_attributeid_bk_idx": ("dim_attribute", "(attributeid_bk)"),
+    "dim_product_productid_bk_valid_to_idx": ("dim_product", "(productid_bk, productattributeid_bk, valid_to)"),
+    "dim_order_state_orderstateid_bk_valid_to_idx": ("dim_order_state", "(orderstateid_bk, valid_to)"),
+    "bridge_product_attribute_product_sk_idx": ("bridge_product_attribute", "(product_sk)"),
+    "bridge_product_attribute_bk_idx": ("bridge_product_attribute", "(productattributeid_bk, attributeid_bk)"),
+}
+
+# facts are appended in date order, so BRIN on date_sk stays small and selective
+FACT_INDEXES = {
+    "fact_cart_line_date_sk_brin": ("fact_cart_line", "USING brin (date_sk)"),
+    "fact_cart_line_natural_key_idx": ("fact_cart_line", "(cartid_bk, product_sk, customer_sk)"),
+    "fact_order_line_date_sk_brin": ("fact_order_line", "USING brin (date_sk)"),
+    "fact_order_line_natural_key_idx": ("fact_order_line", "(orderid_bk, orderdetailid_bk)"),
+    "fact_order_history_date_sk_brin": ("fact_order_history", "USING brin (date_sk)"),
+    "fact_order_history_orderhistoryid_bk_idx": ("fact_order_history", "(orderhistoryid_bk)"),
+    "fact_order_history_orderid_bk_idx": ("fact_order_history", "(orderid_bk)"),
+    "fact_order_date_sk_brin": ("fact_order", "USING brin (date_sk)"),
+    "fact_order_orderid_bk_idx": ("fact_order", "(orderid_bk)"),
+}
+
+# index-only scans for the dashboard and reportsconfig queries
+REPORT_INDEXES = {
+    "fact_cart_line_date_sk_cartid_bk_idx": ("fact_cart_line", "(date_sk) INCLUDE (cartid_bk)"),
+    "fact_order_line_date_sk_product_idx": ("fact_order_line", "(date_sk, product_sk) INCLUDE (orderid_bk, amount_tax_incl)"),
+    "fact_order_snapshot_customer_paid_idx": ("fact_order_snapshot", "(order_date_sk) INCLUDE (customer_sk, paid_tax_incl) WHERE is_paid"),
+}
+
+# join columns of the stage tables read by the loader queries, resolved through the stage search_path
+STAGE_INDEXES = {
+    "sg_cart_id_cart_idx": ("sg_cart", "(id_cart)"),
+    "sg_cart_product_id_cart_idx": ("sg_cart_product", "(id_cart)"),
+    "sg_orders_id_order_idx": ("sg_orders", "(id_order)"),
+    "sg_order_detail_id_order_idx": ("sg_order_detail", "(id_order)"),
+    "sg_order_history_id_order_history_idx": ("sg_order_history", "(id_order_history)"),
+    "sg_order_history_id_order_idx": ("sg_order_history", "(id_order)"),
+    "sg_customer_id_customer_idx": ("sg_customer", "(id_customer)"),
+    "sg_address_id_address_idx": ("sg_address", "(id_address)"),
+    "sg_product_id_product_idx": ("sg_product", "(id_product, id_product_attribute)"),
+}
+
+# migrations are applied once per database in version order, a migration whose tables
+# do not exist yet is skipped and retried on the next run
+MIGRATIONS_CONFIG = {
+    "dwh": [
+        {"version": 1, "name": "dimension_tables", "sql": DIMENSION_TABLES_DDL},
+        {"version": 2, "name": "fact_tables", "apply": create_fact_tables},
+        {"version": 3, "name": "aggregate_tables", "apply": create_aggregate_tables},
+        {"version": 4, "name": "dimension_indexes", "indexes": DIMENSION_INDEXES},
+        {"version": 5, "name": "fact_indexes", "indexes": FACT_INDEXES},
+        {"version": 6, "name": "report_indexes", "indexes": REPORT_INDEXES},
+    ],
+    "stage": [
+        {"version": 1, "name": "stage_indexes", "indexes": STAGE_INDEXES},
+    ],
+}
+
+ADVISOR_MIN_ROWS = 10000
+ADVISOR_SEQ_SCAN_RATIO = 1.0
+
+
+def create_migrations_table(conn):
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS public.schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP NOT NULL
+        );
+    """))
+
+def missing_tables(conn, table_names):
+    return [table_name for table_name in sorted(set(table_names)) if conn.execute(text("SELECT to_regclass(:table_name)"), {"table_name": table_name}).scalar() is None]
+
+def index_state(conn, index_name):
+    # None when the index does not exist, False when a failed concurrent build left it invalid
+    return conn.execute(text("""
+        SELECT i.indisvalid FROM pg_index i WHERE i.indexrelid = to_regclass(:index_name)
+    """), {"index_name": index_name}).scalar()
+
+def is_partitioned_table(conn, table_name):
+    return conn.execute(text("SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(:table_name)"), {"table_name": table_name}).scalar() is True
+
+def table_partitions(conn, table_name):
+    return [row.relname for row in conn.execute(text("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(:table_name)
+        ORDER BY c.relname
+    """), {"table_name": table_name})]
+
+# partitions created after the parent index already carry an attached copy of it
+def has_attached_index(conn, index_name, partition):
+    return conn.execute(text("""
+        SELECT EXISTS (
+            SELECT 1 FROM pg_inherits i
+            JOIN pg_index x ON x.indexrelid = i.inhrelid
+            WHERE i.inhparent = to_regclass(:index_name) AND x.indrelid = to_regclass(:partition)
+        )
+    """), {"index_name": index_name, "partition": partition}).scalar()
+
+def create_index_concurrently(conn, index_name, table_name, definition):
+    state = index_state(conn, index_name)
+    if state:
+        return
+    if state is False:
+        conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {index_name}"))
+    conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index_name} ON {table_name} {definition}"))
+
+def create_partitioned_index(conn, index_name, table_name, definition, partitions):
+    # the parent index stays invalid until every partition index is attached, writes are not blocked meanwhile
+    conn.execute(text(f"CREATE INDEX IF NOT EXISTS {index_name} ON ONLY {table_name} {definition}"))
+    for partition in partitions:
+        if has_attached_index(conn, index_name, partition):
+            continue
+        partition_index_name = f"{index_name[:48]}_{partition[-7:]}"
+        create_index_concurrently(conn, partition_index_name, partition, definition)
+        conn.execute(text(f"ALTER INDEX {index_name} ATTACH PARTITION {partition_index_name}"))
+
+def create_indexes(conn, indexes):
+    for index_name, (table_name, definition) in indexes.items():
+        if index_state(conn, index_name):
+            continue
+        print(f"Vytváranie indexu {index_name}...")
+        if is_partitioned_table(conn, table_name):
+            create_partitioned_index(conn, index_name, table_name, definition, table_partitions(conn, table_name))
+        else:
+            create_index_concurrently(conn, index_name, table_name, definition)
+
+def record_migration(engine, migration):
+    with engine.begin() as conn:
+        conn.execute(text("""
+            INSERT INTO public.schema_migrations (version, name, applied_at) VALUES (:version, :name, :applied_at)
+            ON CONFLICT (version) DO NOTHING
+        """), {"version": migration["version"], "name": migration["name"], "applied_at": datetime.datetime.now()})
+
+def apply_migration(engine, index_conn, migration):
+    if "indexes" in migration:
+        missing = missing_tables(index_conn, [table_name for table_name, _ in migration["indexes"].values()])
+        if missing:
+            print(f"Migrácia {migration['version']} ({migration['name']}) odložená, chýbajú tabuľky: {', '.join(missing)}")
+            return False
+        # CREATE INDEX CONCURRENTLY cannot run inside a transaction, only the bookkeeping below is transactional
+        create_indexes(index_conn, migration["indexes"])
+        record_migration(engine, migration)
+        return True
+
+    with engine.begin() as conn:
+        if "apply" in migration:
+            migration["apply"](conn)
+        else:
+            conn.execute(text(migration["sql"]))
+        conn.execute(text("""
+            INSERT INTO public.schema_migrations (version, name, applied_at) VALUES (:version, :name, :applied_at)
+        """), {"version": migration["version"], "name": migration["name"], "applied_at": datetime.datetime.now()})
+    return True
+
+def apply_migrations(self, database, engine):
+    if self is not None and self.is_aborted():
+        print("Úloha zrušená")
+        return 0
+
+    with engine.begin() as conn:
+        create_migrations_table(conn)
+
+    applied = 0
+    # a session advisory lock lets one worker migrate at a time without holding a transaction open
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as index_conn:
+        index_conn.execute(text("SELECT pg_advisory_lock(hashtext('schema_migrations'))"))
+        try:
+            done = {row.version for row in index_conn.execute(text("SELECT version FROM public.schema_migrations"))}
+
+            for migration in MIGRATIONS_CONFIG[database]:
+                if migration["version"] in done:
+                    continue
+                if self is not None and self.is_aborted():
+                    print("Úloha zrušená")
+                    break
+                print(f"Migrácia {migration['version']} ({migration['name']}) databázy {database}...")
+                if apply_migration(engine, index_conn, migration):
+                    applied += 1
+        finally:
+            index_conn.execute(text("SELECT pg_advisory_unlock(hashtext('schema_migrations'))"))
+
+    return applied
+
+def expected_indexes(database):
+    indexes = {}
+    for migration in MIGRATIONS_CONFIG[database]:
+        indexes.update(migration.get("indexes", {}))
+    return indexes
+
+def advise_indexes(database, engine):
+    with engine.connect() as conn:
+        existing = {row.indexname for row in conn.execute(text("SELECT indexname FROM pg_indexes WHERE schemaname = ANY (current_schemas(false))"))}
+
+        # partitions are reported under their parent table
+        rows = conn.execute(text("""
+            SELECT
+                COALESCE(parent.relname, s.relname) AS table_name,
+                SUM(s.seq_scan) AS seq_scan,
+                SUM(s.seq_tup_read) AS seq_tup_read,
+                SUM(COALESCE(s.idx_scan, 0)) AS idx_scan,
+                SUM(s.n_live_tup) AS live_rows
+            FROM pg_stat_user_tables s
+            LEFT JOIN pg_inherits i ON i.inhrelid = s.relid
+            LEFT JOIN pg_class parent ON parent.oid = i.inhparent
+            WHERE s.schemaname = ANY (current_schemas(false))
+            GROUP BY COALESCE(parent.relname, s.relname)
+        """)).fetchall()
+
+    missing = {}
+    for index_name, (table_name, definition) in expected_indexes(database).items():
+        if index_name not in existing:
+            missing.setdefault(table_name, []).append(f"{index_name} {definition}")
+
+    advice = []
+    for row in rows:
+        seq_scan = int(row.seq_scan or 0)
+        idx_scan = int(row.idx_scan or 0)
+        live_rows = int(row.live_rows or 0)
+        rows_per_scan = int(row.seq_tup_read or 0) // seq_scan if seq_scan else 0
+
+        reasons = []
+        if live_rows >= ADVISOR_MIN_ROWS and rows_per_scan >= ADVISOR_MIN_ROWS and seq_scan > idx_scan * ADVISOR_SEQ_SCAN_RATIO:
+            reasons.append("sekvenčné čítanie prevažuje nad indexami")
+        if row.table_name in missing:
+            reasons.append("chýbajú očakávané indexy")
+        if not reasons:
+            continue
+
+        advice.append({
+            "database": database,
+            "table": row.table_name,
+            "seq_scan": seq_scan,
+            "idx_scan": idx_scan,
+            "rows_per_seq_scan": rows_per_scan,
+            "live_rows": live_rows,
+            "missing_indexes": missing.get(row.table_name, []),
+            "reasons": reasons,
+        })
+
+    return sorted(advice, key=lambda item: item["seq_scan"] * item["rows_per_seq_scan"], reverse=True)
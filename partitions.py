@@ -0,0 +1,260 @@
+import datetime
+
+from sqlalchemy import text
+
+PARTITION_MONTHS_AHEAD = 3
+PARTITION_ARCHIVE_SCHEMA = 'archive'
+
+FACT_TABLES_CONFIG = {
+    "fact_cart_line": {
+        "key": "cartline_key",
+        "columns": """
+            cartid_bk INTEGER,
+            product_sk INTEGER,
+            customer_sk INTEGER,
+            date_sk INTEGER NOT NULL,
+            time_sk INTEGER,
+            quantity INTEGER
+        """,
+    },
+    "fact_order_line": {
+        "key": "orderline_key",
+        "columns": """
+            orderid_bk INTEGER,
+            orderdetailid_bk INTEGER,
+            cartid_bk INTEGER,
+            product_sk INTEGER,
+            customer_sk INTEGER,
+            address_sk INTEGER,
+            date_sk INTEGER NOT NULL,
+            time_sk INTEGER,
+            quantity INTEGER,
+            price NUMERIC,
+            price_tax_incl NUMERIC,
+            amount NUMERIC,
+            amount_tax_incl NUMERIC,
+            paid NUMERIC,
+            paid_tax_incl NUMERIC,
+            taxrate NUMERIC,
+            conversion_rate NUMERIC,
+            carrier TEXT,
+            paymenttype TEXT
+        """,
+    },
+    "fact_order_history": {
+        "key": "orderhistory_key",
+        "columns": """
+            orderhistoryid_bk INTEGER,
+            orderstate_sk INTEGER,
+            orderid_bk INTEGER,
+            orderstateid_bk INTEGER,
+            date_sk INTEGER NOT NULL,
+            time_sk INTEGER
+        """,
+    },
+    "fact_order": {
+        "key": "order_key",
+        "columns": """
+            orderid_bk INTEGER,
+            customer_sk INTEGER,
+            address_sk INTEGER,
+            date_sk INTEGER NOT NULL,
+            time_sk INTEGER,
+            paid NUMERIC,
+            paid_tax_incl NUMERIC,
+            taxrate NUMERIC,
+            conversion_rate NUMERIC,
+            paymenttype TEXT,
+            carrier TEXT
+        """,
+    },
+}
+
+# loaders fall back to date_sk 0 for dates missing in dim_date
+UNDATED_PARTITION = "undated"
+
+
+
+def partition_name(table_name, year, month):
+    return f"{table_name}_p{year:04d}{month:02d}"
+
+def sequence_name(table_name):
+    return f"{table_name}_{FACT_TABLES_CONFIG[table_name]['key']}_seq"
+
+def create_fact_tables(conn):
+    for table_name, config in FACT_TABLES_CONFIG.items():
+        conn.execute(text(f"""
+            CREATE SEQUENCE IF NOT EXISTS public.{sequence_name(table_name)};
+            CREATE TABLE IF NOT EXISTS public.{table_name} (
+                {config["key"]} BIGINT NOT NULL DEFAULT nextval('public.{sequence_name(table_name)}'),
+                {config["columns"]},
+                PRIMARY KEY ({config["key"]}, date_sk)
+            ) PARTITION BY RANGE (date_sk);
+        """))
+        # tables created by hand before partitioning stay heaps until partition_fact_table
+        if is_partitioned(conn, table_name):
+            conn.execute(text(f"CREATE TABLE IF NOT EXISTS public.{table_name}_{UNDATED_PARTITION} PARTITION OF public.{table_name} FOR VALUES FROM (MINVALUE) TO (1)"))
+
+def is_partitioned(conn, table_name):
+    return conn.execute(text("""
+        SELECT c.relkind = 'p'
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = 'public' AND c.relname = :table_name
+    """), {"table_name": table_name}).scalar() is True
+
+# partitions are created and detached by several workers, the lock is held until the transaction ends
+def lock_partitions(conn, table_name):
+    conn.execute(text("SELECT pg_advisory_xact_lock(hashtext(:lock_name))"), {"lock_name": f"partitions.{table_name}"})
+
+def load_partitions(conn, table_name):
+    rows = conn.execute(text("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        JOIN pg_namespace n ON n.oid = p.relnamespace
+        WHERE n.nspname = 'public' AND p.relname = :table_name
+    """), {"table_name": table_name}).fetchall()
+    return {row.relname for row in rows}
+
+def month_bounds(conn, start_key, end_key):
+    return conn.execute(text("""
+        SELECT year, month, MIN(date_key) AS start_key, MAX(date_key) + 1 AS end_key
+        FROM dim_date
+        WHERE (year, month) IN (
+            SELECT year, month FROM dim_date WHERE date_key BETWEEN :start_key AND :end_key
+        )
+        GROUP BY year, month
+        ORDER BY year, month;
+    """), {"start_key": start_key, "end_key": end_key}).fetchall()
+
+def create_partitions(conn, table_name, start_key, end_key):
+    if not is_partitioned(conn, table_name):
+        return []
+
+    lock_partitions(conn, table_name)
+    existing = load_partitions(conn, table_name)
+
+    created = []
+    for bounds in month_bounds(conn, start_key, end_key):
+        name = partition_name(table_name, bounds.year, bounds.month)
+        if name in existing:
+            continue
+        conn.execute(text(f"CREATE TABLE IF NOT EXISTS public.{name} PARTITION OF public.{table_name} FOR VALUES FROM ({bounds.start_key}) TO ({bounds.end_key})"))
+        existing.add(name)
+        created.append(name)
+    return created
+
+def ensure_fact_partitions(dwh_engine, table_name, date_keys):
+    date_keys = [int(key) for key in date_keys if key is not None and int(key) > 0]
+    if not date_keys:
+        return
+
+    with dwh_engine.begin() as conn:
+        create_partitions(conn, table_name, min(date_keys), max(date_keys))
+
+def maintain_fact_partitions(self, dwh_engine):
+    if self is not None and self.is_aborted():
+        print("Úloha zrušená")
+        return
+
+    today = datetime.date.today()
+    month = today.month - 1 + PARTITION_MONTHS_AHEAD
+    horizon = datetime.date(today.year + month // 12, month % 12 + 1, 1)
+
+    with dwh_engine.begin() as conn:
+        create_fact_tables(conn)
+        start_key, end_key = conn.execute(text("""
+            SELECT MIN(date_key), MAX(date_key) FROM dim_date WHERE date BETWEEN :start AND :end
+        """), {"start": today.replace(day=1), "end": horizon}).fetchone()
+        if start_key is None:
+            return
+
+        for table_name in FACT_TABLES_CONFIG:
+            created = create_partitions(conn, table_name, start_key, end_key)
+            if created:
+                print(f"Vytvorené partície tabuľky `{table_name}`: {', '.join(created)}")
+
+def partition_fact_table(self, dwh_engine, table_name):
+    config = FACT_TABLES_CONFIG[table_name]
+    key = config["key"]
+    legacy_name = f"{table_name}_unpartitioned"
+
+    with dwh_engine.begin() as conn:
+        lock_partitions(conn, table_name)
+        if is_partitioned(conn, table_name):
+            print(f"Tabuľka `{table_name}` je už rozdelená na partície.")
+            return
+
+        columns = [row.column_name for row in conn.execute(text("""
+            SELECT column_name FROM information_schema.columns
+            WHERE table_schema = 'public' AND table_name = :table_name
+            ORDER BY ordinal_position
+        """), {"table_name": table_name})]
+        if not columns:
+            create_fact_tables(conn)
+            return
+
+        print(f"Prevod tabuľky `{table_name}` na partície...")
+
+        indexes = conn.execute(text("""
+            SELECT indexname, indexdef FROM pg_indexes WHERE schemaname = 'public' AND tablename = :table_name
+        """), {"table_name": table_name}).fetchall()
+
+        conn.execute(text(f"ALTER TABLE public.{table_name} RENAME TO {legacy_name}"))
+        for index in indexes:
+            conn.execute(text(f"ALTER INDEX public.{index.indexname} RENAME TO {index.indexname[:50]}_unpartitioned"))
+        conn.execute(text(f"CREATE SEQUENCE IF NOT EXISTS public.{sequence_name(table_name)}"))
+        conn.execute(text(f"ALTER SEQUENCE public.{sequence_name(table_name)} OWNED BY NONE"))
+        create_fact_tables(conn)
+
+        start_key, end_key = conn.execute(text(f"SELECT MIN(date_sk), MAX(date_sk) FROM public.{legacy_name} WHERE date_sk > 0")).fetchone()
+        if start_key is not None:
+            create_partitions(conn, table_name, start_key, end_key)
+
+        column_list = ", ".join(columns)
+        conn.execute(text(f"INSERT INTO public.{table_name} ({column_list}) SELECT {column_list} FROM public.{legacy_name}"))
+        conn.execute(text(f"SELECT setval('public.{sequence_name(table_name)}', GREATEST((SELECT COALESCE(MAX({key}), 0) FROM public.{table_name}), 1))"))
+        conn.execute(text(f"ALTER SEQUENCE public.{sequence_name(table_name)} OWNED BY public.{table_name}.{key}"))
+
+        # unique indexes without date_sk cannot exist on a partitioned table
+        for index in indexes:
+            if not index.indexdef.startswith("CREATE UNIQUE"):
+                conn.execute(text(index.indexdef.replace("CREATE INDEX", "CREATE INDEX IF NOT EXISTS", 1)))
+
+    print(f"Tabuľka `{table_name}` prevedená na partície, pôvodné dáta zostali v `{legacy_name}`.")
+
+def archive_fact_partitions(self, dwh_engine, before_date, archive_schema=PARTITION_ARCHIVE_SCHEMA):
+    archived = []
+
+    with dwh_engine.begin() as conn:
+        if archive_schema:
+            conn.execute(text(f"CREATE SCHEMA IF NOT EXISTS {archive_schema}"))
+
+        for table_name in FACT_TABLES_CONFIG:
+            if self is not None and self.is_aborted():
+                print("Úloha zrušená")
+                return archived
+
+            if not is_partitioned(conn, table_name):
+                continue
+
+            lock_partitions(conn, table_name)
+            for name in sorted(load_partitions(conn, table_name)):
+                if name == f"{table_name}_{UNDATED_PARTITION}":
+                    continue
+                year, month = int(name[-6:-2]), int(name[-2:])
+                if datetime.date(year, month, 1) >= before_date.replace(day=1):
+                    continue
+
+                conn.execute(text(f"ALTER TABLE public.{table_name} DETACH PARTITION public.{name}"))
+                # a detached table left under the partition name would block recreating the month
+                if archive_schema:
+                    conn.execute(text(f"ALTER TABLE public.{name} SET SCHEMA {archive_schema}"))
+                else:
+                    conn.execute(text(f"ALTER TABLE public.{name} RENAME TO {name}_detached"))
+                archived.append(name)
+
+    print(f"Odpojené partície: {len(archived)}.")
+    return archived
@@ -0,0 +1,117 @@
+import json
+import math
+import datetime
+from decimal import Decimal
+
+import numpy as np
+
+
+def is_missing(value):
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+def column_array(values):
+    present = [value for value in values if value is not None]
+    if present and all(isinstance(value, (int, float, Decimal)) and not isinstance(value, bool) for value in present):
+        if len(present) == len(values) and all(isinstance(value, int) for value in present):
+            return np.array(values, dtype=np.int64)
+        return np.array([np.nan if value is None else float(value) for value in values], dtype=np.float64)
+
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
+def to_columns(columns, rows):
+    return {column: column_array([row[i] for row in rows]) for i, column in enumerate(columns)}
+
+def fetch_rows(conn, query, params=None):
+    result = conn.execute(query, params or {})
+    return list(result.keys()), [tuple(row) for row in result.fetchall()]
+
+def fetch_columns(conn, query, params=None):
+    return to_columns(*fetch_rows(conn, query, params))
+
+def fetch_row(conn, query, params=None):
+    row = conn.execute(query, params or {}).mappings().first()
+    return dict(row) if row is not None else {}
+
+def to_number(value, default=0):
+    if is_missing(value):
+        return default
+    return float(value) if isinstance(value, Decimal) else value
+
+def fill(values, value):
+    if values.dtype.kind == 'f':
+        return np.where(np.isnan(values), value, values)
+
+    filled = values.copy()
+    for i, item in enumerate(filled):
+        if is_missing(item):
+            filled[i] = value
+    return filled
+
+def replace(values, mapping):
+    replaced = values.copy()
+    for i, item in enumerate(replaced):
+        if item in mapping:
+            replaced[i] = mapping[item]
+    return replaced
+
+def round_values(values, digits=0):
+    return np.round(values.astype(np.float64), digits)
+
+def filter_columns(columns, mask):
+    return {name: values[mask] for name, values in columns.items()}
+
+def sort_columns(columns, key, ascending=True):
+    values = columns[key]
+    missing = [i for i, value in enumerate(values) if is_missing(value)]
+    present = sorted((i for i, value in enumerate(values) if not is_missing(value)), key=lambda i: values[i], reverse=not ascending)
+    order = np.array(missing + present, dtype=np.intp)
+    return {name: column[order] for name, column in columns.items()}
+
+def head_columns(columns, count):
+    return {name: values[:count] for name, values in columns.items()}
+
+def pivot(columns, index, column, values, index_order, column_order, fill_value=0.0):
+    index_positions = {value: i for i, value in enumerate(index_order)}
+    column_positions = {value: i for i, value in enumerate(column_order)}
+    matrix = np.full((len(index_order), len(column_order)), fill_value, dtype=np.float64)
+
+    for index_value, column_value, value in zip(columns[index], columns[column], columns[values]):
+        if index_value in index_positions and column_value in column_positions and not is_missing(value):
+            matrix[index_positions[index_value], column_positions[column_value]] = value
+
+    return matrix
+
+def pivot_median(columns, index, column, values, index_order, column_order, fill_value=0.0):
+    index_positions = {value: i for i, value in enumerate(index_order)}
+    column_positions = {value: i for i, value in enumerate(column_order)}
+    matrix = np.full((len(index_order), len(column_order)), fill_value, dtype=np.float64)
+
+    rows = np.array([index_positions.get(value, -1) for value in columns[index]], dtype=np.int64)
+    cols = np.array([column_positions.get(value, -1) for value in columns[column]], dtype=np.int64)
+    data = np.asarray(columns[values], dtype=np.float64)
+    valid = (rows >= 0) & (cols >= 0) & ~np.isnan(data)
+
+    cells = rows[valid] * len(column_order) + cols[valid]
+    data = data[valid]
+    for cell in np.unique(cells):
+        matrix.flat[cell] = np.median(data[cells == cell])
+
+    return matrix
+
+def json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime.date, datetime.datetime, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def rows_json(columns, rows):
+    return json.dumps({"columns": columns, "data": rows}, default=json_default)
+
+def columns_from_json(body):
+    result = json.loads(body)
+    return to_columns(result["columns"], result["data"])
@@ -0,0 +1,103 @@
+import datetime
+import calendar
+from functools import lru_cache
+from sqlalchemy import text
+
+from reportsconfig import dashboard_queries, reports_queries, route_dashboard_query, route_report_query
+from date_keys import date_to_key
+
+VALID_FILTER = "{alias}.valid_from <= :period_end AND {alias}.valid_to >= :period_start"
+
+SUBFILTER_COLUMNS = {
+    "market_group": "dp.market_group",
+    "market_subgroup": "dp.market_subgroup",
+    "market_gender": "dp.market_gender",
+}
+
+
+def compile_query(query, period_filter="{filter}", group_filter="{group_filter}"):
+    return query.replace("'{date_format}'", ":date_format").format(
+        filter=period_filter,
+        valid_customer_filter=VALID_FILTER.format(alias="dc"),
+        valid_product_filter=VALID_FILTER.format(alias="dp"),
+        valid_order_state_filter=VALID_FILTER.format(alias="dos"),
+        group_filter=group_filter,
+    )
+
+compiled_dashboard_queries = {name: text(compile_query(route_dashboard_query(name))) for name in dashboard_queries}
+
+compiled_menu_queries = {
+    (report_type, subfilter): text(compile_query(config["menu_query"], period_filter=VALID_FILTER.format(alias="p")))
+    for report_type, report in reports_queries.items()
+    for subfilter, config in report.get("subfilters", {}).items()
+    if config.get("menu_query")
+}
+
+@lru_cache(maxsize=256)
+def compile_report_query(report_type, group_filter_keys=(), use_sketches=False):
+    return compile_query(route_report_query(report_type, use_sketches), group_filter=build_group_filter(group_filter_keys))
+
+def build_group_filter(group_filter_keys):
+    conditions = []
+    for subfilter_key, is_null in group_filter_keys:
+        if is_null:
+            conditions.append(f"{SUBFILTER_COLUMNS[subfilter_key]} IS NULL")
+        else:
+            conditions.append(f"{SUBFILTER_COLUMNS[subfilter_key]} = :{subfilter_key}")
+
+    return " AND ".join(conditions) if conditions else "1 = 1"
+
+def period_params(current_date, filter_type, filter_value, range_start, range_end):
+    current_year = current_date.year
+    current_month = current_date.month
+    current_quarter = (current_month - 1) // 3 + 1
+    if filter_type == "month" and filter_value:
+        try:
+            filter_value_parts = filter_value.split("-")
+            filter_value_year = int(filter_value_parts[0])
+            filter_value_month = int(filter_value_parts[1])
+        except (ValueError, IndexError):
+            filter_value_month = current_month
+            filter_value_year = current_year
+
+        period_start = datetime.date(filter_value_year, filter_value_month, 1)
+        period_end = datetime.date(filter_value_year, filter_value_month, calendar.monthrange(filter_value_year, filter_value_month)[1])
+        date_format = "YYYY-MM-DD"
+    elif filter_type == "quarter" and filter_value:
+        try:
+            filter_value_parts = filter_value.split("-")
+            filter_value_year = int(filter_value_parts[0])
+            filter_value_quarter = int(filter_value_parts[1])
+        except (ValueError, IndexError):
+            filter_value_quarter = current_quarter
+            filter_value_year = current_year
+
+        start_month = (filter_value_quarter - 1) * 3 + 1
+        end_month = filter_value_quarter * 3
+        period_start = datetime.date(filter_value_year, start_month, 1)
+        period_end = datetime.date(filter_value_year, end_month, calendar.monthrange(filter_value_year, end_month)[1])
+        date_format = "MM"
+    elif filter_type == "range" and range_start or range_end:
+        try:
+            period_start = datetime.datetime.strptime(range_start, "%Y-%m-%d").date()
+            period_end = datetime.datetime.strptime(range_end, "%Y-%m-%d").date()
+        except (TypeError, ValueError):
+            period_start = period_end = current_date.date() if isinstance(current_date, datetime.datetime) else current_date
+        date_format = "YYYY-MM-DD"
+    else:
+        try:
+            filter_value = int(filter_value)
+        except (TypeError, ValueError):
+            filter_value = current_year
+
+        period_start = datetime.date(filter_value, 1, 1)
+        period_end = datetime.date(filter_value, 12, 31)
+        date_format = "MM"
+
+    return {
+        "period_start": period_start,
+        "period_end": period_end,
+        "date_sk_start": date_to_key(period_start),
+        "date_sk_end": date_to_key(period_end),
+        "date_format": date_format,
+    }
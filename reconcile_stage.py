@@ -0,0 +1,183 @@
+import re
+import gc
+import pandas as pd
+from sqlalchemy import text
+
+
+MYSQL_HASH_EXPRESSIONS = {
+    "text": "CAST({column} AS CHAR)",
+    "bool": "CAST(({column} <> 0) AS CHAR)",
+    "datetime": "NULLIF(DATE_FORMAT({column}, '%Y-%m-%d %H:%i:%s'), '0000-00-00 00:00:00')",
+    "date": "NULLIF(DATE_FORMAT({column}, '%Y-%m-%d'), '0000-00-00')",
+    "decimal": "CAST(CAST(ROUND({column}, 6) AS DECIMAL(30,6)) AS CHAR)",
+    "decimal_or_zero": "CAST(CAST(ROUND(COALESCE({column}, 0), 6) AS DECIMAL(30,6)) AS CHAR)",
+    "int_or_zero": "CAST(COALESCE({column}, 0) AS CHAR)",
+    "sha256": "SHA2({column}, 256)",
+}
+
+POSTGRES_HASH_EXPRESSIONS = {
+    "text": "CAST({column} AS TEXT)",
+    "bool": "CAST(CAST({column} AS INTEGER) AS TEXT)",
+    "datetime": "TO_CHAR({column}, 'YYYY-MM-DD HH24:MI:SS')",
+    "date": "TO_CHAR({column}, 'YYYY-MM-DD')",
+    "decimal": "CAST(ROUND(CAST({column} AS NUMERIC), 6) AS TEXT)",
+    "decimal_or_zero": "CAST(ROUND(CAST(COALESCE({column}, 0) AS NUMERIC), 6) AS TEXT)",
+    "int_or_zero": "CAST(CAST(COALESCE({column}, 0) AS BIGINT) AS TEXT)",
+    "sha256": "CAST({column} AS TEXT)",
+}
+
+def parse_select_columns(select_query):
+    match = re.search(r"SELECT\s+(?:DISTINCT\s+)?(.*?)\s+FROM\s", select_query, re.IGNORECASE | re.DOTALL)
+    if match is None:
+        return []
+
+    columns = []
+    for item in match.group(1).split(","):
+        item = item.strip()
+        alias = re.split(r"\s+as\s+", item, flags=re.IGNORECASE)
+        name = alias[-1] if len(alias) > 1 else item.split(".")[-1]
+        columns.append(name.strip().strip("`"))
+
+    return columns
+
+def build_row_hash(columns, kinds, expressions, quote):
+    parts = []
+    for column in columns:
+        expression = expressions[kinds.get(column, "text")].format(column=f"src.{quote}{column}{quote}")
+        parts.append(f"COALESCE({expression}, '<null>')")
+
+    return "CONCAT_WS('|', {parts})".format(parts=", ".join(parts))
+
+def build_prod_range_query(select_query, key, key_column, columns, kinds):
+    row_hash = build_row_hash(columns, kinds, MYSQL_HASH_EXPRESSIONS, "`")
+    source = select_query.strip().rstrip(";")
+
+    return f"""
+    SELECT
+        FLOOR((src.`{key_column}` - :lo) / :step) AS bucket,
+        COUNT(*) AS row_count,
+        BIT_XOR(CAST(CONV(SUBSTRING(MD5({row_hash}), 1, 8), 16, 10) AS UNSIGNED)) AS range_hash
+    FROM ({source} WHERE {key} BETWEEN :lo AND :hi) AS src
+    GROUP BY bucket;
+    """
+
+def build_stage_range_query(target_table, key_column, columns, kinds):
+    row_hash = build_row_hash(columns, kinds, POSTGRES_HASH_EXPRESSIONS, '"')
+
+    return f"""
+    SELECT
+        FLOOR((src."{key_column}" - :lo) / :step) AS bucket,
+        COUNT(*) AS row_count,
+        BIT_XOR(CAST(CAST(('x' || SUBSTRING(MD5({row_hash}), 1, 8)) AS BIT(32)) AS BIGINT)) AS range_hash
+    FROM {target_table} AS src
+    WHERE src."{key_column}" BETWEEN :lo AND :hi
+    GROUP BY bucket;
+    """
+
+def fetch_range_hashes(engine, query, lo, hi, step):
+    with engine.connect() as conn:
+        rows = conn.execute(text(query), {"lo": lo, "hi": hi, "step": step}).fetchall()
+
+    return {int(row.bucket): (int(row.row_count), int(row.range_hash or 0)) for row in rows}
+
+def fetch_key_bounds(prod_engine, stage_engine, select_query, key, key_column, target_table):
+    source = select_query.strip().rstrip(";")
+    from_clause = source[re.search(r"\sFROM\s", source, re.IGNORECASE).start():]
+    with prod_engine.connect() as conn:
+        prod_row = conn.execute(text(f"SELECT MIN({key}) AS lo, MAX({key}) AS hi {from_clause};")).fetchone()
+    with stage_engine.connect() as conn:
+        stage_row = conn.execute(text(f'SELECT MIN("{key_column}") AS lo, MAX("{key_column}") AS hi FROM {target_table};')).fetchone()
+
+    lows = [row.lo for row in (prod_row, stage_row) if row is not None and row.lo is not None]
+    highs = [row.hi for row in (prod_row, stage_row) if row is not None and row.hi is not None]
+    if not lows or not highs:
+        return None, None
+
+    return int(min(lows)), int(max(highs))
+
+def resync_range(self, prod_engine, stage_engine, select_query, key, key_column, target_table, convert_items, lo, hi, chunksize=10000):
+    source = select_query.strip().rstrip(";")
+    query = f"{source} WHERE {key} BETWEEN :lo AND :hi;"
+
+    if self is not None and self.is_aborted():
+        print("Úloha zrušená")
+        return False
+
+    # the range DELETE must not be committed without the reinserted rows
+    with stage_engine.connect() as conn:
+        transaction = conn.begin()
+        conn.execute(text(f'DELETE FROM {target_table} WHERE "{key_column}" BETWEEN :lo AND :hi'), {"lo": lo, "hi": hi})
+
+        with prod_engine.connect().execution_options(stream_results=True) as prod_conn:
+            for chunk in pd.read_sql_query(text(query), con=prod_conn, params={"lo": lo, "hi": hi}, chunksize=chunksize):
+                for field, convert_func in convert_items:
+                    chunk[field] = chunk[field].apply(convert_func)
+
+                if self is not None and self.is_aborted():
+                    transaction.rollback()
+                    print("Úloha zrušená")
+                    return False
+
+                chunk.to_sql(target_table, con=conn, if_exists='append', index=False, method='multi')
+
+                del chunk
+                gc.collect()
+
+        transaction.commit()
+
+    return True
+
+def reconcile_table(self, prod_engine, stage_engine, table_name, et_config, reconcile_config, fanout=16, leaf_rows=1000):
+    if self is not None and self.is_aborted():
+        print("Úloha zrušená")
+        return 0
+
+    print(f"Porovnanie tabuľky {table_name}...")
+
+    select_query = et_config["select"]
+    target_table = et_config["target"]
+    convert_items = et_config.get("convert_fields", {}).items()
+    key = reconcile_config["key"]
+    key_column = reconcile_config.get("key_column", key.split(".")[-1])
+    kinds = reconcile_config.get("kinds", {})
+    columns = parse_select_columns(select_query)
+
+    prod_query = build_prod_range_query(select_query, key, key_column, columns, kinds)
+    stage_query = build_stage_range_query(target_table, key_column, columns, kinds)
+
+    lo, hi = fetch_key_bounds(prod_engine, stage_engine, select_query, key, key_column, target_table)
+    if lo is None:
+        print(f"Tabuľka {table_name} je prázdna.")
+        return 0
+
+    resynced_ranges = 0
+    pending = [(lo, hi)]
+    while pending:
+        if self is not None and self.is_aborted():
+            print("Úloha zrušená")
+            return resynced_ranges
+
+        range_lo, range_hi = pending.pop()
+        step = max(1, -(-(range_hi - range_lo + 1) // fanout))
+
+        prod_hashes = fetch_range_hashes(prod_engine, prod_query, range_lo, range_hi, step)
+        stage_hashes = fetch_range_hashes(stage_engine, stage_query, range_lo, range_hi, step)
+
+        for bucket in set(prod_hashes) | set(stage_hashes):
+            prod_hash = prod_hashes.get(bucket, (0, 0))
+            stage_hash = stage_hashes.get(bucket, (0, 0))
+            if prod_hash == stage_hash:
+                continue
+
+            bucket_lo = range_lo + bucket * step
+            bucket_hi = min(range_hi, bucket_lo + step - 1)
+
+            if step == 1 or max(prod_hash[0], stage_hash[0]) <= leaf_rows:
+                if not resync_range(self, prod_engine, stage_engine, select_query, key, key_column, target_table, convert_items, bucket_lo, bucket_hi):
+                    return resynced_ranges
+                resynced_ranges += 1
+            else:
+                pending.append((bucket_lo, bucket_hi))
+
+    print(f"Tabuľka {table_name} bola porovnaná, obnovené rozsahy: {resynced_ranges}.")
+    return resynced_ranges
@@ -1,72 +1,29 @@
 import datetime
 import io
+import json
 import os
 
 from flask import Blueprint, request, jsonify, render_template, redirect, url_for, Response, abort, send_file
 from flask_login import current_user, login_required
-from sqlalchemy import text, create_engine
+from sqlalchemy import text
 import pandas as pd
 from auth.base_auth import check_auth, authenticate
-from celeryconfig import PROD_DB_URI, DWH_DB_URI
-from dashboard.dashboard import apply_period_filter
+from dashboard.cache import get_etl_version, build_etag, not_modified_response, json_response
+from filter_catalogue import get_filter_menus
 from models import Report, db
-from reportsconfig import filter_queries, reports_queries
+from reportsconfig import reports_queries, SKETCH_EXACT_MODE
+from query_templates import SUBFILTER_COLUMNS, compiled_menu_queries, compile_query, compile_report_query, build_group_filter, period_params
+from engines import get_engine
+from sketches import get_sketch_store
 from tasks import build_report_task
 from playwright.sync_api import sync_playwright
 
 reports_blueprint = Blueprint('reports', __name__)
 
-prod_engine = create_engine(PROD_DB_URI)
-dwh_engine = create_engine(DWH_DB_URI)
+prod_engine = get_engine("prod")
+dwh_engine = get_engine("dwh")
 
 
-def apply_period_filter_to_dim(original_query, filter_type, filter_value, range_start, range_end):
-    current_date = datetime.datetime.now()
-    current_year = current_date.year
-    current_month = current_date.month
-    current_quarter = (current_month - 1) // 3 + 1
-    if filter_type == "month" and filter_value:
-        try:
-            filter_value_parts = filter_value.split("-")
-            filter_value_year = int(filter_value_parts[0])
-            filter_value_month = int(filter_value_parts[1])
-        except ValueError:
-            filter_value_year = current_year
-            filter_value_month = current_month
-        date_start = datetime.date(filter_value_year, filter_value_month, 1)
-        date_end = datetime.date(filter_value_year, filter_value_month + 1, 1) - datetime.timedelta(days=1) if filter_value_month < 12 else datetime.date(filter_value_year, 12, 31)
-    elif filter_type == "quarter" and filter_value:
-        try:
-            filter_value_parts = filter_value.split("-")
-            filter_value_year = int(filter_value_parts[0])
-            filter_value_quarter = int(filter_value_parts[1])
-        except ValueError:
-            filter_value_year = current_year
-            filter_value_quarter = current_quarter
-        start_month = (filter_value_quarter - 1) * 3 + 1
-        date_start = datetime.date(filter_value_year, start_month, 1)
-        date_end = datetime.date(filter_value_year + 1, 12, 31) if filter_value_quarter == 4 else datetime.date(filter_value_year, start_month + 3, 1) - datetime.timedelta(days=1)
-    elif filter_type == "year" and filter_value:
-        try:
-            filter_value = int(filter_value)
-        except ValueError:
-            filter_value = 0
-        date_start = datetime.date(filter_value, 1, 1)
-        date_end = datetime.date(filter_value, 12, 31)
-    elif filter_type == "range" and range_start or range_end:
-        try:
-            date_start = datetime.datetime.strptime(range_start, "%Y-%m-%d").date()
-            date_end = datetime.datetime.strptime(range_end, "%Y-%m-%d").date()
-        except ValueError:
-            date_start = date_end = current_date
-    else:
-        current_year = datetime.datetime.now().year
-        date_start = datetime.date(current_year, 1, 1).strftime('%Y-%m-%d')
-        date_end = datetime.date(current_year, 12, 31).strftime('%Y-%m-%d')
-
-    query = original_query.format(filter=f"p.valid_from <= DATE '{date_end}' AND p.valid_to >= DATE '{date_start}'")
-    return query
-
 @reports_blueprint.before_request
 def require_http_auth():
     auth = request.authorization
@@ -79,19 +36,15 @@ def reports_index():
     if not current_user.is_authenticated:
         return redirect(url_for('auth.auth_login_form'))
 
-    with dwh_engine.connect() as conn:
-        min_date_row = conn.execute(text(filter_queries["min_date"])).fetchone()
-        months = conn.execute(text(filter_queries["months"]), parameters={"min_date": min_date_row.min_date}).fetchall()
-        quarters = conn.execute(text(filter_queries["quarters"]), parameters = {"min_date": min_date_row.min_date}).fetchall()
-        years = conn.execute(text(filter_queries["years"]), parameters ={"min_date": min_date_row.min_date}).fetchall()
-
-        report_types = {}
-        for key, value in reports_queries.items():
-            report_types[key] = {"title": value["title"]}
-            if "subfilters" in value:
-                report_types[key]["subfilters"] = {}
-                for subfilter_key, subfilter_value in value["subfilters"].items():
-                    report_types[key]["subfilters"][subfilter_key] = {"title": subfilter_value["title"]}
+    months, quarters, years = get_filter_menus(dwh_engine, get_etl_version())
+
+    report_types = {}
+    for key, value in reports_queries.items():
+        report_types[key] = {"title": value["title"]}
+        if "subfilters" in value:
+            report_types[key]["subfilters"] = {}
+            for subfilter_key, subfilter_value in value["subfilters"].items():
+                report_types[key]["subfilters"][subfilter_key] = {"title": subfilter_value["title"]}
 
     return render_template('reports/reports.html', title='DMA - Správy', page='reports', months=months, quarters=quarters, years=years, report_types=report_types)
 
@@ -114,7 +67,7 @@ def get_subfilter_options():
     if subfilter and subfilter not in reports_queries[report_type]["subfilters"]:
         return jsonify({"error": "Neplatný podfilter"}), 200
 
-    menu_query = reports_queries[report_type]["subfilters"][subfilter].get("menu_query")
+    menu_query = compiled_menu_queries.get((report_type, subfilter))
     date_filter_type = request.json.get("date_filter_type")
     date_filter_value = request.json.get("date_filter_value")
     date_filter_type = "year" if date_filter_type is None else date_filter_type
@@ -123,13 +76,13 @@ def get_subfilter_options():
     if date_filter_type == "range":
         range_start = request.args.get("filter_value_start")
         range_end = request.args.get("filter_value_end")
-    query = apply_period_filter_to_dim(menu_query, date_filter_type, date_filter_value, range_start, range_end)
-
-    if not menu_query:
+    if menu_query is None:
         return jsonify({"error": "Chýba dotaz pre menu"}), 200
 
+    params = period_params(current_date, date_filter_type, date_filter_value, range_start, range_end)
+
     with dwh_engine.connect() as conn:
-        elements = conn.execute(text(query)).fetchall()
+        elements = conn.execute(menu_query, params).fetchall()
         elements.insert(0, ('[Any]',))
 
     return jsonify({"elements": [{"key": row[0], "value": row[0]} for row in elements]}), 200
@@ -149,30 +102,19 @@ def create_report():
     if report_type not in reports_queries:
         return jsonify({"error": "Neplatný typ správy"}), 200
 
-    where_clause = []
+    group_filter_keys = []
+    query_params = {}
     report_subfilters = []
 
-    for subfilter_key, subfilter_value  in subfilters.items():
-        if subfilter_key in reports_queries[report_type]["subfilters"]:
+    for subfilter_key, subfilter_value in (subfilters or {}).items():
+        if subfilter_key in reports_queries[report_type].get("subfilters", {}) and subfilter_key in SUBFILTER_COLUMNS:
             if subfilter_value != "[Any]" and subfilter_value != "[Not specified]":
-                if subfilter_key == "market_group":
-                    where_clause.append(f"dp.market_group = '{subfilter_value}'")
-                elif subfilter_key == "market_subgroup":
-                    where_clause.append(f"dp.market_subgroup = '{subfilter_value}'")
-                elif subfilter_key == "market_gender":
-                    where_clause.append(f"dp.market_gender = '{subfilter_value}'")
+                group_filter_keys.append((subfilter_key, False))
+                query_params[subfilter_key] = subfilter_value
             elif subfilter_value == "[Not specified]":
-                if subfilter_key == "market_group":
-                    where_clause.append(f"dp.market_group IS NULL")
-                elif subfilter_key == "market_subgroup":
-                    where_clause.append(f"dp.market_subgroup IS NULL")
-                elif subfilter_key == "market_gender":
-                    where_clause.append(f"dp.market_gender IS NULL")
+                group_filter_keys.append((subfilter_key, True))
             report_subfilters.append({subfilter_key: {'title': reports_queries[report_type]["subfilters"][subfilter_key]['title'],'value': subfilter_value}})
 
-    if len(where_clause) == 0:
-        where_clause.append("1 = 1")
-
     date_filter_type = request.json.get("date_filter_type")
     date_filter_value = request.json.get("date_filter_value")
 
@@ -185,19 +127,29 @@ def create_report():
         range_start = request.json.get("start_date_filter")
         range_end = request.json.get("end_date_filter")
 
-    query = reports_queries[report_type].get("query")
-
-    if not query:
+    if not reports_queries[report_type].get("query"):
         return jsonify({"error": "No query"}), 200
 
-    query = apply_period_filter(query, current_date, date_filter_type, date_filter_value, range_start, range_end)
-    query = query.format(group_filter=" AND ".join(where_clause))
+    params = period_params(current_date, date_filter_type, date_filter_value, range_start, range_end)
+
+    median_order_total = None
+    if not SKETCH_EXACT_MODE and reports_queries[report_type].get("sketch_query"):
+        sketch_store = get_sketch_store()
+        if sketch_store is not None:
+            median_order_total = sketch_store.order_value_quantile(params["date_sk_start"], params["date_sk_end"], 0.5)
+    if median_order_total is not None:
+        query_params["median_order_total"] = median_order_total
+
+    query = compile_report_query(report_type, tuple(sorted(group_filter_keys)), median_order_total is not None)
+    query_params.update({
+        "period_start": params["period_start"].isoformat(),
+        "period_end": params["period_end"].isoformat(),
+        "date_sk_start": params["date_sk_start"],
+        "date_sk_end": params["date_sk_end"],
+        "date_format": params["date_format"],
+    })
 
-    prep_query = reports_queries[report_type].get("prep_query")
-    if prep_query:
-        for i in range(len(prep_query)):
-            prep_query[i] = apply_period_filter(prep_query[i], current_date, date_filter_type, date_filter_value, range_start, range_end)
-            prep_query[i] = prep_query[i].format(group_filter=" AND ".join(where_clause))
+    prep_query = [compile_query(prep, group_filter=build_group_filter(tuple(sorted(group_filter_keys)))) for prep in reports_queries[report_type].get("prep_query", [])]
 
     parameters = {
         "user_id": current_user.id,
@@ -208,6 +160,7 @@ def create_report():
         "show_diagram_table": reports_queries[report_type]["show_diagram_table"] if "show_diagram_table" in reports_queries[report_type] else True,
         "prep_query": prep_query,
         "query": query,
+        "query_params": query_params,
         "filters": {
             "date_filter_type": date_filter_type,
             "date_filter_value": date_filter_value,
@@ -299,10 +252,12 @@ def reports_data():
             "message": report.message
         })
 
-    return jsonify({
+    body = json.dumps({
         "last_page": (total_records + page_size - 1) // page_size,
         "data": data
-    }), 200
+    })
+    etag = build_etag(body)
+    return not_modified_response(etag) or json_response(body, etag)
 
 @reports_blueprint.route('/view_report/<int:report_id>', methods=['GET'])
 @login_required
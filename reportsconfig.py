@@ -26,118 +26,73 @@ filter_queries = {
     WHERE date >= :min_date AND date <= CURRENT_DATE
     ORDER BY year DESC;
     """,
+    "month_names": """
+    SELECT DISTINCT month, month_name
+    FROM dim_date
+    ORDER BY month;
+    """,
 }
 
 dashboard_queries = {
     "carts_query": """
     SELECT COUNT(DISTINCT cartid_bk) AS carts_count
     FROM fact_cart_line
-    WHERE date_sk IN (SELECT date_key FROM dim_date WHERE {filter})
+    WHERE date_sk BETWEEN :date_sk_start AND :date_sk_end
     """,
     "orders_paid_query": """
     SELECT
-        COUNT(fo.orderid_bk) AS orders_paid_count,
-        SUM(fo.paid_tax_incl) AS total_revenue
-    FROM fact_order_history foh
-	JOIN fact_order fo ON foh.orderid_bk = fo.orderid_bk
-	JOIN dim_date dd ON fo.date_sk = dd.date_key
-    WHERE {filter} AND foh.orderstateid_bk = 2
+        COUNT(fos.orderid_bk) AS orders_paid_count,
+        SUM(fos.paid_tax_incl) AS total_revenue
+    FROM fact_order_snapshot fos
+    WHERE fos.order_date_sk BETWEEN :date_sk_start AND :date_sk_end AND fos.is_paid
     """,
     "orders_query": """
     SELECT
         COUNT(fo.orderid_bk) AS orders_count
     FROM fact_order fo
-	JOIN dim_date dd ON fo.date_sk = dd.date_key
-    WHERE {filter}
+    WHERE fo.date_sk BETWEEN :date_sk_start AND :date_sk_end
     """,
     "period_revenue":"""
     SELECT
         TO_CHAR(dd.date, '{date_format}') AS period,
-        SUM(fo.paid_tax_incl) AS total_revenue
-    FROM fact_order_history foh
-    JOIN dim_date dd ON foh.date_sk = dd.date_key
-    JOIN fact_order fo ON foh.orderid_bk = fo.orderid_bk
-    WHERE {filter} AND foh.orderstateid_bk = 2
+        SUM(fos.paid_tax_incl) AS total_revenue
+    FROM fact_order_snapshot fos
+    JOIN dim_date dd ON fos.paid_date_sk = dd.date_key
+    WHERE fos.paid_date_sk BETWEEN :date_sk_start AND :date_sk_end AND fos.is_paid
     GROUP BY period
     ORDER BY period;
     """,
     "orders_heatmap": """
-    WITH time_categories AS (
-        SELECT 
-            fo.orderid_bk,
-            dd.date,
-            CASE
-                WHEN dt.hour BETWEEN 6 AND 11 THEN 'Morning'
-                WHEN dt.hour BETWEEN 12 AND 17 THEN 'Afternoon'
-                WHEN dt.hour BETWEEN 18 AND 23 THEN 'Evening'
-                ELSE 'Night'
-            END AS time_of_day,
-            dd.day_name
-        FROM fact_order fo
-        JOIN dim_time dt ON fo.time_sk = dt.time_key
-        JOIN dim_date dd ON fo.date_sk = dd.date_key
-        WHERE {filter}
-    ),
-    daily_counts AS (
-        SELECT
-            date,
-            time_of_day,
-            day_name,
-            COUNT(*) AS order_count_per_day
-        FROM time_categories
-        GROUP BY date, time_of_day, day_name
-    )
     SELECT
-        time_of_day,
-        day_name AS day_of_week,
-        PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY order_count_per_day) AS order_count
-    FROM daily_counts
-    GROUP BY time_of_day, day_name
-    ORDER BY 
-        CASE time_of_day 
-            WHEN 'Morning' THEN 1
-            WHEN 'Afternoon' THEN 2
-            WHEN 'Evening' THEN 3
-            WHEN 'Night' THEN 4
-        END,
-        CASE day_name 
-            WHEN 'Monday' THEN 1
-            WHEN 'Tuesday' THEN 2
-            WHEN 'Wednesday' THEN 3
-            WHEN 'Thursday' THEN 4
-            WHEN 'Friday' THEN 5
-            WHEN 'Saturday' THEN 6
-            WHEN 'Sunday' THEN 7
-        END;
+        c.time_of_day,
+        dd.day_name AS day_of_week,
+        c.order_count
+    FROM agg_daily_order_time c
+    JOIN dim_date dd ON c.date_sk = dd.date_key
+    WHERE c.date_sk BETWEEN :date_sk_start AND :date_sk_end;
     """,
     "carrier_revenue_orders_distribution": """
     SELECT
-        fo.carrier,
-        SUM(fo.paid_tax_incl) AS total_revenue,
-        COUNT(fo.orderid_bk) as total_count
-    FROM fact_order_history foh
-    JOIN dim_date dd 
-        ON foh.date_sk = dd.date_key
-    JOIN fact_order fo
-        ON fo.orderid_bk = foh.orderid_bk
-    WHERE {filter}
-      AND foh.orderstateid_bk = 2
-    GROUP BY fo.carrier
+        fos.carrier,
+        SUM(fos.paid_tax_incl) AS total_revenue,
+        COUNT(fos.orderid_bk) as total_count
+    FROM fact_order_snapshot fos
+    WHERE fos.paid_date_sk BETWEEN :date_sk_start AND :date_sk_end
+      AND fos.is_paid
+    GROUP BY fos.carrier
     ORDER BY total_revenue DESC;
     """,
     "top_manufacturer_revenue_distribution": """
     SELECT
         dp.manufacturer,
         SUM(fol.amount_tax_incl) AS total_revenue
-    FROM fact_order_history foh
-    JOIN dim_date dd 
-        ON foh.date_sk = dd.date_key
+    FROM fact_order_snapshot fos
     JOIN fact_order_line fol 
-        ON fol.orderid_bk = foh.orderid_bk
+        ON fol.orderid_bk = fos.orderid_bk
     JOIN dim_product dp 
         ON fol.product_sk = dp.product_key
-    WHERE {filter}
-      AND foh.orderstateid_bk = 2
+    WHERE fos.paid_date_sk BETWEEN :date_sk_start AND :date_sk_end
+      AND fos.is_paid
     GROUP BY dp.manufacturer
     ORDER BY total_revenue DESC
     LIMIT 10;
@@ -146,15 +101,13 @@ dashboard_queries = {
     SELECT
         dp.market_group,
         SUM(fol.amount_tax_incl) AS total_revenue
-    FROM fact_order_history foh
-    JOIN dim_date dd 
-        ON foh.date_sk = dd.date_key
+    FROM fact_order_snapshot fos
     JOIN fact_order_line fol 
-        ON fol.orderid_bk = foh.orderid_bk
+        ON fol.orderid_bk = fos.orderid_bk
     JOIN dim_product dp 
         ON fol.product_sk = dp.product_key
-    WHERE {filter}
-      AND foh.orderstateid_bk = 2
+    WHERE fos.paid_date_sk BETWEEN :date_sk_start AND :date_sk_end
+      AND fos.is_paid
     GROUP BY dp.market_group
     ORDER BY total_revenue DESC;
     """,
@@ -166,6 +119,43 @@ dashboard_queries = {
     WHERE dc.active = TRUE AND {valid_customer_filter}
     GROUP BY dc.gender;
     """,
+    "paid_order_groupings": """
+    SELECT
+        CASE
+            WHEN GROUPING(period) = 0 THEN 'period_revenue'
+            WHEN GROUPING(carrier) = 0 THEN 'carrier_revenue_orders_distribution'
+            WHEN GROUPING(manufacturer) = 0 THEN 'top_manufacturer_revenue_distribution'
+            ELSE 'market_group_revenue_distribution'
+        END AS grouping_set,
+        period,
+        carrier,
+        manufacturer,
+        market_group,
+        SUM(paid_tax_incl) FILTER (WHERE order_row) AS order_revenue,
+        COUNT(orderid_bk) FILTER (WHERE order_row) AS order_count,
+        SUM(amount_tax_incl) AS line_revenue,
+        COUNT(orderline_key) AS line_count
+    FROM (
+        SELECT
+            TO_CHAR(dd.date, '{date_format}') AS period,
+            fos.carrier,
+            fos.orderid_bk,
+            fos.paid_tax_incl,
+            dp.manufacturer,
+            dp.market_group,
+            fol.orderline_key,
+            fol.amount_tax_incl,
+            ROW_NUMBER() OVER (PARTITION BY fos.orderid_bk) = 1 AS order_row
+        FROM fact_order_snapshot fos
+        JOIN dim_date dd
+            ON fos.paid_date_sk = dd.date_key
+        LEFT JOIN (fact_order_line fol JOIN dim_product dp ON fol.product_sk = dp.product_key)
+            ON fol.orderid_bk = fos.orderid_bk
+        WHERE fos.paid_date_sk BETWEEN :date_sk_start AND :date_sk_end
+          AND fos.is_paid
+    ) paid
+    GROUP BY GROUPING SETS ((period), (carrier), (manufacturer), (market_group));
+    """,
 }
 
 reports_queries = {
@@ -193,9 +183,8 @@ reports_queries = {
             FLOOR(EXTRACT(YEAR FROM AGE(CURRENT_DATE, dc.birthdate)) / 10) * 10 AS age_range,
             AVG(fo.paid_tax_incl) AS avg_order_value
         FROM fact_order fo
-        JOIN dim_date dd ON fo.date_sk = dd.date_key
         JOIN dim_customer dc ON fo.customer_sk = dc.customer_key
-        WHERE {filter} AND {valid_customer_filter}
+        WHERE fo.date_sk BETWEEN :date_sk_start AND :date_sk_end AND {valid_customer_filter}
         GROUP BY age_range
         ORDER BY age_range;
         """
@@ -208,13 +197,12 @@ reports_queries = {
         "query": """
         SELECT
             TO_CHAR(dd.date, '{date_format}') AS period,
-            SUM(fo.paid_tax_incl) AS total_revenue
+            SUM(fos.paid_tax_incl) AS total_revenue
         FROM fact_order_line fol
-        JOIN fact_order fo ON fo.orderid_bk = fol.orderid_bk
-        JOIN fact_order_history foh ON foh.orderid_bk = fo.orderid_bk AND foh.orderstateid_bk = 2
+        JOIN fact_order_snapshot fos ON fos.orderid_bk = fol.orderid_bk AND fos.is_paid
         JOIN dim_date dd ON fol.date_sk = dd.date_key
         JOIN dim_product dp ON fol.product_sk = dp.product_key
-        WHERE {filter} AND {valid_product_filter} AND ({group_filter})
+        WHERE fol.date_sk BETWEEN :date_sk_start AND :date_sk_end AND {valid_product_filter} AND ({group_filter})
         GROUP BY period
         ORDER BY period;
         """,
@@ -247,13 +235,12 @@ reports_queries = {
         "query": """
         SELECT
             TO_CHAR(dd.date, '{date_format}') AS period,
-            SUM(fo.paid_tax_incl) AS total_revenue
+            SUM(fos.paid_tax_incl) AS total_revenue
         FROM fact_order_line fol
-        JOIN fact_order fo ON fo.orderid_bk = fol.orderid_bk
-        JOIN fact_order_history foh ON foh.orderid_bk = fo.orderid_bk AND foh.orderstateid_bk = 2
+        JOIN fact_order_snapshot fos ON fos.orderid_bk = fol.orderid_bk AND fos.is_paid
         JOIN dim_date dd ON fol.date_sk = dd.date_key
         JOIN dim_product dp ON fol.product_sk = dp.product_key
-        WHERE {filter} AND {valid_product_filter} AND ({group_filter})
+        WHERE fol.date_sk BETWEEN :date_sk_start AND :date_sk_end AND {valid_product_filter} AND ({group_filter})
         GROUP BY period
         ORDER BY period;
         """,
@@ -278,22 +265,167 @@ reports_queries = {
             SELECT 
                 PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY fo.paid_tax_incl) AS median_order_total
             FROM fact_order fo
-            JOIN dim_date dd ON fo.date_sk = dd.date_key
-            WHERE {filter}
+            WHERE fo.date_sk BETWEEN :date_sk_start AND :date_sk_end
         )
         SELECT 
             dc.customerid_bk AS customer_id,
-            SUM(fo.paid_tax_incl) AS total_spent,
-            COUNT(fo.orderid_bk) AS order_count
-        FROM fact_order fo
-        JOIN median_calc mc ON fo.paid_tax_incl > mc.median_order_total
-        JOIN dim_customer dc ON fo.customer_sk = dc.customer_key
-        JOIN dim_date dd ON fo.date_sk = dd.date_key
-        JOIN fact_order_history foh ON foh.orderid_bk = fo.orderid_bk AND foh.orderstateid_bk = 2
-        WHERE {filter} AND {valid_customer_filter}
+            SUM(fos.paid_tax_incl) AS total_spent,
+            COUNT(fos.orderid_bk) AS order_count
+        FROM fact_order_snapshot fos
+        JOIN median_calc mc ON fos.paid_tax_incl > mc.median_order_total
+        JOIN dim_customer dc ON fos.customer_sk = dc.customer_key
+        WHERE fos.order_date_sk BETWEEN :date_sk_start AND :date_sk_end AND fos.is_paid AND {valid_customer_filter}
+        GROUP BY dc.customerid_bk
+        ORDER BY total_spent DESC;
+        """,
+        "sketch_query": """
+        SELECT 
+            dc.customerid_bk AS customer_id,
+            SUM(fos.paid_tax_incl) AS total_spent,
+            COUNT(fos.orderid_bk) AS order_count
+        FROM fact_order_snapshot fos
+        JOIN dim_customer dc ON fos.customer_sk = dc.customer_key
+        WHERE fos.order_date_sk BETWEEN :date_sk_start AND :date_sk_end AND fos.is_paid AND fos.paid_tax_incl > :median_order_total AND {valid_customer_filter}
         GROUP BY dc.customerid_bk
         ORDER BY total_spent DESC;
         """,
     },
 }
 
+
+USE_AGGREGATE_TABLES = True
+
+# exact mode disables the approximate distinct counts and medians from sketches.py
+SKETCH_EXACT_MODE = False
+
+dashboard_aggregate_queries = {
+    "orders_paid_query": """
+    SELECT
+        SUM(a.orders_paid_count) AS orders_paid_count,
+        SUM(a.orders_paid_revenue) AS total_revenue
+    FROM agg_daily_orders a
+    WHERE a.date_sk BETWEEN :date_sk_start AND :date_sk_end
+    """,
+    "orders_query": """
+    SELECT
+        SUM(a.orders_count) AS orders_count
+    FROM agg_daily_orders a
+    WHERE a.date_sk BETWEEN :date_sk_start AND :date_sk_end
+    """,
+    "period_revenue": """
+    SELECT
+        TO_CHAR(dd.date, '{date_format}') AS period,
+        SUM(a.order_revenue) AS total_revenue
+    FROM agg_daily_paid_carrier a
+    JOIN dim_date dd ON a.date_sk = dd.date_key
+    WHERE a.date_sk BETWEEN :date_sk_start AND :date_sk_end
+    GROUP BY period
+    ORDER BY period;
+    """,
+    "carrier_revenue_orders_distribution": """
+    SELECT
+        a.carrier,
+        SUM(a.order_revenue) AS total_revenue,
+        SUM(a.order_count) AS total_count
+    FROM agg_daily_paid_carrier a
+    WHERE a.date_sk BETWEEN :date_sk_start AND :date_sk_end
+    GROUP BY a.carrier
+    ORDER BY total_revenue DESC;
+    """,
+    "top_manufacturer_revenue_distribution": """
+    SELECT
+        dp.manufacturer,
+        SUM(a.line_revenue) AS total_revenue
+    FROM agg_daily_paid_product a
+    JOIN dim_product dp ON a.product_sk = dp.product_key
+    WHERE a.date_sk BETWEEN :date_sk_start AND :date_sk_end
+    GROUP BY dp.manufacturer
+    ORDER BY total_revenue DESC
+    LIMIT 10;
+    """,
+    "market_group_revenue_distribution": """
+    SELECT
+        dp.market_group,
+        SUM(a.line_revenue) AS total_revenue
+    FROM agg_daily_paid_product a
+    JOIN dim_product dp ON a.product_sk = dp.product_key
+    WHERE a.date_sk BETWEEN :date_sk_start AND :date_sk_end
+    GROUP BY dp.market_group
+    ORDER BY total_revenue DESC;
+    """,
+    "paid_order_groupings": """
+    SELECT 'period_revenue' AS grouping_set, TO_CHAR(dd.date, '{date_format}') AS period, NULL::TEXT AS carrier, NULL::TEXT AS manufacturer, NULL::TEXT AS market_group,
+        SUM(a.order_revenue) AS order_revenue, SUM(a.order_count) AS order_count, NULL::NUMERIC AS line_revenue, 0::BIGINT AS line_count
+    FROM agg_daily_paid_carrier a
+    JOIN dim_date dd ON a.date_sk = dd.date_key
+    WHERE a.date_sk BETWEEN :date_sk_start AND :date_sk_end
+    GROUP BY 2
+    UNION ALL
+    SELECT 'carrier_revenue_orders_distribution', NULL, a.carrier, NULL, NULL,
+        SUM(a.order_revenue), SUM(a.order_count), NULL, 0
+    FROM agg_daily_paid_carrier a
+    WHERE a.date_sk BETWEEN :date_sk_start AND :date_sk_end
+    GROUP BY a.carrier
+    UNION ALL
+    SELECT 'top_manufacturer_revenue_distribution', NULL, NULL, dp.manufacturer, NULL,
+        NULL, 0, SUM(a.line_revenue), SUM(a.line_count)
+    FROM agg_daily_paid_product a
+    JOIN dim_product dp ON a.product_sk = dp.product_key
+    WHERE a.date_sk BETWEEN :date_sk_start AND :date_sk_end
+    GROUP BY dp.manufacturer
+    UNION ALL
+    SELECT 'market_group_revenue_distribution', NULL, NULL, NULL, dp.market_group,
+        NULL, 0, SUM(a.line_revenue), SUM(a.line_count)
+    FROM agg_daily_paid_product a
+    JOIN dim_product dp ON a.product_sk = dp.product_key
+    WHERE a.date_sk BETWEEN :date_sk_start AND :date_sk_end
+    GROUP BY dp.market_group;
+    """,
+}
+
+reports_aggregate_queries = {
+    "age_distribution": """
+    SELECT
+        a.age_band AS age_range,
+        SUM(a.order_value) / NULLIF(SUM(a.order_count), 0) AS avg_order_value
+    FROM agg_daily_customer a
+    JOIN dim_customer dc ON a.customer_sk = dc.customer_key
+    WHERE a.date_sk BETWEEN :date_sk_start AND :date_sk_end AND {valid_customer_filter}
+    GROUP BY a.age_band
+    ORDER BY a.age_band;
+    """,
+    "product_group_revenue": """
+    SELECT
+        TO_CHAR(dd.date, '{date_format}') AS period,
+        SUM(a.order_revenue) AS total_revenue
+    FROM agg_daily_product_orders a
+    JOIN dim_date dd ON a.date_sk = dd.date_key
+    JOIN dim_product dp ON a.product_sk = dp.product_key
+    WHERE a.date_sk BETWEEN :date_sk_start AND :date_sk_end AND {valid_product_filter} AND ({group_filter})
+    GROUP BY period
+    ORDER BY period;
+    """,
+    "product_gender_revenue": """
+    SELECT
+        TO_CHAR(dd.date, '{date_format}') AS period,
+        SUM(a.order_revenue) AS total_revenue
+    FROM agg_daily_product_orders a
+    JOIN dim_date dd ON a.date_sk = dd.date_key
+    JOIN dim_product dp ON a.product_sk = dp.product_key
+    WHERE a.date_sk BETWEEN :date_sk_start AND :date_sk_end AND {valid_product_filter} AND ({group_filter})
+    GROUP BY period
+    ORDER BY period;
+    """,
+}
+
+def route_dashboard_query(name):
+    if USE_AGGREGATE_TABLES and name in dashboard_aggregate_queries:
+        return dashboard_aggregate_queries[name]
+    return dashboard_queries[name]
+
+def route_report_query(report_type, use_sketches=False):
+    if use_sketches and "sketch_query" in reports_queries[report_type]:
+        return reports_queries[report_type]["sketch_query"]
+    if USE_AGGREGATE_TABLES and report_type in reports_aggregate_queries:
+        return reports_aggregate_queries[report_type]
+    return reports_queries[report_type]["query"]
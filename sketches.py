@@ -0,0 +1,232 @@
+import os
+import json
+import math
+import threading
+
+import numpy as np
+from sqlalchemy import text
+
+from key_filter import hash_keys
+
+SKETCH_DIR = 'indexes'
+SKETCH_META_PATH = os.path.join(SKETCH_DIR, 'sketches.json')
+CART_HLL_PATH = os.path.join(SKETCH_DIR, 'cart_hll.npy')
+ORDER_VALUE_PATH = os.path.join(SKETCH_DIR, 'order_value_hist.npy')
+
+# bumped when stored sketches have to be rebuilt, 2 stopped counting NULL order values as 0
+SKETCH_FORMAT_VERSION = 2
+
+HLL_PRECISION = 12
+HLL_REGISTERS = 1 << HLL_PRECISION
+
+# relative accuracy of the order value histogram buckets
+ORDER_VALUE_ACCURACY = 0.02
+ORDER_VALUE_MIN = 0.01
+ORDER_VALUE_MAX = 10000000.0
+ORDER_VALUE_GAMMA = (1 + ORDER_VALUE_ACCURACY) / (1 - ORDER_VALUE_ACCURACY)
+ORDER_VALUE_OFFSET = int(math.floor(math.log(ORDER_VALUE_MIN, ORDER_VALUE_GAMMA)))
+ORDER_VALUE_BUCKETS = int(math.ceil(math.log(ORDER_VALUE_MAX, ORDER_VALUE_GAMMA))) - ORDER_VALUE_OFFSET + 1
+
+# each source is caught up by its surrogate key, queries return (key, date_sk, value)
+SKETCH_SOURCES_CONFIG = {
+    "fact_cart_line": {
+        "query": """
+        SELECT cartline_key, date_sk, cartid_bk
+        FROM dma_dwh.public.fact_cart_line
+        WHERE cartline_key > :last_key
+        ORDER BY cartline_key;
+        """,
+        "add": "add_carts",
+    },
+    "fact_order": {
+        "query": """
+        SELECT order_key, date_sk, paid_tax_incl
+        FROM dma_dwh.public.fact_order
+        WHERE order_key > :last_key
+        ORDER BY order_key;
+        """,
+        "add": "add_order_values",
+    },
+}
+
+sketch_state = {"mtime": None, "store": None}
+sketch_lock = threading.Lock()
+
+
+def leading_zeros(values):
+    high = (values >> np.uint64(32)).astype(np.float64)
+    low = (values & np.uint64(0xffffffff)).astype(np.float64)
+    zeros = np.where(high > 0, 31 - np.floor(np.log2(np.maximum(high, 1))), 63 - np.floor(np.log2(np.maximum(low, 1))))
+    zeros[(high == 0) & (low == 0)] = 64
+    return zeros.astype(np.int64)
+
+def hll_estimate(registers):
+    m = registers.shape[-1]
+    alpha = 0.7213 / (1 + 1.079 / m)
+    estimate = alpha * m * m / np.sum(np.ldexp(1.0, -registers.astype(np.int64)))
+    zeros = int(np.count_nonzero(registers == 0))
+    if estimate <= 2.5 * m and zeros > 0:
+        estimate = m * math.log(m / zeros)
+    return estimate
+
+def order_value_buckets(values):
+    values = np.asarray(values, dtype=np.float64)
+    buckets = np.zeros(len(values), dtype=np.int64)
+    positive = values >= ORDER_VALUE_MIN
+    buckets[positive] = np.ceil(np.log(values[positive]) / math.log(ORDER_VALUE_GAMMA)).astype(np.int64) - ORDER_VALUE_OFFSET
+    return np.clip(buckets, 0, ORDER_VALUE_BUCKETS - 1)
+
+def order_value_bucket_value(bucket):
+    if bucket == 0:
+        return 0.0
+    return 2 * ORDER_VALUE_GAMMA ** (bucket + ORDER_VALUE_OFFSET) / (ORDER_VALUE_GAMMA + 1)
+
+class SketchStore:
+    def __init__(self, first_key, cart_hll=None, order_values=None, last_keys=None):
+        self.first_key = first_key
+        self.cart_hll = cart_hll if cart_hll is not None else np.zeros((0, HLL_REGISTERS), dtype=np.uint8)
+        self.order_values = order_values if order_values is not None else np.zeros((0, ORDER_VALUE_BUCKETS), dtype=np.uint32)
+        self.last_keys = last_keys or {}
+
+    def rows(self, date_keys):
+        date_keys = np.asarray(date_keys, dtype=np.int64)
+        if self.first_key is None:
+            self.first_key = int(date_keys.min())
+
+        if date_keys.min() < self.first_key:
+            shift = self.first_key - int(date_keys.min())
+            self.cart_hll = np.concatenate([np.zeros((shift, HLL_REGISTERS), dtype=np.uint8), self.cart_hll])
+            self.order_values = np.concatenate([np.zeros((shift, ORDER_VALUE_BUCKETS), dtype=np.uint32), self.order_values])
+            self.first_key -= shift
+
+        rows = date_keys - self.first_key
+        size = int(rows.max()) + 1
+        if size > len(self.cart_hll):
+            self.cart_hll = np.concatenate([self.cart_hll, np.zeros((size - len(self.cart_hll), HLL_REGISTERS), dtype=np.uint8)])
+        if size > len(self.order_values):
+            self.order_values = np.concatenate([self.order_values, np.zeros((size - len(self.order_values), ORDER_VALUE_BUCKETS), dtype=np.uint32)])
+        return rows
+
+    def add_carts(self, date_keys, cart_ids):
+        # NULL ids are skipped like in COUNT(DISTINCT)
+        cart_ids = np.asarray(cart_ids, dtype=np.float64)
+        present = ~np.isnan(cart_ids)
+        date_keys, cart_ids = np.asarray(date_keys)[present], cart_ids[present]
+        if len(date_keys) == 0:
+            return
+        rows = self.rows(date_keys)
+        hashed = hash_keys([cart_ids.astype(np.int64)])
+        registers = (hashed >> np.uint64(64 - HLL_PRECISION)).astype(np.int64)
+        ranks = np.minimum(leading_zeros(hashed << np.uint64(HLL_PRECISION)) + 1, 64 - HLL_PRECISION + 1).astype(np.uint8)
+        np.maximum.at(self.cart_hll, (rows, registers), ranks)
+
+    def add_order_values(self, date_keys, values):
+        # NULL values are skipped like in PERCENTILE_CONT
+        values = np.asarray(values, dtype=np.float64)
+        present = ~np.isnan(values)
+        date_keys, values = np.asarray(date_keys)[present], values[present]
+        if len(date_keys) == 0:
+            return
+        rows = self.rows(date_keys)
+        np.add.at(self.order_values, (rows, order_value_buckets(values)), 1)
+
+    def key_slice(self, start_key, end_key, size):
+        if self.first_key is None:
+            return slice(0, 0)
+        return slice(max(start_key - self.first_key, 0), max(min(end_key - self.first_key + 1, size), 0))
+
+    def distinct_carts(self, start_key, end_key):
+        registers = self.cart_hll[self.key_slice(start_key, end_key, len(self.cart_hll))]
+        if len(registers) == 0:
+            return 0
+        merged = registers.max(axis=0)
+        if not merged.any():
+            return 0
+        return int(round(hll_estimate(merged)))
+
+    def order_value_quantile(self, start_key, end_key, quantile):
+        counts = self.order_values[self.key_slice(start_key, end_key, len(self.order_values))].sum(axis=0, dtype=np.int64)
+        total = int(counts.sum())
+        if total == 0:
+            return None
+
+        rank = quantile * (total - 1)
+        cumulative = np.cumsum(counts)
+        lower = int(np.searchsorted(cumulative, math.floor(rank) + 1))
+        upper = int(np.searchsorted(cumulative, math.ceil(rank) + 1))
+        fraction = rank - math.floor(rank)
+        return order_value_bucket_value(lower) * (1 - fraction) + order_value_bucket_value(upper) * fraction
+
+    def save(self):
+        os.makedirs(SKETCH_DIR, exist_ok=True)
+        for path, values in ((CART_HLL_PATH, self.cart_hll), (ORDER_VALUE_PATH, self.order_values)):
+            tmp_path = f"{path}.{os.getpid()}.tmp.npy"
+            np.save(tmp_path, values)
+            os.replace(tmp_path, path)
+
+        tmp_meta_path = f"{SKETCH_META_PATH}.{os.getpid()}.tmp"
+        with open(tmp_meta_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                "first_key": self.first_key,
+                "last_keys": self.last_keys,
+                "format_version": SKETCH_FORMAT_VERSION,
+                "hll_precision": HLL_PRECISION,
+                "order_value_buckets": ORDER_VALUE_BUCKETS,
+            }, f)
+        os.replace(tmp_meta_path, SKETCH_META_PATH)
+
+    @classmethod
+    def load(cls, mmap_mode=None):
+        with open(SKETCH_META_PATH, encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get("format_version") != SKETCH_FORMAT_VERSION or meta["hll_precision"] != HLL_PRECISION or meta["order_value_buckets"] != ORDER_VALUE_BUCKETS:
+            raise ValueError("Neplatné parametre skíc")
+        return cls(meta["first_key"], np.load(CART_HLL_PATH, mmap_mode=mmap_mode), np.load(ORDER_VALUE_PATH, mmap_mode=mmap_mode), meta["last_keys"])
+
+def load_sketch_store():
+    if os.path.exists(SKETCH_META_PATH):
+        try:
+            return SketchStore.load()
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Skice nie je možné načítať, vytvoria sa znova: {e}")
+    return SketchStore(None)
+
+def update_sketches(dwh_engine, table_name, chunksize=100000):
+    config = SKETCH_SOURCES_CONFIG[table_name]
+    store = load_sketch_store()
+    last_key = store.last_keys.get(table_name, 0)
+    if last_key == 0:
+        print(f"Vytváranie skíc z tabuľky `{table_name}`...")
+
+    added = 0
+    with dwh_engine.connect().execution_options(stream_results=True) as conn:
+        result = conn.execute(text(config["query"]), {"last_key": last_key})
+        while True:
+            rows = result.fetchmany(chunksize)
+            if not rows:
+                break
+            values = np.array([[np.nan if value is None else float(value) for value in row] for row in rows], dtype=np.float64)
+            getattr(store, config["add"])(values[:, 1].astype(np.int64), values[:, 2])
+            last_key = int(values[-1, 0])
+            added += len(rows)
+
+    store.last_keys[table_name] = last_key
+    store.save()
+    print(f"Skice z tabuľky `{table_name}` aktualizované, pridané riadky: {added}.")
+
+def get_sketch_store():
+    try:
+        mtime = os.stat(SKETCH_META_PATH).st_mtime_ns
+    except OSError:
+        return None
+
+    with sketch_lock:
+        if sketch_state["mtime"] != mtime:
+            try:
+                sketch_state["store"] = SketchStore.load(mmap_mode='r')
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Skice nie je možné načítať: {e}")
+                return None
+            sketch_state["mtime"] = mtime
+
+        return sketch_state["store"]
@@ -1,23 +1,43 @@
 import hashlib
 import json
 from celery import Celery
-from celery.signals import task_revoked
+from celery.signals import task_revoked, worker_process_init
 from celery.contrib.abortable import AbortableTask
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 import pandas as pd
-import plotly.graph_objects as go
 from datetime import datetime
 import time
 import gc
-from celeryconfig import broker_url, result_backend, PROD_DB_URI, STAGE_DB_URI, DWH_DB_URI
+from figures import trace, layout as figure_layout, figure_json, downsample_periods, period_axis_title
+from celeryconfig import broker_url, result_backend
+from engines import get_engine, dispose_engines
+
+from reconcile_stage import reconcile_table
+from transform_stage import transform_stage_tables, missing_stage_tables
+from dashboard.cache import publish_etl_version, get_etl_version
+from filter_catalogue import build_filter_catalogue
+from aggregates import build_aggregate_tables
+from migrations import apply_migrations
+from partitions import FACT_TABLES_CONFIG, maintain_fact_partitions, partition_fact_table, archive_fact_partitions
+from daily_totals import build_daily_totals
+from analytic_cache import export_analytic_cache, read_analytic_report
+from load_to_dwh import to_category, load_dim_date, load_dim_time, load_dim_address, load_dim_customer, load_dim_attribute, load_dim_product, load_bridge_product_attribute, load_dim_order_state, load_fact_cart_line, load_fact_order_line, load_fact_order_history, load_fact_order, load_fact_order_snapshot
 
-from load_to_dwh import load_dim_date, load_dim_time, load_dim_address, load_dim_customer, load_dim_attribute, load_dim_product, load_bridge_product_attribute, load_dim_order_state, load_fact_cart_line, load_fact_order_line, load_fact_order_history, load_fact_order
 celery_app = Celery('etl_tasks', broker=broker_url, backend=result_backend)
 celery_app.config_from_object('celeryconfig')
 
-prod_engine = create_engine(PROD_DB_URI)
-stage_engine = create_engine(STAGE_DB_URI)
-dwh_engine = create_engine(DWH_DB_URI)
+prod_engine = get_engine("prod", "worker")
+stage_engine = get_engine("stage", "worker")
+dwh_engine = get_engine("dwh", "worker")
+
+@worker_process_init.connect
+def reset_engine_pools(**kwargs):
+    dispose_engines()
+
+# only ETL workers run with copy-on-write, the web process importing this module keeps pandas defaults
+@worker_process_init.connect
+def enable_copy_on_write(**kwargs):
+    pd.set_option('mode.copy_on_write', True)
 
 ET_TABLES_CONFIG = {
     "ps_address": {
@@ -185,6 +205,7 @@ ET_TABLES_CONFIG = {
             "date_add": lambda x: None if pd.isnull(x) or x == "0000-00-00 00:00:00" else x,
             "date_upd": lambda x: None if pd.isnull(x) or x == "0000-00-00 00:00:00" else x,
         },
+        "category_fields": ["season", "group", "subgroup", "gender"],
         "target": "sg_product"
     },
     "ps_stock_available": {
@@ -201,6 +222,7 @@ ET_TABLES_CONFIG = {
             "date_add": lambda x: None if pd.isnull(x) or x == "0000-00-00 00:00:00" else x,
             "date_upd": lambda x: None if pd.isnull(x) or x == "0000-00-00 00:00:00" else x,
         },
+        "category_fields": ["carrier"],
         "target": "sg_cart"
     },
     "ps_orders": {
@@ -210,6 +232,7 @@ ET_TABLES_CONFIG = {
             "date_upd": lambda x: None if pd.isnull(x) or x == "0000-00-00 00:00:00" else x,
             "review_mail_sent": lambda x: None if pd.isnull(x) else bool(x),
         },
+        "category_fields": ["carrier", "payment"],
         "target": "sg_orders",
     },
     "ps_order_detail": {
@@ -217,6 +240,7 @@ ET_TABLES_CONFIG = {
         "convert_fields": {
             "tax_rate": lambda x: 0.0 if pd.isnull(x) else x,
         },
+        "category_fields": ["tax_name"],
         "target": "sg_order_detail"
     },
     "ps_order_payment": {
@@ -225,6 +249,7 @@ ET_TABLES_CONFIG = {
             "id_order": lambda x: 0 if pd.isnull(x) else int(x),
             "date_add": lambda x: None if pd.isnull(x) or x == "0000-00-00 00:00:00" else x,
         },
+        "category_fields": ["payment_method"],
         "target": "sg_order_payment"
     },
     "ps_state": {
@@ -234,6 +259,104 @@ ET_TABLES_CONFIG = {
     },
 }
 
+RECONCILE_TABLES_CONFIG = {
+    "ps_address": {
+        "key": "id_address",
+        "kinds": {"date_add": "datetime", "date_upd": "datetime", "active": "bool", "deleted": "bool", "default": "bool", "has_phone": "bool"},
+    },
+    "ps_country": {
+        "key": "id_country",
+        "kinds": {"active": "bool", "contains_states": "bool", "need_zip_code": "bool"},
+    },
+    "ps_customer": {
+        "key": "id_customer",
+        "kinds": {"birthday": "date", "newsletter": "bool", "active": "bool", "is_guest": "bool", "deleted": "bool", "date_add": "datetime", "date_upd": "datetime"},
+    },
+    "ps_customer_company": {
+        "key": "id_customer_company",
+        "kinds": {"name": "sha256", "verified": "bool", "active": "bool", "date_add": "datetime", "date_upd": "datetime"},
+    },
+    "ps_customer_group": {
+        "key": "id_customer",
+    },
+    "ps_gender": {
+        "key": "id_gender",
+    },
+    "ps_group": {
+        "key": "id_group",
+        "kinds": {"date_add": "datetime", "date_upd": "datetime", "is_wholesale": "bool"},
+    },
+    "ps_category": {
+        "key": "id_category",
+        "kinds": {"active": "bool", "date_add": "datetime", "date_upd": "datetime", "is_root_category": "bool"},
+    },
+    "ps_manufacturer": {
+        "key": "id_manufacturer",
+        "kinds": {"date_add": "datetime", "date_upd": "datetime", "active": "bool"},
+    },
+    "ps_product_attribute_combination": {
+        "key": "id_product_attribute",
+    },
+    "ps_attribute": {
+        "key": "id_attribute",
+    },
+    "ps_attribute_group": {
+        "key": "id_attribute_group",
+        "kinds": {"is_color_group": "bool"},
+    },
+    "ps_currency": {
+        "key": "id_currency",
+        "kinds": {"blank": "bool", "format": "bool", "deleted": "bool", "active": "bool", "conversion_rate": "decimal", "default_vat_rate": "decimal"},
+    },
+    "ps_cart_product": {
+        "key": "id_cart",
+        "kinds": {"date_add": "datetime"},
+    },
+    "ps_order_history": {
+        "key": "id_order_history",
+        "kinds": {"date_add": "datetime"},
+    },
+    "ps_order_state": {
+        "key": "id_order_state",
+        "kinds": {"invoice": "bool", "slip": "bool", "unremovable": "bool", "hidden": "bool", "shipped": "bool", "paid": "bool", "is_canceled_state": "bool", "can_send_repay": "bool", "can_be_canceled": "bool"},
+    },
+    "ps_order_slip": {
+        "key": "id_order_slip",
+        "kinds": {"conversion_rate": "decimal", "total_products_tax_excl": "decimal", "total_products_tax_incl": "decimal", "total_shipping_tax_excl": "decimal", "total_shipping_tax_incl": "decimal", "amount": "decimal", "shipping_cost_amount": "decimal", "partial": "bool", "date_add": "datetime", "date_upd": "datetime"},
+    },
+    "ps_order_slip_detail": {
+        "key": "id_order_slip",
+        "kinds": {"unit_price_tax_excl": "decimal", "unit_price_tax_incl": "decimal", "total_price_tax_excl": "decimal", "total_price_tax_incl": "decimal", "amount_tax_excl": "decimal", "amount_tax_incl": "decimal"},
+    },
+    "ps_product": {
+        "key": "p.id_product",
+        "kinds": {"price": "decimal", "wholesale_price": "decimal", "rental_price": "decimal", "active": "bool", "available_for_order": "bool", "date_add": "datetime", "date_upd": "datetime"},
+    },
+    "ps_stock_available": {
+        "key": "sa.id_stock_available",
+        "kinds": {"date_add": "datetime", "date_upd": "datetime"},
+    },
+    "ps_cart": {
+        "key": "crt.id_cart",
+        "kinds": {"date_add": "datetime", "date_upd": "datetime"},
+    },
+    "ps_orders": {
+        "key": "o.id_order",
+        "kinds": {"conversion_rate": "decimal", "total_discounts": "decimal", "total_discounts_tax_incl": "decimal", "total_discounts_tax_excl": "decimal", "total_paid": "decimal", "total_paid_tax_incl": "decimal", "total_paid_tax_excl": "decimal", "total_paid_real": "decimal", "total_products": "decimal", "total_products_wt": "decimal", "total_shipping": "decimal", "total_shipping_tax_incl": "decimal", "total_shipping_tax_excl": "decimal", "carrier_tax_rate": "decimal", "total_cod_tax_incl": "decimal", "date_add": "datetime", "date_upd": "datetime", "review_mail_sent": "bool"},
+    },
+    "ps_order_detail": {
+        "key": "od.id_order_detail",
+        "kinds": {"product_price": "decimal", "reduction_amount": "decimal", "reduction_amount_tax_incl": "decimal", "reduction_amount_tax_excl": "decimal", "total_price_tax_incl": "decimal", "total_price_tax_excl": "decimal", "unit_price_tax_incl": "decimal", "unit_price_tax_excl": "decimal", "purchase_supplier_price": "decimal", "tax_rate": "decimal_or_zero"},
+    },
+    "ps_order_payment": {
+        "key": "op.id_order_payment",
+        "kinds": {"id_order": "int_or_zero", "amount": "decimal", "date_add": "datetime"},
+    },
+    "ps_state": {
+        "key": "state.id_state",
+    },
+}
+
 L_TABLES_CONFIG = {
     "dim_date": load_dim_date,
     "dim_time": load_dim_time,
@@ -247,6 +370,7 @@ L_TABLES_CONFIG = {
     "fact_order_line": load_fact_order_line,
     "fact_order_history": load_fact_order_history,
     "load_fact_order": load_fact_order,
+    "fact_order_snapshot": load_fact_order_snapshot,
 }
 
 @task_revoked.connect
@@ -280,7 +404,7 @@ def clear_stage_tables(self, tables):
 
     print("Vyprázdnenie tabuliek dočasného úložiska dokončené.")
 
-def et_table(self, table_name, query, target_table, convert_items, chunksize=10000):
+def et_table(self, table_name, query, target_table, convert_items, category_fields=(), chunksize=10000):
     if self.is_aborted():
         print("Úloha zrušená")
         return
@@ -288,6 +412,7 @@ def et_table(self, table_name, query, target_table, convert_items, chunksize=100
 
     with prod_engine.connect().execution_options(stream_results=True) as conn:
         for chunk in pd.read_sql_query(text(query), con=conn, chunksize=chunksize):
+            chunk = to_category(chunk, category_fields)
             for field, convert_func in convert_items:
                 chunk[field] = chunk[field].apply(convert_func)
 
@@ -374,8 +499,11 @@ def stage_reload_task(self, *args, **kwargs):
             if self.is_aborted():
                 print("Úloha zrušená")
                 break
-            et_table(self, table_name, config["select"], config["target"], ET_TABLES_CONFIG[table_name].get("convert_fields", {}).items())
+            et_table(self, table_name, config["select"], config["target"], ET_TABLES_CONFIG[table_name].get("convert_fields", {}).items(), config.get("category_fields", []))
             tables_processed += 1
+        if self.is_aborted():
+            return {"status": "REVOKED", "tables": tables_processed}
+        tables_processed += transform_stage_tables(self, stage_engine)
         if self.is_aborted():
             return {"status": "REVOKED", "tables": tables_processed}
         update_etl_log(log_id, "SUCCESS", "Načítanie dočasného úložiska dokončené.", tables_processed)
@@ -387,6 +515,38 @@ def stage_reload_task(self, *args, **kwargs):
 
     return ret_status
 
+@celery_app.task(bind=True, base=AbortableTask)
+def stage_reconcile_task(self, *args, **kwargs):
+    if self.is_aborted():
+        return {"status": "REVOKED", "tables": 0}
+
+    job_name = "stage_reconcile"
+    log_id = insert_etl_log(job_name, self.request.id)
+
+    print("Porovnanie dočasného úložiska s operačnou databázou spustené.")
+
+    try:
+        tables_processed = 0
+        resynced_ranges = 0
+        for table_name, config in ET_TABLES_CONFIG.items():
+            if self.is_aborted():
+                print("Úloha zrušená")
+                break
+            resynced_ranges += reconcile_table(self, prod_engine, stage_engine, table_name, config, RECONCILE_TABLES_CONFIG[table_name])
+            tables_processed += 1
+        if self.is_aborted():
+            return {"status": "REVOKED", "tables": tables_processed}
+        tables_processed += transform_stage_tables(self, stage_engine)
+        if self.is_aborted():
+            return {"status": "REVOKED", "tables": tables_processed}
+        update_etl_log(log_id, "SUCCESS", f"Porovnanie dočasného úložiska dokončené, obnovené rozsahy: {resynced_ranges}.", tables_processed)
+        ret_status = {"status": "SUCCESS", "tables": tables_processed}
+    except Exception as e:
+        update_etl_log(log_id, "FAILED", str(e))
+        ret_status = {"status": "FAILED", "tables": 0}
+
+    return ret_status
+
 @celery_app.task(bind=True, base=AbortableTask)
 def dwh_incremental_task(self, *args, **kwargs):
     if self.is_aborted():
@@ -408,6 +568,13 @@ def dwh_incremental_task(self, *args, **kwargs):
         return {"status": "SUCCESS", "tables": 0}
 
     try:
+        if missing_stage_tables(stage_engine):
+            transform_stage_tables(self, stage_engine)
+
+        apply_migrations(self, "stage", stage_engine)
+        apply_migrations(self, "dwh", dwh_engine)
+        maintain_fact_partitions(self, dwh_engine)
+
         tables_processed = 0
         for table_name, load_function in L_TABLES_CONFIG.items():
             if table_name == "dim_date":
@@ -427,18 +594,60 @@ def dwh_incremental_task(self, *args, **kwargs):
             load_function(self, stage_engine, dwh_engine)
             tables_processed += 1
 
+        build_aggregate_tables(self, dwh_engine)
+        build_daily_totals(self, dwh_engine, log_id)
+        try:
+            export_analytic_cache(self, dwh_engine, log_id)
+        except Exception as e:
+            print(f"Export do analytickej cache zlyhal: {e}")
+        build_filter_catalogue(self, dwh_engine)
+
         print("Načítanie do dátového skladu dokončené.")
 
         if self.is_aborted():
             return {"status": "REVOKED", "tables": tables_processed}
 
         update_etl_log(log_id, "SUCCESS", "Načítanie do dátového skladu dokončené.", tables_processed)
+        publish_etl_version(log_id)
         return {"status": "SUCCESS", "rows": tables_processed}
     except Exception as e:
         print(e)
         update_etl_log(log_id, "FAILED", str(e))
         # raise e
 
+@celery_app.task(bind=True, base=AbortableTask)
+def dwh_partitions_task(self, *args, **kwargs):
+    if self.is_aborted():
+        return {"status": "REVOKED", "tables": 0}
+
+    job_name = "dwh_partitions"
+    log_id = insert_etl_log(job_name, self.request.id)
+
+    # archive_before (YYYY-MM-DD) detaches older monthly partitions into the archive schema
+    archive_before = kwargs.get("archive_before")
+
+    try:
+        tables_processed = 0
+        for table_name in FACT_TABLES_CONFIG:
+            if self.is_aborted():
+                return {"status": "REVOKED", "tables": tables_processed}
+            partition_fact_table(self, dwh_engine, table_name)
+            tables_processed += 1
+
+        maintain_fact_partitions(self, dwh_engine)
+
+        message = "Partície faktových tabuliek sú pripravené."
+        if archive_before:
+            archived = archive_fact_partitions(self, dwh_engine, datetime.strptime(archive_before, "%Y-%m-%d").date())
+            message = f"{message} Archivované partície: {len(archived)}."
+
+        update_etl_log(log_id, "SUCCESS", message, tables_processed)
+        return {"status": "SUCCESS", "tables": tables_processed}
+    except Exception as e:
+        print(e)
+        update_etl_log(log_id, "FAILED", str(e))
+        return {"status": "FAILED", "tables": 0}
+
 def insert_report(user_id, report_type, parameters, task_id):
     with dwh_engine.begin() as conn:
         started_at = datetime.now()
@@ -488,6 +697,7 @@ def build_report_task(self, *args, **kwargs):
     show_diagram_table = args[0].get("show_diagram_table")
     prep_query = args[0].get("prep_query")
     query = args[0].get("query")
+    query_params = args[0].get("query_params") or {}
     report_filters = args[0].get("filters")
     parameters = {
         "user_id": user_id,
@@ -517,38 +727,45 @@ def build_report_task(self, *args, **kwargs):
         }
 
         try:
-            with dwh_engine.connect().execution_options(stream_results=True) as conn:
-                if isinstance(prep_query, list) is list and len(prep_query) > 0:
-                    for query in prep_query:
-                        conn.execute(text(query))
+            df = read_analytic_report(query, query_params, get_etl_version()) if not prep_query else None
+            if df is not None:
+                result["columns"] = df.columns.tolist()
+                result["total_rows"] = df.shape[0]
+                df.to_csv(export_filename, index=False)
+                del df
+            else:
+                with dwh_engine.connect().execution_options(stream_results=True) as conn:
+                    if isinstance(prep_query, list) is list and len(prep_query) > 0:
+                        for query in prep_query:
+                            conn.execute(text(query), query_params)
+
+                            if self.is_aborted():
+                                print("Úloha zrušená")
+                                return
+
+                    first_chunk = True
+                    for chunk in pd.read_sql_query(text(query), con=conn, params=query_params, chunksize=chunksize):
+                        result["total_rows"] += chunk.shape[0]
 
                         if self.is_aborted():
                             print("Úloha zrušená")
                             return
 
-                first_chunk = True
-                for chunk in pd.read_sql_query(text(query), con=conn, chunksize=chunksize):
-                    result["total_rows"] += chunk.shape[0]
-
-                    if self.is_aborted():
-                        print("Úloha zrušená")
-                        return
-
-                    if first_chunk:
-                        first_chunk = False
-                        result["columns"] = chunk.columns.tolist()
+                        if first_chunk:
+                            first_chunk = False
+                            result["columns"] = chunk.columns.tolist()
 
-                    chunk.to_csv(export_filename, mode='a', header=(not first_chunk), index=False)
+                        chunk.to_csv(export_filename, mode='a', header=(not first_chunk), index=False)
 
-                    if self.is_aborted():
-                        print("Úloha zrušená")
-                        return
+                        if self.is_aborted():
+                            print("Úloha zrušená")
+                            return
 
-                    del chunk
-                    gc.collect()
+                        del chunk
+                        gc.collect()
 
-                status = "SUCCESS"
-                message = 'Správa bola úspešne vytvorená.'
+            status = "SUCCESS"
+            message = 'Správa bola úspešne vytvorená.'
         except Exception as e:
             print(e)
             message = str(e)
@@ -556,15 +773,17 @@ def build_report_task(self, *args, **kwargs):
             update_report(report_id=report_id, status=status, message=message, result=json.dumps(result),
                           parameters=json.dumps(parameters))
     else:
-        with dwh_engine.connect() as conn:
-            if type(prep_query) is list and len(prep_query) > 0:
-                for query in prep_query:
-                    conn.execute(text(query))
-                    if self.is_aborted():
-                        print("Úloha zrušená")
-                        return
-
-            df = pd.read_sql_query(text(query), conn)
+        df = read_analytic_report(query, query_params, get_etl_version()) if not prep_query else None
+        if df is None:
+            with dwh_engine.connect() as conn:
+                if type(prep_query) is list and len(prep_query) > 0:
+                    for query in prep_query:
+                        conn.execute(text(query), query_params)
+                        if self.is_aborted():
+                            print("Úloha zrušená")
+                            return
+
+                df = pd.read_sql_query(text(query), conn, params=query_params)
         if self.is_aborted():
             print("Úloha zrušená")
             return
@@ -572,7 +791,8 @@ def build_report_task(self, *args, **kwargs):
         try:
             if report_type == 'gender_distribution':
                 df['gender'] = df['gender'].fillna('Neuvedené')
-                pie_trace = go.Pie(
+                pie_trace = trace(
+                    "pie",
                     labels=df['gender'],
                     values=df['customers_count'],
                     name=report_title,
@@ -581,7 +801,8 @@ def build_report_task(self, *args, **kwargs):
                     domain=dict(row=0, column=0)
                 )
 
-                table_trace = go.Table(
+                table_trace = trace(
+                    "table",
                     header=dict(
                         values=['Pohlavie', 'Počet zákazníkov'],
                         align='center',
@@ -601,7 +822,7 @@ def build_report_task(self, *args, **kwargs):
 
                 data = [pie_trace, table_trace]
 
-                layout = go.Layout(
+                layout = figure_layout(
                     title=report_title,
                     height=750,
                     grid=dict(rows=2, columns=1, pattern='independent'),
@@ -614,20 +835,22 @@ def build_report_task(self, *args, **kwargs):
                     autosize=True
                 )
 
-                fig = go.Figure(data=data, layout=layout)
-                result = fig.to_json()
+                fig = figure_json(data, layout)
+                result = fig
 
                 status = "SUCCESS"
                 message = 'Správa bola úspešne vytvorená.'
             elif report_type == 'age_distribution':
                 df['age_range'] = df['age_range'].fillna('Neuvedené')
                 df['avg_order_value'] = df['avg_order_value'].round(2)
-                bar_trace = go.Bar(
+                bar_trace = trace(
+                    "bar",
                     x=df['age_range'],
                     y=df['avg_order_value'],
                     name=report_title,
                 )
-                table_trace = go.Table(
+                table_trace = trace(
+                    "table",
                     header=dict(
                         values=['Vekový rozsah', 'Priemerná suma objednávky'],
                         align='center',
@@ -647,7 +870,7 @@ def build_report_task(self, *args, **kwargs):
 
                 data = [bar_trace, table_trace]
 
-                layout = go.Layout(
+                layout = figure_layout(
                     title=report_title,
                     height=750,
                     grid=dict(rows=2, columns=1, pattern='independent'),
@@ -665,20 +888,24 @@ def build_report_task(self, *args, **kwargs):
                     autosize=True,
                 )
 
-                fig = go.Figure(data=data, layout=layout)
-                result = fig.to_json()
+                fig = figure_json(data, layout)
+                result = fig
 
                 status = "SUCCESS"
                 message = 'Správa bola úspešne vytvorená.'
             elif report_type == 'product_group_revenue':
+                periods, total_revenue, granularity = downsample_periods(df['period'].to_numpy(), df['total_revenue'].to_numpy(), query_params.get("date_format"))
+                df = pd.DataFrame({'period': periods, 'total_revenue': total_revenue})
                 df['total_revenue'] = df['total_revenue'].round(2)
-                bar_trace = go.Bar(
+                bar_trace = trace(
+                    "bar",
                     x=df['period'],
                     y=df['total_revenue'],
                     name=report_title,
                     # marker=dict(color='rgb(55, 83, 109)')
                 )
-                table_trace = go.Table(
+                table_trace = trace(
+                    "table",
                     header=dict(
                         values=['Obdobie', 'Celkový príjem s DPH'],
                         align='center',
@@ -698,14 +925,14 @@ def build_report_task(self, *args, **kwargs):
 
                 data = [bar_trace, table_trace]
 
-                layout = go.Layout(
+                layout = figure_layout(
                     title=report_title,
                     height=750,
                     grid=dict(rows=2, columns=1, pattern='independent'),
                     xaxis=dict(
                         tickmode="linear",
                         dtick=1,
-                        title="Obdobie",
+                        title=period_axis_title("Obdobie", granularity),
                         type="category",
                         domain=[0, 1]
                     ),
@@ -714,24 +941,29 @@ def build_report_task(self, *args, **kwargs):
                         # domain=[0, 1],
                         domain=[0.55, 1],
                     ),
+                    meta=dict(granularity=granularity),
                     autosize=True,
                 )
 
-                fig = go.Figure(data=data, layout=layout)
-                result = fig.to_json()
+                fig = figure_json(data, layout)
+                result = fig
 
                 status = "SUCCESS"
                 message = 'Správa bola úspešne vytvorená.'
             elif report_type == 'product_gender_revenue':
+                periods, total_revenue, granularity = downsample_periods(df['period'].to_numpy(), df['total_revenue'].to_numpy(), query_params.get("date_format"))
+                df = pd.DataFrame({'period': periods, 'total_revenue': total_revenue})
                 df['total_revenue'] = df['total_revenue'].round(2)
-                bar_trace = go.Bar(
+                bar_trace = trace(
+                    "bar",
                     x=df['period'],
                     y=df['total_revenue'],
                     name=report_title,
                     # marker=dict(color='rgb(55, 83, 109)')
                 )
 
-                table_trace = go.Table(
+                table_trace = trace(
+                    "table",
                     header=dict(
                         values=['Obdobie', 'Celkový príjem s DPH'],
                         align='center',
@@ -750,14 +982,14 @@ def build_report_task(self, *args, **kwargs):
                 )
 
                 data = [bar_trace, table_trace]
-                layout = go.Layout(
+                layout = figure_layout(
                     title=report_title,
                     height=750,
                     grid=dict(rows=2, columns=1, pattern='independent'),
                     xaxis=dict(
                         tickmode="linear",
                         dtick=1,
-                        title="Obdobie",
+                        title=period_axis_title("Obdobie", granularity),
                         type="category",
                         domain=[0, 1]
                     ),
@@ -766,11 +998,12 @@ def build_report_task(self, *args, **kwargs):
                         # domain=[0, 1],
                         domain=[0.55, 1],
                     ),
+                    meta=dict(granularity=granularity),
                     autosize=True,
                 )
 
-                fig = go.Figure(data=data, layout=layout)
-                result = fig.to_json()
+                fig = figure_json(data, layout)
+                result = fig
 
                 status = "SUCCESS"
                 message = 'Správa bola úspešne vytvorená.'
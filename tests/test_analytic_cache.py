@@ -0,0 +1,83 @@
+import os
+import datetime
+import pytest
+import pandas as pd
+
+duckdb = pytest.importorskip("duckdb")
+
+import analytic_cache
+from analytic_cache import write_parquet, save_analytic_state, read_analytic_report, export_table
+from query_templates import compile_query
+
+def test_report_query_runs_on_parquet(tmp_path, monkeypatch):
+    monkeypatch.setattr(analytic_cache, "ANALYTIC_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(analytic_cache, "ANALYTIC_CACHE_STATE_PATH", str(tmp_path / "state.json"))
+    monkeypatch.setattr(analytic_cache, "ANALYTIC_TABLES_CONFIG", {"dim_date": {}, "fact_order": {"key": "order_key"}})
+
+    conn = duckdb.connect()
+    for table_name, df in {
+        "dim_date": pd.DataFrame({"date_key": [8767, 8799], "date": [datetime.date(2024, 1, 1), datetime.date(2024, 2, 2)]}),
+        "fact_order": pd.DataFrame({"order_key": [1, 2, 3], "date_sk": [8767, 8799, 8799], "paid_tax_incl": [1.5, 2.0, 3.0]}),
+    }.items():
+        os.makedirs(tmp_path / table_name)
+        write_parquet(conn, df, str(tmp_path / table_name / "full.parquet"))
+    save_analytic_state({"version": "7", "last_keys": {}})
+
+    query = compile_query("""
+    SELECT TO_CHAR(dd.date, '{date_format}') AS period, SUM(fo.paid_tax_incl) AS total_revenue
+    FROM fact_order fo
+    JOIN dim_date dd ON fo.date_sk = dd.date_key
+    WHERE fo.date_sk BETWEEN :date_sk_start AND :date_sk_end
+    GROUP BY period
+    ORDER BY period;
+    """)
+    params = {"date_sk_start": 8767, "date_sk_end": 9131, "date_format": "MM", "period_start": "2024-01-01"}
+
+    df = read_analytic_report(query, params, "7")
+    assert df["period"].tolist() == ["01", "02"]
+    assert df["total_revenue"].tolist() == [1.5, 5.0]
+
+    assert read_analytic_report(query, params, "8") is None
+
+class ChunkEngine:
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    def connect(self):
+        return self
+
+    def execution_options(self, **kwargs):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+def test_export_table_drops_parts_of_interrupted_run(tmp_path, monkeypatch):
+    monkeypatch.setattr(analytic_cache, "ANALYTIC_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(analytic_cache.pd, "read_sql_query", lambda query, con, params, chunksize: iter(con.chunks))
+    monkeypatch.setattr(analytic_cache, "table_fingerprint", lambda conn, table_name, key, last_key: (2, 2))
+
+    conn = duckdb.connect()
+    os.makedirs(tmp_path / "fact_order")
+    write_parquet(conn, pd.DataFrame({"order_key": [1, 2]}), str(tmp_path / "fact_order" / "part-00000000000000000002.parquet"))
+    write_parquet(conn, pd.DataFrame({"order_key": [3, 4]}), str(tmp_path / "fact_order" / "part-00000000000000000004.parquet"))
+
+    engine = ChunkEngine([pd.DataFrame({"order_key": [3, 4, 5]})])
+    exported, last_key, covered_rows = export_table(conn, engine, "fact_order", {"key": "order_key"}, 2, 2)
+    assert (exported, last_key, covered_rows) == (3, 5, 5)
+    assert sorted(os.listdir(tmp_path / "fact_order")) == ["part-00000000000000000002.parquet", "part-00000000000000000005.parquet"]
+
+    # the table was rebuilt, only 1 row is left at or below the stored key
+    engine = ChunkEngine([pd.DataFrame({"order_key": [1, 2, 3]})])
+    exported, last_key, covered_rows = export_table(conn, engine, "fact_order", {"key": "order_key"}, 2, 1)
+    assert (exported, last_key, covered_rows) == (3, 3, 3)
+    assert sorted(os.listdir(tmp_path / "fact_order")) == ["part-00000000000000000003.parquet"]
+
+    engine = ChunkEngine([pd.DataFrame({"x": [1, 2]}), pd.DataFrame({"x": [3]})])
+    exported, _, _ = export_table(conn, engine, "fact_order_snapshot", {}, 0)
+    assert exported == 3
+    assert sorted(os.listdir(tmp_path / "fact_order_snapshot")) == ["part-00000000000000000002.parquet", "part-00000000000000000003.parquet"]
+    assert conn.execute(f"SELECT SUM(x) FROM read_parquet('{tmp_path}/fact_order_snapshot/*.parquet')").fetchone()[0] == 6
@@ -0,0 +1,25 @@
+import datetime
+from sqlalchemy import create_engine
+import daily_totals
+from daily_totals import build_daily_totals, get_daily_totals, range_total, period_totals
+
+def test_daily_totals_ranges(tmp_path, monkeypatch):
+    monkeypatch.setattr(daily_totals, "DAILY_TOTALS_PATH", str(tmp_path / "daily_totals.npy"))
+    monkeypatch.setattr(daily_totals, "DAILY_TOTALS_META_PATH", str(tmp_path / "daily_totals.json"))
+    monkeypatch.setattr(daily_totals, "DAILY_TOTALS_QUERIES", {
+        "orders": "SELECT 8767 AS date_sk, 3 AS orders_count, 2 AS orders_paid_count, 10.5 AS orders_paid_revenue UNION ALL SELECT 8799, 1, 1, 4.0",
+        "paid": "SELECT 8767 AS date_sk, 2 AS paid_count, 10.5 AS paid_revenue UNION ALL SELECT 8800, 1, 4.0",
+        "cart_lines": "SELECT 8767 AS date_sk, 7 AS cart_lines_count",
+    })
+
+    assert get_daily_totals() is None
+    build_daily_totals(None, create_engine("sqlite://"), "1")
+    totals = get_daily_totals()
+
+    assert range_total(totals, "orders_count", datetime.date(2024, 1, 1), datetime.date(2024, 12, 31)) == 4
+    assert range_total(totals, "orders_paid_revenue", datetime.date(2024, 1, 2), datetime.date(2024, 2, 2)) == 4.0
+    assert range_total(totals, "cart_lines_count", datetime.date(2024, 1, 2), datetime.date(2024, 1, 31)) == 0
+
+    periods, values = period_totals(totals, "paid_revenue", "paid_count", datetime.date(2024, 1, 1), datetime.date(2024, 12, 31), "MM")
+    assert list(periods) == ["01", "02"]
+    assert list(values) == [10.5, 4.0]
@@ -88,4 +88,27 @@ def test_gender_distribution(app, client, auth_headers):
 
     data = response.get_json()
     assert 'data' in data
-    assert 'layout' in data
\ No newline at end of file
+    assert 'layout' in data
+
+def test_get_dashboard_data(app, client, auth_headers):
+    autologin_user(app, client)
+
+    response = client.get('/get-dashboard-data?widgets=summary,period_revenue', headers=auth_headers)
+    assert response.status_code == 200
+    assert response.is_json
+
+    data = response.get_json()
+    assert set(data) == {'summary', 'period_revenue'}
+    assert 'orders_count' in data['summary']
+    assert 'data' in data['period_revenue']
+    assert 'layout' in data['period_revenue']
+
+def test_period_revenue_not_modified(app, client, auth_headers):
+    autologin_user(app, client)
+
+    response = client.get('/get-period-revenue', headers=auth_headers)
+    assert response.status_code == 200
+    assert response.headers['ETag']
+
+    response = client.get('/get-period-revenue', headers={**auth_headers, 'If-None-Match': response.headers['ETag']})
+    assert response.status_code == 304
@@ -0,0 +1,39 @@
+import json
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+from figures import trace, layout as figure_layout, figure_json, downsample_periods
+
+def test_figure_json_matches_plotly():
+    df = pd.DataFrame({"period": ["01", "02"], "total_revenue": [10.0, np.nan], "total_count": [1, 300], "label": ["a", None]})
+    layout = dict(title='Príjmy', height=400, xaxis=dict(title="Obdobie", type="category"), yaxis2=dict(title="Objednávky", overlaying='y', side='right'))
+
+    cases = [
+        (go.Bar, "bar", dict(x=df['period'], y=df['total_revenue'], name='Príjmy')),
+        (go.Bar, "bar", dict(x=df['label'], y=df['total_count'], yaxis='y2')),
+        (go.Heatmap, "heatmap", dict(z=np.array([[1.0, 2.0], [np.nan, 4.0]]), x=["Monday", "Tuesday"], colorscale="RdBu_r", colorbar=dict(title="Objednávky"))),
+        (go.Pie, "pie", dict(labels=df['label'], values=df['total_count'], hole=0.5)),
+        (go.Table, "table", dict(header=dict(values=['Obdobie', 'Príjmy']), cells=dict(values=[df['period'], df['total_revenue']]))),
+    ]
+
+    for trace_class, trace_type, properties in cases:
+        expected = json.loads(go.Figure(data=[trace_class(**properties)], layout=go.Layout(**layout)).to_json())
+        actual = json.loads(figure_json([trace(trace_type, **properties)], figure_layout(**layout)))
+        assert actual == expected
+
+def test_downsample_periods_keeps_totals():
+    dates = np.arange(np.datetime64('2024-01-01'), np.datetime64('2024-12-31'))
+    periods = np.datetime_as_string(dates, unit='D').astype(object)
+    values = np.ones(len(periods))
+
+    labels, totals, granularity = downsample_periods(periods, values, "YYYY-MM-DD")
+    assert granularity == "week"
+    assert labels[:2].tolist() == ["2024-01-01", "2024-01-08"]
+    assert totals.sum() == len(periods)
+
+    labels, totals, granularity = downsample_periods(periods, values, "YYYY-MM-DD", max_points=20)
+    assert granularity == "month"
+    assert totals.tolist()[:2] == [31.0, 29.0]
+
+    labels, totals, granularity = downsample_periods(np.array(["01", "02"], dtype=object), [1.0, 2.0], "MM")
+    assert granularity == "month" and labels.tolist() == ["01", "02"]
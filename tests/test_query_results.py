@@ -0,0 +1,42 @@
+import json
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, text
+from query_results import fetch_columns, fetch_row, rows_json, columns_from_json, fill, sort_columns, pivot, pivot_median
+
+def test_fetch_columns_matches_pandas():
+    engine = create_engine("sqlite://")
+    query = text("SELECT 'b' AS label, 2 AS total_count, 1.5 AS total_revenue UNION ALL SELECT NULL, 3, NULL")
+
+    with engine.connect() as conn:
+        columns = fetch_columns(conn, query)
+        expected = pd.read_sql_query(query, conn)
+        assert fetch_row(conn, query) == {"label": "b", "total_count": 2, "total_revenue": 1.5}
+
+    for name in expected.columns:
+        np.testing.assert_array_equal(columns[name], expected[name].to_numpy())
+    assert list(fill(columns["label"], "Neuvedené")) == list(expected["label"].fillna("Neuvedené"))
+
+def test_sort_and_pivot_match_pandas():
+    rows = [["Monday", "Morning", 3, 10.0], ["Sunday", "Night", 1, None], ["Monday", "Night", 2, 5.0]]
+    columns = columns_from_json(rows_json(["day_of_week", "time_of_day", "order_count", "total_revenue"], rows))
+    df = pd.DataFrame(json.loads(rows_json(["day_of_week", "time_of_day", "order_count", "total_revenue"], rows))["data"], columns=list(columns))
+
+    sorted_columns = sort_columns(columns, "total_revenue", ascending=False)
+    expected = df.sort_values("total_revenue", ascending=False, na_position="first")
+    assert list(sorted_columns["day_of_week"]) == list(expected["day_of_week"])
+
+    day_order = ["Monday", "Sunday"]
+    time_order = ["Morning", "Night"]
+    expected = df.pivot(index="time_of_day", columns="day_of_week", values="order_count").reindex(index=time_order, columns=day_order).fillna(0)
+    np.testing.assert_array_equal(pivot(columns, "time_of_day", "day_of_week", "order_count", time_order, day_order), expected.to_numpy())
+
+def test_pivot_median_matches_percentile_cont():
+    rows = [["Morning", "Monday", 3], ["Morning", "Monday", 8], ["Morning", "Monday", 4], ["Night", "Sunday", 2], ["Night", "Sunday", 5]]
+    columns = columns_from_json(rows_json(["time_of_day", "day_of_week", "order_count"], rows))
+    df = pd.DataFrame(rows, columns=["time_of_day", "day_of_week", "order_count"])
+
+    day_order = ["Monday", "Sunday"]
+    time_order = ["Morning", "Night"]
+    expected = df.groupby(["time_of_day", "day_of_week"])["order_count"].median().unstack().reindex(index=time_order, columns=day_order).fillna(0)
+    np.testing.assert_array_equal(pivot_median(columns, "time_of_day", "day_of_week", "order_count", time_order, day_order), expected.to_numpy())
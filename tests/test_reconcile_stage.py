@@ -0,0 +1,30 @@
+from reconcile_stage import parse_select_columns, build_row_hash, build_prod_range_query, build_stage_range_query, MYSQL_HASH_EXPRESSIONS, POSTGRES_HASH_EXPRESSIONS
+
+def test_parse_select_columns():
+    assert parse_select_columns("SELECT id_address, `default`, a.city AS town FROM ps_address a;") == ["id_address", "default", "town"]
+    assert parse_select_columns("SELECT DISTINCT\n    p.id_product,\n    p.price\nFROM ps_product p") == ["id_product", "price"]
+    assert parse_select_columns("DELETE FROM ps_address") == []
+
+def test_row_hash_expressions_match_columns():
+    kinds = {"active": "bool", "date_add": "datetime"}
+
+    mysql_hash = build_row_hash(["id", "active", "date_add"], kinds, MYSQL_HASH_EXPRESSIONS, "`")
+    assert mysql_hash == (
+        "CONCAT_WS('|', COALESCE(CAST(src.`id` AS CHAR), '<null>'), "
+        "COALESCE(CAST((src.`active` <> 0) AS CHAR), '<null>'), "
+        "COALESCE(NULLIF(DATE_FORMAT(src.`date_add`, '%Y-%m-%d %H:%i:%s'), '0000-00-00 00:00:00'), '<null>'))"
+    )
+
+    postgres_hash = build_row_hash(["id", "active"], kinds, POSTGRES_HASH_EXPRESSIONS, '"')
+    assert postgres_hash == "CONCAT_WS('|', COALESCE(CAST(src.\"id\" AS TEXT), '<null>'), COALESCE(CAST(CAST(src.\"active\" AS INTEGER) AS TEXT), '<null>'))"
+
+    assert set(MYSQL_HASH_EXPRESSIONS) == set(POSTGRES_HASH_EXPRESSIONS)
+
+def test_range_queries_bucket_by_key():
+    prod_query = build_prod_range_query("SELECT id_gender, type FROM ps_gender;", "id_gender", "id_gender", ["id_gender", "type"], {})
+    assert "FROM (SELECT id_gender, type FROM ps_gender WHERE id_gender BETWEEN :lo AND :hi) AS src" in prod_query
+    assert "FLOOR((src.`id_gender` - :lo) / :step) AS bucket" in prod_query
+
+    stage_query = build_stage_range_query("sg_gender", "id_gender", ["id_gender", "type"], {})
+    assert 'FROM sg_gender AS src' in stage_query
+    assert 'WHERE src."id_gender" BETWEEN :lo AND :hi' in stage_query
@@ -0,0 +1,40 @@
+import numpy as np
+import sketches
+from sketches import SketchStore, get_sketch_store
+
+def test_sketch_store_merges_ranges(tmp_path, monkeypatch):
+    monkeypatch.setattr(sketches, "SKETCH_DIR", str(tmp_path))
+    monkeypatch.setattr(sketches, "SKETCH_META_PATH", str(tmp_path / "sketches.json"))
+    monkeypatch.setattr(sketches, "CART_HLL_PATH", str(tmp_path / "cart_hll.npy"))
+    monkeypatch.setattr(sketches, "ORDER_VALUE_PATH", str(tmp_path / "order_value_hist.npy"))
+
+    rng = np.random.default_rng(7)
+    cart_days = rng.integers(8767, 9132, 100000)
+    cart_ids = rng.integers(1, 30000, 100000)
+    order_days = rng.integers(8767, 9132, 20000)
+    order_values = rng.lognormal(4, 1, 20000)
+
+    store = SketchStore(None)
+    store.add_carts(cart_days, cart_ids)
+    store.add_order_values(order_days, order_values)
+    store.save()
+
+    store = get_sketch_store()
+    in_range = (cart_days >= 8800) & (cart_days <= 9000)
+    exact_carts = len(np.unique(cart_ids[in_range]))
+    assert abs(store.distinct_carts(8800, 9000) - exact_carts) < exact_carts * 0.05
+
+    in_range = (order_days >= 8800) & (order_days <= 9000)
+    exact_median = np.median(order_values[in_range])
+    assert abs(store.order_value_quantile(8800, 9000, 0.5) - exact_median) < exact_median * 0.05
+
+    assert store.distinct_carts(1, 100) == 0
+    assert store.order_value_quantile(1, 100, 0.5) is None
+
+def test_sketch_store_skips_nulls():
+    store = SketchStore(None)
+    store.add_carts(np.array([8767, 8767]), np.array([5, np.nan]))
+    store.add_order_values(np.array([8767, 8767, 8767]), np.array([10.0, np.nan, 10.0]))
+
+    assert store.distinct_carts(8767, 8767) == 1
+    assert abs(store.order_value_quantile(8767, 8767, 0.5) - 10.0) < 10.0 * 0.05
@@ -0,0 +1,115 @@
+from sqlalchemy import text
+
+
+T_TABLES_CONFIG = {
+    "sg_customer_enriched": {
+        "select": """
+        SELECT
+            c.id_customer AS customerid_bk,
+            c.hashed_login AS hashedemail,
+            gr.name AS defaultgroup,
+            c.birthday,
+            gen.name AS gender,
+            (cc.id_customer IS NOT NULL) AS businessaccount,
+            c.active AS active,
+            c.date_add AS valid_from
+        FROM
+            sg_customer AS c
+        LEFT JOIN (
+            SELECT DISTINCT ON (g.id_group) g.id_group, g.name
+            FROM sg_group g
+            WHERE EXISTS (SELECT 1 FROM sg_customer_group cg WHERE cg.id_group = g.id_group)
+            ORDER BY g.id_group
+        ) gr ON gr.id_group = c.id_default_group
+        LEFT JOIN (
+            SELECT DISTINCT ON (id_gender) id_gender, name
+            FROM sg_gender
+            ORDER BY id_gender
+        ) gen ON gen.id_gender = c.id_gender
+        LEFT JOIN (
+            SELECT DISTINCT id_customer FROM sg_customer_company
+        ) cc ON cc.id_customer = c.id_customer
+        ORDER BY
+            c.id_customer
+        """,
+        "indexes": ["customerid_bk"],
+    },
+    "sg_address_enriched": {
+        "select": """
+        SELECT
+            a.id_address AS addressid_bk,
+            a.id_customer AS customerid_bk,
+            c.name AS country,
+            s.name AS state,
+            a.city,
+            a.postcode AS zipcode,
+            a.date_add AS valid_from
+        FROM
+            sg_address a
+            LEFT JOIN sg_country c ON c.id_country = a.id_country
+            LEFT JOIN sg_state s ON s.id_state = a.id_state
+        ORDER BY
+            a.id_address
+        """,
+        "indexes": ["addressid_bk"],
+    },
+    "sg_product_enriched": {
+        "select": """
+        SELECT
+            p.id_product AS productid_bk,
+            p.id_product_attribute AS productattributeid_bk,
+            p.name AS productname,
+            m.name AS manufacturer,
+            c.name AS defaultcategory,
+            p.group AS market_group,
+            p.subgroup AS market_subgroup,
+            p.gender AS market_gender,
+            p.price,
+            p.active,
+            p.date_add AS valid_from
+        FROM
+            sg_product AS p
+        LEFT JOIN
+            sg_manufacturer m ON p.id_manufacturer = m.id_manufacturer
+        LEFT JOIN
+            sg_category c ON p.id_category_default = c.id_category
+        ORDER BY
+            p.id_product
+        """,
+        "indexes": ["productid_bk", "productattributeid_bk"],
+    },
+}
+
+def transform_table(self, stage_engine, table_name, config):
+    if self is not None and self.is_aborted():
+        print("Úloha zrušená")
+        return
+
+    print(f"Vytváranie tabuľky {table_name}...")
+
+    with stage_engine.begin() as conn:
+        conn.execute(text("SET LOCAL enable_nestloop = off;"))
+        conn.execute(text(f"DROP TABLE IF EXISTS {table_name};"))
+        conn.execute(text(f"CREATE TABLE {table_name} AS {config['select']};"))
+        for column in config.get("indexes", []):
+            conn.execute(text(f"CREATE INDEX {table_name}_{column}_idx ON {table_name} ({column});"))
+
+    with stage_engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text(f"ANALYZE {table_name};"))
+
+    print(f"Tabuľka {table_name} bola vytvorená.")
+
+def transform_stage_tables(self, stage_engine):
+    tables_processed = 0
+    for table_name, config in T_TABLES_CONFIG.items():
+        if self is not None and self.is_aborted():
+            print("Úloha zrušená")
+            break
+        transform_table(self, stage_engine, table_name, config)
+        tables_processed += 1
+
+    return tables_processed
+
+def missing_stage_tables(stage_engine):
+    with stage_engine.connect() as conn:
+        return [table_name for table_name in T_TABLES_CONFIG if conn.execute(text("SELECT to_regclass(:table_name)"), {"table_name": table_name}).scalar() is None]